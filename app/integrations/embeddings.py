@@ -0,0 +1,663 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Final,
+    Hashable,
+    Iterator,
+    Literal,
+    Protocol,
+    Sequence,
+    TypeVar,
+)
+
+import numpy as np
+
+from app.integrations.openai import get_single_flight
+
+if TYPE_CHECKING:  # pragma: no cover - typing helper
+    from openai import AsyncOpenAI as OpenAIClient  # type: ignore[import]
+else:
+    OpenAIClient = Any  # type: ignore[misc]
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_CACHE_PATH: Final[Path] = (
+    Path(__file__).parent.parent.parent / "data" / "cache" / "embeddings.sqlite3"
+)
+DEFAULT_MAX_ENTRIES: Final[int] = 20000
+DEFAULT_BATCH_WINDOW_MS: Final[float] = 5.0
+DEFAULT_BATCH_MAX_INPUTS: Final[int] = 256
+
+_WHITESPACE = re.compile(r"\s+")
+# Byte order of base64-encoded embeddings returned by the API.
+_WIRE_DTYPE: Final[np.dtype] = np.dtype("<f4")
+
+# Per-request memo of message embeddings keyed by (model, text hash). Several
+# pipeline stages embed the same user message; within one request scope they
+# share a single upstream call per model.
+_MESSAGE_EMBEDDINGS: ContextVar[
+    dict[tuple[str, str], asyncio.Future[np.ndarray]] | None
+] = ContextVar("message_embeddings", default=None)
+
+
+def start_message_embedding_scope() -> None:
+    """Starts a fresh per-request memo used by `embed_message`."""
+    _MESSAGE_EMBEDDINGS.set({})
+
+
+def normalize_embedding_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def embedding_text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_embedding_text(text).encode("utf-8")).hexdigest()
+
+
+def decode_embedding(data: str | Sequence[float]) -> np.ndarray:
+    """
+    Vector from an embeddings API item: a base64 string of little-endian
+    float32 values, or a float list (`encoding_format="float"`).
+    """
+    if isinstance(data, str):
+        return np.frombuffer(base64.b64decode(data), dtype=_WIRE_DTYPE)
+    return np.asarray(data, dtype=np.float32)
+
+
+class SqliteEmbeddingCache:
+    """
+    Persistent embedding store keyed by (model, normalized text hash).
+
+    Vectors are kept as little-endian float32 blobs in a local SQLite file, so
+    they survive restarts. The table is bounded by `max_entries`; the least
+    recently used rows are evicted first.
+
+    Async code uses `aget_many` / `aput_many`, which run the SQLite I/O on one
+    dedicated thread instead of the event loop. Reads only note which rows
+    were used; the `last_used` updates are written in batches (with the next
+    write, before eviction, or every `_TOUCH_BATCH` hits). The row count is
+    tracked in memory, so a write does not count the table.
+    """
+
+    _TOUCH_BATCH = 256
+
+    def __init__(self, path: str | Path, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self._path = Path(path)
+        self._max_entries = max_entries
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="embedding-cache")
+        self._connection = sqlite3.connect(
+            str(self._path), check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        row = self._connection.execute(
+            "SELECT COALESCE(MAX(last_used), 0), COUNT(*) FROM embeddings"
+        ).fetchone()
+        self._clock = int(row[0])
+        self._count = int(row[1])
+        # (model, text hash) -> clock of the last read, not yet written.
+        self._touched: dict[tuple[str, str], int] = {}
+
+    async def aget_many(
+        self, model: str, texts: Sequence[str]
+    ) -> dict[str, np.ndarray]:
+        return await self._run(self.get_many, model, texts)
+
+    async def aput_many(
+        self, model: str, items: Sequence[tuple[str, Sequence[float]]]
+    ) -> None:
+        await self._run(self.put_many, model, items)
+
+    async def aflush(self) -> None:
+        await self._run(self.flush)
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args)
+
+    def get_many(
+        self, model: str, texts: Sequence[str]
+    ) -> dict[str, np.ndarray]:
+        """Returns cached vectors keyed by text hash; misses are omitted."""
+        hashes = list({embedding_text_hash(text) for text in texts})
+        if not hashes:
+            return {}
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for chunk in _chunks(hashes):
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self._connection.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *chunk),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(
+                        blob, dtype="<f4").astype(np.float32, copy=False)
+            if found:
+                self._clock += 1
+                for text_hash in found:
+                    self._touched[(model, text_hash)] = self._clock
+                if len(self._touched) >= self._TOUCH_BATCH:
+                    with self._transaction():
+                        self._write_touches()
+        return found
+
+    def put_many(
+        self, model: str, items: Sequence[tuple[str, Sequence[float]]]
+    ) -> None:
+        if not items:
+            return
+        rows = {
+            embedding_text_hash(text): np.asarray(vector, dtype="<f4").tobytes()
+            for text, vector in items
+        }
+        with self._lock, self._transaction():
+            existing = 0
+            for chunk in _chunks(list(rows)):
+                placeholders = ",".join("?" for _ in chunk)
+                (found,) = self._connection.execute(
+                    "SELECT COUNT(*) FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *chunk),
+                ).fetchone()
+                existing += int(found)
+            self._clock += 1
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (model, text_hash, blob, self._clock)
+                    for text_hash, blob in rows.items()
+                ],
+            )
+            self._count += len(rows) - existing
+            self._write_touches()
+            self._evict()
+
+    def flush(self) -> None:
+        """Writes the pending `last_used` updates."""
+        with self._lock, self._transaction():
+            self._write_touches()
+
+    def _write_touches(self) -> None:
+        if not self._touched:
+            return
+        self._connection.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [
+                (clock, model, text_hash)
+                for (model, text_hash), clock in self._touched.items()
+            ],
+        )
+        self._touched.clear()
+
+    def _evict(self) -> None:
+        overflow = self._count - self._max_entries
+        if overflow > 0:
+            cursor = self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self._count -= max(cursor.rowcount, 0)
+            logger.info(
+                "Evicted %d least recently used embeddings from cache.", overflow)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # One commit per batch instead of one per statement (autocommit mode).
+        self._connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._connection.close()
+        self._executor.shutdown(wait=False)
+
+
+def _chunks(values: Sequence[str], size: int = 500) -> Iterator[Sequence[str]]:
+    # Stays below SQLite's limit on bound parameters.
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> SqliteEmbeddingCache | None:
+    """
+    Process-wide embedding cache configured by `EMBEDDING_CACHE_PATH` and
+    `EMBEDDING_CACHE_MAX_ENTRIES` (0 disables the cache).
+    """
+    max_entries = int(
+        os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))
+        or DEFAULT_MAX_ENTRIES
+    )
+    if max_entries <= 0:
+        return None
+    path = os.getenv("EMBEDDING_CACHE_PATH") or DEFAULT_CACHE_PATH
+    try:
+        return SqliteEmbeddingCache(path, max_entries=max_entries)
+    except (OSError, sqlite3.Error) as exc:
+        logger.warning(
+            "Embedding cache disabled, cannot open %s: %s", path, exc)
+        return None
+
+
+class _PendingBatch:
+    __slots__ = ("client", "model", "dimensions", "texts", "waiters", "timer")
+
+    def __init__(
+        self, client: OpenAIClient, model: str, dimensions: int | None
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.texts: dict[str, int] = {}
+        self.waiters: list[tuple[list[int], asyncio.Future[list[np.ndarray]]]] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class EmbeddingBatcher:
+    """
+    Merges embedding lookups issued by concurrent requests within a short
+    window into one `embeddings.create` call per (client, model, dimensions),
+    then hands
+    each caller its own vectors. Identical texts are sent once.
+    """
+
+    def __init__(
+        self,
+        window_ms: float = DEFAULT_BATCH_WINDOW_MS,
+        max_inputs: int = DEFAULT_BATCH_MAX_INPUTS,
+    ) -> None:
+        self._window = max(window_ms, 0.0) / 1000.0
+        self._max_inputs = max(max_inputs, 1)
+        self._pending: dict[tuple[int, int, str, int | None], _PendingBatch] = {}
+        # Strong references to in-flight sends (the loop keeps only weak ones).
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._batches = 0
+        self._inputs = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"batches": self._batches, "inputs": self._inputs}
+
+    async def embed(
+        self,
+        client: OpenAIClient,
+        model: str,
+        texts: Sequence[str],
+        dimensions: int | None = None,
+    ) -> list[np.ndarray]:
+        if not texts:
+            return []
+        if self._window <= 0:
+            return await self._create(client, model, dimensions, list(texts))
+
+        loop = asyncio.get_running_loop()
+        key = (id(loop), id(client), model, dimensions)
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.texts) + len(texts) > self._max_inputs:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = _PendingBatch(client, model, dimensions)
+            self._pending[key] = batch
+            batch.timer = loop.call_later(self._window, self._flush, key)
+
+        positions = [batch.texts.setdefault(text, len(batch.texts)) for text in texts]
+        future: asyncio.Future[list[np.ndarray]] = loop.create_future()
+        batch.waiters.append((positions, future))
+        if len(batch.texts) >= self._max_inputs:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: tuple[int, int, str, int | None]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self, timeout: float = 10.0) -> None:
+        """
+        Sends the batches still collecting inputs and waits up to `timeout`
+        seconds for in-flight ones before cancelling them; called on shutdown
+        before the OpenAI client is closed.
+        """
+        loop_id = id(asyncio.get_running_loop())
+        for key in [key for key in self._pending if key[0] == loop_id]:
+            self._flush(key)
+        tasks = [task for task in self._tasks if id(task.get_loop()) == loop_id]
+        if not tasks:
+            return
+        _, still_running = await asyncio.wait(tasks, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            logger.warning(
+                "Cancelled %d embedding batches still in flight at shutdown.",
+                len(still_running),
+            )
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+    async def _send(self, batch: _PendingBatch) -> None:
+        try:
+            vectors = await self._create(
+                batch.client, batch.model, batch.dimensions, list(batch.texts))
+            results = [
+                (future, [vectors[index] for index in positions])
+                for positions, future in batch.waiters
+            ]
+        except BaseException as exc:
+            # Every waiter must be resolved, or its request hangs.
+            for _, future in batch.waiters:
+                if future.done():
+                    continue
+                if isinstance(exc, Exception):
+                    future.set_exception(exc)
+                else:
+                    future.cancel()
+            if not isinstance(exc, Exception):
+                raise
+            return
+        for future, vectors_of_waiter in results:
+            if not future.done():
+                future.set_result(vectors_of_waiter)
+
+    async def _create(
+        self,
+        client: OpenAIClient,
+        model: str,
+        dimensions: int | None,
+        texts: list[str],
+    ) -> list[np.ndarray]:
+        self._batches += 1
+        self._inputs += len(texts)
+        # base64 skips both the JSON float list and the SDK's `.tolist()`; the
+        # payload is little-endian float32, decoded straight into the matrix.
+        if dimensions:
+            response = await client.embeddings.create(
+                model=model, input=texts, dimensions=dimensions,
+                encoding_format="base64")
+        else:
+            response = await client.embeddings.create(
+                model=model, input=texts, encoding_format="base64")
+        data = list(response.data)
+        if len(data) != len(texts):
+            raise RuntimeError(
+                f"Embeddings API returned {len(data)} vectors for {len(texts)} inputs."
+            )
+        matrix: np.ndarray | None = None
+        filled = np.zeros(len(texts), dtype=bool)
+        for item in data:
+            if not 0 <= item.index < len(texts):
+                raise RuntimeError(
+                    f"Embeddings API returned an unknown input index {item.index}.")
+            vector = decode_embedding(item.embedding)
+            if matrix is None:
+                matrix = np.empty((len(texts), len(vector)), dtype=np.float32)
+            matrix[item.index] = vector
+            filled[item.index] = True
+        if matrix is None:
+            return []
+        if not filled.all():
+            # Duplicated indices: some rows would stay uninitialised.
+            raise RuntimeError(
+                f"Embeddings API returned no vector for {int((~filled).sum())} inputs.")
+        # Rows are shared between callers (and request memos), keep them read-only.
+        matrix.setflags(write=False)
+        return list(matrix)
+
+
+@lru_cache(maxsize=1)
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """
+    Process-wide batcher configured by `EMBEDDING_BATCH_WINDOW_MS` (0 sends
+    every lookup immediately) and `EMBEDDING_BATCH_MAX_INPUTS`.
+    """
+    return EmbeddingBatcher(
+        window_ms=float(
+            os.getenv("EMBEDDING_BATCH_WINDOW_MS", str(DEFAULT_BATCH_WINDOW_MS))
+            or DEFAULT_BATCH_WINDOW_MS
+        ),
+        max_inputs=int(
+            os.getenv("EMBEDDING_BATCH_MAX_INPUTS", str(DEFAULT_BATCH_MAX_INPUTS))
+            or DEFAULT_BATCH_MAX_INPUTS
+        ),
+    )
+
+
+class EmbeddingProvider(Protocol):
+    """
+    Source of text embeddings used by the classifiers, the intent detector,
+    the persona pipeline and the open-answer trait scoring.
+
+    `model_tag` identifies the vector space; vectors with different tags must
+    never be compared. `is_local` providers compute vectors in-process, so
+    their vectors are never stored in or loaded from the database.
+    `similarity_scale` rescales similarity thresholds tuned for OpenAI
+    embeddings to the provider's typical cosine range.
+    """
+
+    is_local: bool
+    similarity_scale: float
+
+    @property
+    def model(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def dimensions(self) -> int | None:
+        raise NotImplementedError
+
+    @property
+    def model_tag(self) -> str:
+        raise NotImplementedError
+
+    async def embed(self, texts: Sequence[str]) -> list[np.ndarray]:
+        raise NotImplementedError
+
+    async def embed_message(self, text: str) -> np.ndarray:
+        raise NotImplementedError
+
+
+EmbeddingProviderName = Literal["openai", "local"]
+
+
+@lru_cache(maxsize=1)
+def get_embedding_provider_name() -> EmbeddingProviderName:
+    """
+    Process-wide embedding backend from `EMBEDDING_PROVIDER`: `openai`
+    (default) or `local` (hashed character n-grams, no network).
+    """
+    name = (os.getenv("EMBEDDING_PROVIDER") or "openai").strip().lower()
+    if name not in ("openai", "local"):
+        logger.warning("Unknown EMBEDDING_PROVIDER '%s', using openai.", name)
+        name = "openai"
+    return name  # type: ignore[return-value]
+
+
+def create_embedding_provider(
+    client: OpenAIClient,
+    model: str,
+    *,
+    dimensions: int | None = None,
+) -> EmbeddingProvider:
+    """
+    Builds the configured provider. The whole process uses one backend:
+    stored vectors, definitions and queries must live in the same space, so
+    there is no per-request fallback between providers.
+    """
+    if get_embedding_provider_name() == "local":
+        from app.integrations.local_embeddings import (
+            DEFAULT_LOCAL_DIMENSIONS,
+            HashingEmbeddings,
+        )
+
+        return HashingEmbeddings(
+            dimensions=int(
+                os.getenv("LOCAL_EMBEDDING_DIMENSIONS", str(DEFAULT_LOCAL_DIMENSIONS))
+                or DEFAULT_LOCAL_DIMENSIONS
+            )
+        )
+    return CachedOpenAIEmbeddings(
+        client, model, get_embedding_cache(), dimensions=dimensions)
+
+
+class CachedOpenAIEmbeddings(EmbeddingProvider):
+    """
+    Embeds texts with the OpenAI API, serving previously embedded texts from
+    the persistent cache. Cache misses go through the shared batcher.
+    """
+
+    is_local = False
+    similarity_scale = 1.0
+
+    def __init__(
+        self,
+        client: OpenAIClient,
+        model: str,
+        cache: SqliteEmbeddingCache | None = None,
+        batcher: EmbeddingBatcher | None = None,
+        *,
+        dimensions: int | None = None,
+    ) -> None:
+        self._client = client
+        self._model = model
+        self._dimensions = dimensions
+        # Vectors of one model at different sizes must never be mixed up.
+        self._cache_key = f"{model}@{dimensions}" if dimensions else model
+        self._cache = cache
+        self._batcher = batcher or get_embedding_batcher()
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    @property
+    def dimensions(self) -> int | None:
+        return self._dimensions
+
+    @property
+    def model_tag(self) -> str:
+        """Model name, with `@dimensions` when reduced; tags stored vectors."""
+        return self._cache_key
+
+    async def embed(self, texts: Sequence[str]) -> list[np.ndarray]:
+        if not texts:
+            return []
+        hashes = [embedding_text_hash(text) for text in texts]
+        cached: dict[str, np.ndarray] = {}
+        if self._cache is not None:
+            try:
+                cached = await self._cache.aget_many(self._cache_key, texts)
+            except sqlite3.Error as exc:  # pragma: no cover - disk guard
+                logger.warning("Failed to read embedding cache: %s", exc)
+
+        missing: dict[str, str] = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+        if missing:
+            # Texts already being embedded for another request are awaited,
+            # not requested again.
+            keys = [("embeddings", self._cache_key, text_hash) for text_hash in missing]
+            fresh = await get_single_flight().run_many(keys, self._fetch(missing))
+            for text_hash, vector in zip(missing, fresh):
+                cached[text_hash] = vector
+        return [cached[text_hash] for text_hash in hashes]
+
+    def _fetch(
+        self, texts: dict[str, str]
+    ) -> Callable[[Sequence[Hashable]], Awaitable[list[np.ndarray]]]:
+        async def fetch(keys: Sequence[Hashable]) -> list[np.ndarray]:
+            pending = [texts[key[2]] for key in keys]  # type: ignore[index]
+            fresh = await self._batcher.embed(
+                self._client, self._model, pending, self._dimensions
+            )
+            if self._cache is not None:
+                try:
+                    await self._cache.aput_many(
+                        self._cache_key, list(zip(pending, fresh)))
+                except sqlite3.Error as exc:  # pragma: no cover - disk guard
+                    logger.warning("Failed to persist embeddings: %s", exc)
+            return fresh
+
+        return fetch
+
+    async def embed_message(self, text: str) -> np.ndarray:
+        """
+        Embeds a single user message, reusing the vector already computed for
+        the same text and model within the current request scope.
+        """
+        memo = _MESSAGE_EMBEDDINGS.get()
+        if memo is None:
+            return (await self.embed([text]))[0]
+        key = (self._cache_key, embedding_text_hash(text))
+        future = memo.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            memo[key] = future
+            try:
+                future.set_result((await self.embed([text]))[0])
+            except BaseException:
+                # Failed lookups are not memoized; waiting stages retry.
+                memo.pop(key, None)
+                future.cancel()
+                raise
+            return future.result()
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return await self.embed_message(text)
+            raise
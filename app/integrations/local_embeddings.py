@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import zlib
+from collections import Counter
+from typing import Final, Sequence
+
+import numpy as np
+
+from app.integrations.embeddings import EmbeddingProvider, normalize_embedding_text
+
+DEFAULT_LOCAL_DIMENSIONS: Final[int] = 1024
+# Above this many texts `embed` hashes in a worker thread instead of the loop.
+_THREAD_THRESHOLD: Final[int] = 64
+_SIGN_BIT: Final[int] = 0x80000000
+
+
+class HashingEmbeddings(EmbeddingProvider):
+    """
+    CPU-only embedding provider: character n-grams (default 3-5, which copes
+    with Polish inflection) and whole words of the normalized, lowercased text
+    are hashed into `dimensions` signed buckets with sublinear term
+    frequency. Signed feature hashing is a sparse random projection of the
+    n-gram counts, so no vocabulary or model file is needed.
+
+    Vectors capture surface similarity only; they are a zero-network
+    stand-in for benchmarks and CI and a fast degraded mode, not a semantic
+    equivalent of the OpenAI models.
+    """
+
+    is_local = True
+    # Related texts share fewer hashed n-grams than they share meaning for an
+    # OpenAI model, so cosine scores run roughly 2.5x lower.
+    similarity_scale = 0.4
+
+    def __init__(
+        self,
+        dimensions: int = DEFAULT_LOCAL_DIMENSIONS,
+        ngram_range: tuple[int, int] = (3, 5),
+    ) -> None:
+        if dimensions <= 0:
+            raise ValueError("dimensions must be positive.")
+        self._dimensions = dimensions
+        self._ngram_range = ngram_range
+
+    @property
+    def model(self) -> str:
+        return "local-hash"
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    @property
+    def model_tag(self) -> str:
+        low, high = self._ngram_range
+        return f"local-hash-{low}-{high}@{self._dimensions}"
+
+    async def embed(self, texts: Sequence[str]) -> list[np.ndarray]:
+        if len(texts) > _THREAD_THRESHOLD:
+            return await asyncio.to_thread(self._embed_all, list(texts))
+        return self._embed_all(texts)
+
+    async def embed_message(self, text: str) -> np.ndarray:
+        return self._vector(text)
+
+    def _embed_all(self, texts: Sequence[str]) -> list[np.ndarray]:
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> np.ndarray:
+        normalized = normalize_embedding_text(text).lower()
+        features: Counter[str] = Counter(
+            f"w:{word}" for word in normalized.split())
+        padded = f" {normalized} "
+        low, high = self._ngram_range
+        for size in range(low, high + 1):
+            for start in range(len(padded) - size + 1):
+                features[padded[start:start + size]] += 1
+
+        vector = np.zeros(self._dimensions, dtype=np.float32)
+        for feature, count in features.items():
+            # crc32 is stable across processes, unlike the salted built-in hash.
+            code = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if code & _SIGN_BIT else -1.0
+            vector[(code & ~_SIGN_BIT) % self._dimensions] += sign * (
+                1.0 + math.log(count))
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        vector.setflags(write=False)
+        return vector
@@ -1,15 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import logging
 import os
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Final, cast
+from typing import Any, Awaitable, Callable, Final, Hashable, Sequence, TypeVar, cast
 
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from openai.types.shared.reasoning_effort import ReasoningEffort
 
+try:  # pragma: no cover - optional dependency hint
+    import h2  # type: ignore[import]  # noqa: F401
+except ImportError:
+    _HTTP2_AVAILABLE = False
+else:
+    _HTTP2_AVAILABLE = True
+
 DEFAULT_MODEL: Final[str] = "text-embedding-3-small"
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
 
 @dataclass(frozen=True)
 class OpenAISettings:
@@ -17,6 +33,12 @@ class OpenAISettings:
     organization: str | None = None
     project: str | None = None
     embeddings_model: str = DEFAULT_MODEL
+    # Reduced output size for text-embedding-3-* models (None = model default).
+    embeddings_dimensions: int | None = None
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 60.0
+    http2: bool = False
 
     @classmethod
     def from_env(cls) -> "OpenAISettings":
@@ -29,12 +51,23 @@ class OpenAISettings:
         project = os.getenv("OPENAI_PROJECT")
         embeddings_model = os.getenv(
             "OPENAI_EMBEDDINGS_MODEL") or DEFAULT_MODEL
+        embeddings_dimensions = int(
+            os.getenv("OPENAI_EMBEDDINGS_DIMENSIONS", "0") or 0)
 
         return cls(
             api_key=api_key,
             organization=organization,
             project=project,
             embeddings_model=embeddings_model,
+            embeddings_dimensions=embeddings_dimensions or None,
+            http_max_connections=int(
+                os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "20") or 20),
+            http_max_keepalive_connections=int(
+                os.getenv("OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10") or 10),
+            http_keepalive_expiry=float(
+                os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "60") or 60),
+            http2=(os.getenv("OPENAI_HTTP2", "").lower()
+                   in ("1", "true", "yes")),
         )
 
 
@@ -56,14 +89,192 @@ def get_reasoning_effort() -> ReasoningEffort | None:
     return cast(ReasoningEffort, reasoning_effort_str)
 
 
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_openai_http_client(settings: OpenAISettings | None = None) -> httpx.AsyncClient:
+    """
+    Returns the process-wide HTTP transport shared by every OpenAI client.
+
+    All components (response generator, classifiers, test scoring, persona
+    narratives) borrow the same keep-alive connection pool, so concurrent
+    requests reuse warm TLS connections instead of opening their own.
+    """
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        return _http_client
+    settings = settings or get_openai_settings()
+    http2 = settings.http2 and _HTTP2_AVAILABLE
+    if settings.http2 and not _HTTP2_AVAILABLE:
+        logger.warning(
+            "OPENAI_HTTP2 is enabled but the `h2` package is not installed; "
+            "falling back to HTTP/1.1. Install it with `pip install h2`."
+        )
+    # Timeout: 10s connect, 60s read
+    timeout = httpx.Timeout(10.0, read=60.0, write=10.0,
+                            connect=10.0, pool=10.0)
+    _http_client = DefaultAsyncHttpxClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        http2=http2,
+    )
+    return _http_client
+
+
+async def close_openai_http_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
 def create_async_openai_client(settings: OpenAISettings | None = None) -> AsyncOpenAI:
     settings = settings or get_openai_settings()
-    # Timeout: 10s connect, 60s read, 600s total
-    from httpx import Timeout
-    timeout = Timeout(10.0, read=60.0, write=10.0, connect=10.0, pool=10.0)
+    # Clients are cheap wrappers; the connection pool lives in the shared
+    # transport, which must not be closed by individual components.
     return AsyncOpenAI(
         api_key=settings.api_key,
         organization=settings.organization,
         project=settings.project,
-        timeout=timeout,
+        http_client=get_openai_http_client(settings),
     )
+
+
+def payload_hash(payload: Any) -> str:
+    """Stable hash of a JSON-like request payload (key order does not matter)."""
+    serialized = json.dumps(
+        payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def _consume_exception(future: asyncio.Future[Any]) -> None:
+    # A leader may fail with nobody attached; do not log "never retrieved".
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical upstream calls: the first caller for a key
+    performs the call, callers arriving while it is in flight attach to the
+    same future and get the same result (or exception). Nothing is kept
+    once the call finishes, so this deduplicates bursts and is not a cache.
+
+    If the leading caller is cancelled (e.g. its client disconnected), the
+    attached callers retry instead of failing with it.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self._enabled = enabled
+        self._inflight: dict[tuple[int, Hashable], asyncio.Future[Any]] = {}
+        self._calls = 0
+        self._shared = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "calls": self._calls,
+            "shared": self._shared,
+            "in_flight": len(self._inflight),
+        }
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        async def call_one(_: Sequence[Hashable]) -> list[T]:
+            return [await call()]
+
+        return (await self.run_many([key], call_one))[0]
+
+    async def run_many(
+        self,
+        keys: Sequence[Hashable],
+        call: Callable[[Sequence[Hashable]], Awaitable[Sequence[T]]],
+    ) -> list[T]:
+        """
+        Resolves every key, calling `call` once with the keys that nobody is
+        fetching yet; it must return one value per key, in order.
+        """
+        if not self._enabled:
+            self._calls += 1
+            return list(await call(keys))
+
+        loop = asyncio.get_running_loop()
+        futures: list[asyncio.Future[Any]] = []
+        owned: dict[Hashable, asyncio.Future[Any]] = {}
+        for key in keys:
+            slot = (id(loop), key)
+            future = self._inflight.get(slot)
+            if future is None:
+                future = loop.create_future()
+                future.add_done_callback(_consume_exception)
+                self._inflight[slot] = future
+                owned[key] = future
+            elif key not in owned:
+                self._shared += 1
+            futures.append(future)
+
+        if owned:
+            self._calls += 1
+            try:
+                values = list(await call(list(owned)))
+                if len(values) != len(owned):
+                    raise RuntimeError(
+                        f"Single-flight call returned {len(values)} values "
+                        f"for {len(owned)} keys."
+                    )
+            except BaseException as exc:
+                # Attached callers wait on these futures; none may stay pending.
+                for future in owned.values():
+                    if future.done():
+                        continue
+                    if isinstance(exc, Exception):
+                        future.set_exception(exc)
+                    else:
+                        future.cancel()
+                raise
+            else:
+                for future, value in zip(owned.values(), values):
+                    future.set_result(value)
+            finally:
+                for key in owned:
+                    self._inflight.pop((id(loop), key), None)
+
+        results: list[T] = []
+        for key, future in zip(keys, futures):
+            if future.done() and not future.cancelled():
+                results.append(future.result())
+                continue
+            try:
+                results.append(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled; fetch this key again.
+                results.append((await self.run_many([key], call))[0])
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_single_flight() -> SingleFlight:
+    """
+    Process-wide single-flight registry for OpenAI calls; `OPENAI_SINGLE_FLIGHT`
+    set to `false` sends every call upstream.
+    """
+    enabled = (os.getenv("OPENAI_SINGLE_FLIGHT", "true").lower()
+               not in ("0", "false", "no"))
+    return SingleFlight(enabled=enabled)
+
+
+async def create_chat_completion(client: AsyncOpenAI, **kwargs: Any) -> Any:
+    """
+    `client.chat.completions.create(**kwargs)`, with concurrent requests for
+    an identical payload (model, messages, options) sharing one upstream call.
+    """
+    if kwargs.get("stream"):
+        return await client.chat.completions.create(**kwargs)
+    key = ("chat.completions", payload_hash(kwargs))
+    return await get_single_flight().run(
+        key, lambda: client.chat.completions.create(**kwargs))
@@ -5,6 +5,8 @@ from dataclasses import dataclass
 from functools import lru_cache
 from typing import TYPE_CHECKING, Any, Final, cast
 
+import httpx
+
 if TYPE_CHECKING:  # pragma: no cover - typing helpers
     # type: ignore[import]
     from supabase.client import AsyncClient as AsyncClientProtocol
@@ -32,6 +34,9 @@ _CLIENT_INFO_HEADER: Final[dict[str, str]] = {
 class SupabaseSettings:
     url: str
     service_role_key: str
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 60.0
 
     @classmethod
     def from_env(cls) -> "SupabaseSettings":
@@ -53,6 +58,12 @@ class SupabaseSettings:
         return cls(
             url=cast(str, url),
             service_role_key=cast(str, service_role_key),
+            http_max_connections=int(
+                os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20") or 20),
+            http_max_keepalive_connections=int(
+                os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10") or 10),
+            http_keepalive_expiry=float(
+                os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "60") or 60),
         )
 
 
@@ -63,6 +74,7 @@ def get_supabase_settings() -> SupabaseSettings:
 
 def create_supabase_async_client(
     settings: SupabaseSettings | None = None,
+    http_client: httpx.AsyncClient | None = None,
 ) -> AsyncClientProtocol:
     if RuntimeAsyncClient is None or AsyncClientOptions is None:
         raise RuntimeError(
@@ -75,6 +87,7 @@ def create_supabase_async_client(
         headers=_CLIENT_INFO_HEADER,
         auto_refresh_token=False,
         persist_session=False,
+        httpx_client=http_client,
     )
     client = RuntimeAsyncClient(
         supabase_url=settings.url,
@@ -82,3 +95,72 @@ def create_supabase_async_client(
         options=options,
     )
     return cast(AsyncClientProtocol, client)
+
+
+_client: AsyncClientProtocol | None = None
+_http_client: httpx.AsyncClient | None = None
+_request_count = 0
+
+
+def get_supabase_async_client() -> AsyncClientProtocol:
+    """
+    Returns the process-wide Supabase client.
+
+    Every repository shares it, together with one keep-alive HTTP pool, so
+    simple reads reuse warm connections instead of paying for a new client,
+    TCP and TLS setup on each request.
+    """
+    global _client, _http_client
+    if _client is not None:
+        return _client
+    settings = get_supabase_settings()
+    _http_client = _create_pooled_http_client(settings)
+    _client = create_supabase_async_client(settings, http_client=_http_client)
+    return _client
+
+
+def _create_pooled_http_client(settings: SupabaseSettings) -> httpx.AsyncClient:
+    async def count_request(request: httpx.Request) -> None:
+        global _request_count
+        _request_count += 1
+
+    auth_headers = {
+        "apikey": settings.service_role_key,
+        "Authorization": f"Bearer {settings.service_role_key}",
+    }
+    return httpx.AsyncClient(
+        base_url=f"{settings.url.rstrip('/')}/rest/v1",
+        headers={**_CLIENT_INFO_HEADER, **auth_headers},
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        follow_redirects=True,
+        event_hooks={"request": [count_request]},
+    )
+
+
+def get_supabase_pool_stats() -> dict[str, int]:
+    """Connection pool counters of the shared Supabase client."""
+    if _http_client is None or _http_client.is_closed:
+        return {"requests": _request_count, "connections": 0, "idle_connections": 0}
+    # httpx does not expose its pool publicly; the transport's httpcore pool
+    # does, so read it defensively.
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", ()) or ())
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "requests": _request_count,
+        "connections": len(connections),
+        "idle_connections": idle,
+    }
+
+
+async def close_supabase_async_client() -> None:
+    global _client, _http_client
+    _client = None
+    http_client, _http_client = _http_client, None
+    if http_client is not None and not http_client.is_closed:
+        await http_client.aclose()
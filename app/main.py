@@ -1,7 +1,12 @@
+import asyncio
+import contextlib
 import logging
 import re
+import signal
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -13,13 +18,57 @@ from app.routers.advice import router as advice_router
 from app.routers.tests import router as tests_router
 from app.routers.personas import router as personas_router
 from app.routers.career_adviser import router as career_adviser_router
+from app.services.registry import ServiceRegistry, rebuild_service_registry
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One registry per process: pipelines, clients and their caches are shared
+    # by all requests and closed on shutdown.
+    services = ServiceRegistry()
+    app.state.services = services
+    # Warm-up runs in the background so /health answers immediately, while
+    # /ready keeps the machine out of rotation until the caches are filled.
+    warm_up_task = asyncio.create_task(services.warm_up())
+    # SIGHUP (`kill -HUP <uvicorn pid>`) rebuilds all services after a
+    # catalog import or a new definition embeddings artifact, without a
+    # restart (environment variables are only read again by a restart).
+    rebuild_task: asyncio.Task[None] | None = None
+
+    def schedule_rebuild() -> None:
+        nonlocal rebuild_task
+        if rebuild_task is not None and not rebuild_task.done():
+            logger.info("Service rebuild already running.")
+            return
+        rebuild_task = asyncio.create_task(rebuild_service_registry(app))
+
+    loop = asyncio.get_running_loop()
+    with contextlib.suppress(NotImplementedError, AttributeError, RuntimeError):
+        loop.add_signal_handler(signal.SIGHUP, schedule_rebuild)
+    try:
+        yield
+    finally:
+        with contextlib.suppress(NotImplementedError, AttributeError, RuntimeError):
+            loop.remove_signal_handler(signal.SIGHUP)
+        if rebuild_task is not None:
+            rebuild_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await rebuild_task
+        warm_up_task.cancel()
+        # Warm-up may be inside an OpenAI/Supabase call; let it unwind before
+        # the clients are closed.
+        with contextlib.suppress(asyncio.CancelledError):
+            await warm_up_task
+        await app.state.services.aclose()
+
 
-app = FastAPI(title="Advice API")
+app = FastAPI(title="Advice API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,9 +91,19 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 @app.get("/")
 def root():
     return FileResponse("static/index.html")
-@app.get("/health")
-def health_check():
-    """Health check endpoint for Fly.io and load balancers."""
+
+
 @app.get("/health")
 def health():
+    """Liveness check: the process is up."""
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness check for Fly.io: 503 until the startup warm-up has finished."""
+    services: ServiceRegistry = app.state.services
+    return JSONResponse(
+        status_code=200 if services.is_ready else 503,
+        content=services.readiness(),
+    )
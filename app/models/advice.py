@@ -43,6 +43,9 @@ class Advice:
     - `llm_description` is used by LLM for understanding what this is ("what").
     - `id` is the database identifier when loaded from Supabase; in-memory items
       can safely leave it as `None`.
+    - `embedding_model` / `embedding_text_hash` tag the stored embedding with the
+      model and the hash of the text it was computed from, so stale vectors
+      (edited advice, changed model) can be detected without comparing vectors.
     """
     name: str
     kind: AdviceKind
@@ -54,6 +57,8 @@ class Advice:
     categories: Sequence[str] = ()
     embedding: Sequence[float] | None = None
     id: Optional[int] = None
+    embedding_model: Optional[str] = None
+    embedding_text_hash: Optional[str] = None
 
 
 @dataclass(frozen=True)
@@ -0,0 +1,583 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import defaultdict
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    Sequence,
+    TypeVar,
+)
+
+from app.models.advice import Advice, AdviceKind
+
+logger = logging.getLogger(__name__)
+
+# Pause between background refresh attempts after a failed one.
+_RETRY_SECONDS = 30.0
+# Marks a key removed in an upper layer of a `_LayeredMap`.
+_REMOVED = object()
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+CatalogSync = Literal["full", "delta"]
+
+
+@dataclass(frozen=True)
+class AdviceCatalogSettings:
+    """
+    - `ttl_seconds`: how long a catalog snapshot is served without asking
+      the database (0 disables the snapshot: every read queries Supabase).
+    - `max_stale_seconds`: how long past the TTL the old snapshot is still
+      served while a background refresh runs (or keeps failing); older
+      snapshots make readers wait for a fresh load.
+    - `sync`: `full` reloads the whole catalog on refresh; `delta` fetches
+      only advices changed since the last sync (`updated_at`) and deletion
+      tombstones, and patches the snapshot.
+    """
+
+    ttl_seconds: float = 300.0
+    max_stale_seconds: float = 3600.0
+    sync: CatalogSync = "full"
+
+    @classmethod
+    def from_env(cls) -> "AdviceCatalogSettings":
+        sync = (os.getenv("ADVICE_CATALOG_SYNC") or "full").strip().lower()
+        if sync not in ("full", "delta"):
+            logger.warning("Unknown ADVICE_CATALOG_SYNC '%s', using full.", sync)
+            sync = "full"
+        return cls(
+            ttl_seconds=float(os.getenv("ADVICE_CATALOG_TTL_SECONDS", "300") or 0),
+            max_stale_seconds=float(
+                os.getenv("ADVICE_CATALOG_MAX_STALE_SECONDS", "3600") or 0),
+            sync=sync,  # type: ignore[arg-type]
+        )
+
+
+@lru_cache(maxsize=1)
+def get_advice_catalog_settings() -> AdviceCatalogSettings:
+    return AdviceCatalogSettings.from_env()
+
+
+@dataclass(frozen=True)
+class AdviceCatalogDelta:
+    """
+    Advices changed since a sync watermark (`changed`, current versions)
+    and ids deleted since then. `watermark` is the newest change seen; with
+    `full` the delta is the whole catalog.
+    """
+
+    changed: tuple[Advice, ...]
+    deleted_ids: tuple[int, ...] = ()
+    watermark: datetime | None = None
+    full: bool = False
+
+
+@dataclass(frozen=True)
+class AdviceCatalogUpdate:
+    """
+    Passed to snapshot listeners after a reload that changed something:
+    `previous` holds the old versions of replaced and deleted advices,
+    `current` the added and replaced ones. `full` means the catalog was
+    replaced as a whole and derived state should be rebuilt.
+    """
+
+    previous: tuple[Advice, ...]
+    current: tuple[Advice, ...]
+    full: bool = False
+
+
+CatalogListener = Callable[[AdviceCatalogUpdate], None]
+
+
+class _LayeredMap(MutableMapping[K, V], Generic[K, V]):
+    """
+    Dict shared between versions of an index: `derive()` returns a map that
+    writes to its own top layer over the layers of this one, which must not
+    be modified afterwards. `compact()` merges layers like a binary counter
+    (the top one into the one below while it is at least half its size), so
+    an entry is copied O(log n) times over its life and a lookup visits
+    O(log n) layers.
+    """
+
+    def __init__(self) -> None:
+        self._layers: list[dict] = [{}]
+        self._size = 0
+
+    def derive(self) -> "_LayeredMap[K, V]":
+        child: _LayeredMap[K, V] = object.__new__(_LayeredMap)
+        child._layers = [*self._layers, {}]
+        child._size = self._size
+        return child
+
+    def compact(self) -> None:
+        layers = self._layers
+        while len(layers) > 1 and (
+            not layers[-1] or 2 * len(layers[-1]) >= len(layers[-2])
+        ):
+            top = layers.pop()
+            if not top:
+                continue
+            merged = {**layers[-1], **top}
+            if len(layers) == 1:
+                # Nothing below the bottom layer to hide.
+                merged = {
+                    key: value for key, value in merged.items() if value is not _REMOVED
+                }
+            layers[-1] = merged
+
+    def __getitem__(self, key: K) -> V:
+        for layer in reversed(self._layers):
+            value = layer.get(key, _REMOVED)
+            if value is not _REMOVED:
+                return value
+            if key in layer:
+                break
+        raise KeyError(key)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        if key not in self:
+            self._size += 1
+        self._layers[-1][key] = value
+
+    def __delitem__(self, key: K) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if len(self._layers) == 1:
+            del self._layers[0][key]
+        else:
+            self._layers[-1][key] = _REMOVED
+        self._size -= 1
+
+    def __iter__(self) -> Iterator[K]:
+        if len(self._layers) == 1:
+            return iter(self._layers[0])
+        return self._merged_keys()
+
+    def _merged_keys(self) -> Iterator[K]:
+        seen: set[K] = set()
+        for layer in reversed(self._layers):
+            for key, value in layer.items():
+                if key not in seen:
+                    seen.add(key)
+                    if value is not _REMOVED:
+                        yield key
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class AdviceCatalogIndex:
+    """
+    Inverted indexes over one version of the catalog: kind -> advices and
+    interned category id -> advices (posting lists of catalog positions),
+    plus the number of advices per lowercased category name. "Kind K with
+    any of categories C" is a union of posting lists intersected with the
+    kind's list, not a scan of every advice's categories.
+
+    Immutable; `with_changes` derives the index of a patched catalog. It
+    shares everything with this one except the entries, posting lists and
+    frequencies of the changed advices' kinds and categories, so a delta
+    costs its own size. Results keep catalog order (a replaced advice keeps
+    its position, new ones go last).
+    """
+
+    def __init__(self, advices: Iterable[Advice] = ()) -> None:
+        self._advices: _LayeredMap[int, Advice] = _LayeredMap()
+        # Advice id -> position; in-memory advices without an id are indexed
+        # but cannot be replaced or removed by a patch.
+        self._positions: _LayeredMap[int, int] = _LayeredMap()
+        self._next_position = 0
+        self._category_ids: _LayeredMap[str, int] = _LayeredMap()
+        self._folded_category_ids: _LayeredMap[str, frozenset[int]] = _LayeredMap()
+        self._by_category: _LayeredMap[int, frozenset[int]] = _LayeredMap()
+        self._by_kind: dict[AdviceKind, frozenset[int]] = {}
+        self._frequencies: _LayeredMap[str, int] = _LayeredMap()
+        self._ordered: tuple[Advice, ...] | None = None
+        self._kind_cache: dict[AdviceKind, tuple[Advice, ...]] = {}
+        self._patch((), advices)
+
+    def __len__(self) -> int:
+        return len(self._advices)
+
+    @property
+    def advices(self) -> tuple[Advice, ...]:
+        if self._ordered is None:
+            self._ordered = self._select(self._advices)
+        return self._ordered
+
+    @property
+    def category_frequencies(self) -> Mapping[str, int]:
+        """Number of advices per lowercased category name."""
+        return MappingProxyType(self._frequencies)
+
+    def get(self, advice_id: int) -> Advice | None:
+        position = self._positions.get(advice_id)
+        return self._advices[position] if position is not None else None
+
+    def by_kind(self, kind: AdviceKind) -> tuple[Advice, ...]:
+        cached = self._kind_cache.get(kind)
+        if cached is None:
+            cached = self._kind_cache[kind] = self._select(
+                self._by_kind.get(kind, frozenset()))
+        return cached
+
+    def with_any_category(
+        self,
+        categories: Iterable[str],
+        *,
+        kind: AdviceKind | None = None,
+        casefold: bool = False,
+    ) -> tuple[Advice, ...]:
+        """
+        Advices having at least one of `categories` (exact names, or
+        case-insensitive with `casefold`), optionally only of `kind`.
+        """
+        category_ids: set[int] = set()
+        for name in categories:
+            if casefold:
+                category_ids.update(
+                    self._folded_category_ids.get(name.lower(), ()))
+            elif name in self._category_ids:
+                category_ids.add(self._category_ids[name])
+        positions: set[int] = set().union(
+            *(self._by_category.get(category_id, ()) for category_id in category_ids))
+        if kind is not None:
+            positions &= self._by_kind.get(kind, frozenset())
+        return self._select(positions)
+
+    def with_changes(self, update: AdviceCatalogUpdate) -> "AdviceCatalogIndex":
+        if update.full:
+            return AdviceCatalogIndex(update.current)
+        patched = object.__new__(AdviceCatalogIndex)
+        patched._advices = self._advices.derive()
+        patched._positions = self._positions.derive()
+        patched._next_position = self._next_position
+        patched._category_ids = self._category_ids.derive()
+        patched._folded_category_ids = self._folded_category_ids.derive()
+        patched._by_category = self._by_category.derive()
+        # One entry per kind; copying it is cheap.
+        patched._by_kind = dict(self._by_kind)
+        patched._frequencies = self._frequencies.derive()
+        patched._ordered = None
+        patched._kind_cache = {}
+        patched._patch(update.previous, update.current)
+        return patched
+
+    def _select(self, positions: Iterable[int]) -> tuple[Advice, ...]:
+        advices = self._advices
+        return tuple(advices[position] for position in sorted(positions))
+
+    def _intern(self, name: str) -> int:
+        category_id = self._category_ids.get(name)
+        if category_id is None:
+            category_id = self._category_ids[name] = len(self._category_ids)
+            folded = name.lower()
+            self._folded_category_ids[folded] = (
+                self._folded_category_ids.get(folded, frozenset()) | {category_id})
+        return category_id
+
+    def _patch(self, previous: Iterable[Advice], current: Iterable[Advice]) -> None:
+        removed_kind: defaultdict[AdviceKind, set[int]] = defaultdict(set)
+        added_kind: defaultdict[AdviceKind, set[int]] = defaultdict(set)
+        removed_category: defaultdict[int, set[int]] = defaultdict(set)
+        added_category: defaultdict[int, set[int]] = defaultdict(set)
+        freed: dict[int, int] = {}
+
+        def remove(advice_id: int) -> None:
+            position = self._positions.pop(advice_id, None)
+            if position is None:
+                return
+            old = self._advices.pop(position)
+            freed[advice_id] = position
+            removed_kind[old.kind].add(position)
+            for name in set(old.categories):
+                removed_category[self._category_ids[name]].add(position)
+            for key in {name.lower() for name in old.categories}:
+                remaining = self._frequencies.get(key, 0) - 1
+                if remaining > 0:
+                    self._frequencies[key] = remaining
+                else:
+                    self._frequencies.pop(key, None)
+
+        for advice in previous:
+            if advice.id is not None:
+                remove(advice.id)
+        for advice in current:
+            position: int | None = None
+            if advice.id is not None:
+                # Also covers a replacement not listed in `previous`.
+                remove(advice.id)
+                position = freed.get(advice.id)
+            if position is None:
+                position = self._next_position
+                self._next_position += 1
+            self._advices[position] = advice
+            if advice.id is not None:
+                self._positions[advice.id] = position
+            added_kind[advice.kind].add(position)
+            for name in set(advice.categories):
+                added_category[self._intern(name)].add(position)
+            for key in {name.lower() for name in advice.categories}:
+                self._frequencies[key] = self._frequencies.get(key, 0) + 1
+
+        _merge_postings(self._by_kind, removed_kind, added_kind)
+        _merge_postings(self._by_category, removed_category, added_category)
+        for layered in (
+            self._advices,
+            self._positions,
+            self._category_ids,
+            self._folded_category_ids,
+            self._by_category,
+            self._frequencies,
+        ):
+            layered.compact()
+
+
+def _merge_postings(
+    postings: MutableMapping,
+    removed: Mapping[object, set[int]],
+    added: Mapping[object, set[int]],
+) -> None:
+    # A replaced advice keeps its position, so it can be in both `removed`
+    # and `added` of the same list; the union comes second.
+    for key in removed.keys() | added.keys():
+        merged = (postings.get(key, frozenset()) - removed.get(key, set())) | added.get(
+            key, set())
+        if merged:
+            postings[key] = frozenset(merged)
+        else:
+            postings.pop(key, None)
+
+
+class AdviceCatalogSnapshot:
+    """
+    In-process copy of the whole advice catalog with stale-while-revalidate
+    semantics: a fresh snapshot is served from memory, an expired one is
+    still served while a single background task reloads it, and only the
+    first read (or one after `invalidate()`, or past `max_stale_seconds`)
+    waits for the database.
+
+    With `load_changes` the first load is a full one and later reloads apply
+    deltas (changed advices, tombstones) to the snapshot, so their cost
+    follows the size of the change. Listeners learn what changed and patch
+    state derived from the catalog instead of rebuilding it.
+
+    The snapshot is kept as an `AdviceCatalogIndex` (`get_index()`), so kind
+    and category lookups do not scan it.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], Awaitable[Sequence[Advice]]],
+        *,
+        load_changes: Callable[[datetime | None], Awaitable[AdviceCatalogDelta]]
+        | None = None,
+        ttl_seconds: float = 300.0,
+        max_stale_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._load = load
+        self._load_changes = load_changes
+        self._ttl = ttl_seconds
+        self._max_stale = max(max_stale_seconds, 0.0)
+        self._clock = clock
+        self._index: AdviceCatalogIndex | None = None
+        # Delta mode: the synced catalog and the watermark of the last sync;
+        # both survive `invalidate()`, so the next load is still a delta.
+        self._synced: AdviceCatalogIndex | None = None
+        self._watermark: datetime | None = None
+        self._listeners: list[CatalogListener] = []
+        self._loaded_at = 0.0
+        # Bumped by `invalidate()`; a load started before it is not kept.
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task[None] | None = None
+        self._closed = False
+        self._retry_at = 0.0
+        self._hits = 0
+        self._stale_hits = 0
+        self._loads = 0
+        self._delta_loads = 0
+
+    @property
+    def incremental(self) -> bool:
+        """True when reloads apply deltas instead of reloading everything."""
+        return self._load_changes is not None
+
+    @property
+    def watermark(self) -> datetime | None:
+        return self._watermark
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            "hits": self._hits,
+            "stale_hits": self._stale_hits,
+            "loads": self._loads,
+            "delta_loads": self._delta_loads,
+            "size": len(self._index) if self._index is not None else 0,
+            "age_seconds": self.age if self._index is not None else -1.0,
+        }
+
+    @property
+    def age(self) -> float:
+        return self._clock() - self._loaded_at
+
+    async def get(self) -> Sequence[Advice]:
+        return (await self.get_index()).advices
+
+    async def get_index(self) -> AdviceCatalogIndex:
+        index = self._index
+        if index is not None:
+            age = self.age
+            if age <= self._ttl:
+                self._hits += 1
+                return index
+            if age <= self._ttl + self._max_stale:
+                self._stale_hits += 1
+                self._revalidate()
+                return index
+        async with self._lock:
+            # Another reader may have loaded it while this one waited.
+            if self._index is not None and self.age <= self._ttl:
+                self._hits += 1
+                return self._index
+            return await self._reload()
+
+    async def refresh(self) -> Sequence[Advice]:
+        """Reloads the catalog now and returns the new snapshot."""
+        async with self._lock:
+            return (await self._reload()).advices
+
+    def add_listener(self, listener: CatalogListener) -> None:
+        self._listeners.append(listener)
+
+    def invalidate(self, *, full: bool = False) -> None:
+        """
+        Drops the snapshot, e.g. after the application itself changed advices;
+        the next read loads the catalog again (in delta mode only the changes,
+        unless `full`).
+        """
+        self._generation += 1
+        self._index = None
+        if full:
+            self._synced = None
+            self._watermark = None
+
+    async def aclose(self) -> None:
+        """
+        Stops background refreshes (waiting for a running one to cancel) and
+        drops the listeners; reads still work but never revalidate again.
+        """
+        self._closed = True
+        self._listeners.clear()
+        task = self._refresh_task
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _reload(self) -> AdviceCatalogIndex:
+        generation = self._generation
+        started = self._clock()
+        if self._load_changes is None:
+            index = AdviceCatalogIndex(await self._load())
+            update = AdviceCatalogUpdate(
+                previous=(), current=index.advices, full=True)
+        elif self._synced is None or self._watermark is None:
+            delta = await self._load_changes(None)
+            index = self._synced = AdviceCatalogIndex(delta.changed)
+            self._watermark = delta.watermark
+            update = AdviceCatalogUpdate(
+                previous=(), current=index.advices, full=True)
+        else:
+            delta = await self._load_changes(self._watermark)
+            update = self._apply(self._synced, delta)
+            index = self._synced
+            self._delta_loads += 1
+        self._loads += 1
+        if generation == self._generation:
+            self._index = index
+            self._loaded_at = self._clock()
+        logger.debug(
+            "Loaded advice catalog snapshot (%d advices, %d changed) in %.3fs.",
+            len(index),
+            len(update.previous) + len(update.current),
+            self._clock() - started,
+        )
+        if update.full or update.previous or update.current:
+            self._notify(update)
+        return index
+
+    def _apply(
+        self, synced: AdviceCatalogIndex, delta: AdviceCatalogDelta
+    ) -> AdviceCatalogUpdate:
+        previous: list[Advice] = []
+        current: list[Advice] = []
+        for advice in delta.changed:
+            if advice.id is None:
+                continue
+            old = synced.get(advice.id)
+            if old == advice:
+                # Re-read because of the sync overlap window.
+                continue
+            if old is not None:
+                previous.append(old)
+            current.append(advice)
+        for advice_id in delta.deleted_ids:
+            old = synced.get(advice_id)
+            if old is not None:
+                previous.append(old)
+        update = AdviceCatalogUpdate(previous=tuple(previous), current=tuple(current))
+        if update.previous or update.current:
+            self._synced = synced.with_changes(update)
+        if delta.watermark is not None and (
+            self._watermark is None or delta.watermark > self._watermark
+        ):
+            self._watermark = delta.watermark
+        return update
+
+    def _notify(self, update: AdviceCatalogUpdate) -> None:
+        for listener in self._listeners:
+            try:
+                listener(update)
+            except Exception as exc:  # pragma: no cover - listener guard
+                logger.warning("Advice catalog listener failed: %s", exc)
+
+    def _revalidate(self) -> None:
+        if self._closed:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        if self._clock() < self._retry_at:
+            return
+        self._refresh_task = asyncio.create_task(self._revalidate_in_background())
+
+    async def _revalidate_in_background(self) -> None:
+        try:
+            async with self._lock:
+                if self._index is not None and self.age <= self._ttl:
+                    return
+                await self._reload()
+        except Exception as exc:  # pragma: no cover - network guard
+            # The stale snapshot keeps being served until `max_stale_seconds`;
+            # do not retry on every request while the database is down.
+            self._retry_at = self._clock() + min(self._ttl, _RETRY_SECONDS)
+            logger.warning("Advice catalog refresh failed: %s", exc)
@@ -1,19 +1,116 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Callable, Protocol, Sequence, cast
+import asyncio
+import base64
+import logging
+import os
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Literal,
+    Mapping,
+    Protocol,
+    Sequence,
+    cast,
+)
+
+import numpy as np
 
 from app.models.advice import Advice, AdviceKind
+from app.repositories.advice_catalog import (
+    AdviceCatalogDelta,
+    AdviceCatalogIndex,
+    AdviceCatalogSnapshot,
+    get_advice_catalog_settings,
+)
 
 if TYPE_CHECKING:  # pragma: no cover - optional dependency hint
     from supabase.client import AsyncClient  # type: ignore[import]
 else:  # pragma: no cover - allow import without supabase installed
     AsyncClient = Any  # type: ignore
 
+logger = logging.getLogger(__name__)
+
 AdviceRow = dict[str, Any]
 CategoryLinkRow = dict[str, Any]
 QueryBuilder = Any
 
 
+EmbeddingStorage = Literal["json", "float32", "float16"]
+
+# Binary copy of the embedding: "<dtype code>:<base64 of little-endian values>".
+PACKED_EMBEDDING_COLUMN = "embedding_packed"
+_PACKED_DTYPES: Mapping[str, np.dtype] = {
+    "f4": np.dtype("<f4"),
+    "f2": np.dtype("<f2"),
+}
+_PACKED_CODES: Mapping[str, str] = {"float32": "f4", "float16": "f2"}
+
+
+def get_embedding_storage() -> EmbeddingStorage:
+    """
+    Advice embedding storage format from `ADVICE_EMBEDDING_STORAGE`: `json`
+    (pgvector column only) or `float32` / `float16` (additionally a packed
+    binary column, read instead of the JSON array).
+    """
+    storage = (os.getenv("ADVICE_EMBEDDING_STORAGE") or "json").strip().lower()
+    if storage not in ("json", "float32", "float16"):
+        logger.warning(
+            "Unknown ADVICE_EMBEDDING_STORAGE '%s', using json.", storage)
+        storage = "json"
+    return storage  # type: ignore[return-value]
+
+
+def pack_embedding(
+    embedding: Sequence[float], storage: EmbeddingStorage = "float32"
+) -> str:
+    code = _PACKED_CODES.get(storage, "f4")
+    payload = np.asarray(embedding, dtype=_PACKED_DTYPES[code]).tobytes()
+    return f"{code}:{base64.b64encode(payload).decode('ascii')}"
+
+
+def unpack_embedding(value: Any) -> np.ndarray | None:
+    """Decodes a packed embedding; float32 payloads are not copied again."""
+    if not value or not isinstance(value, str):
+        return None
+    code, _, payload = value.partition(":")
+    dtype = _PACKED_DTYPES.get(code)
+    if dtype is None or not payload:
+        return None
+    vector = np.frombuffer(base64.b64decode(payload), dtype=dtype)
+    if vector.dtype != np.float32:
+        vector = vector.astype(np.float32)
+    return vector
+
+
+def _embedding_payload(embedding: Sequence[float]) -> list[float]:
+    # NumPy scalars are not JSON serializable.
+    return np.asarray(embedding, dtype=np.float64).tolist()
+
+
+def _embedding_update(
+    embedding: Sequence[float],
+    model: str | None,
+    text_hash: str | None,
+    storage: EmbeddingStorage = "json",
+) -> dict[str, Any]:
+    # The version columns are always written, so an untagged write clears a
+    # stale tag instead of leaving it attached to a new vector.
+    update: dict[str, Any] = {
+        "embedding": _embedding_payload(embedding),
+        "embedding_model": model,
+        "embedding_text_hash": text_hash,
+    }
+    if storage != "json":
+        # The pgvector column is still written: `match_advices` searches it.
+        update[PACKED_EMBEDDING_COLUMN] = pack_embedding(embedding, storage)
+    return update
+
+
 class AdviceRepository(Protocol):
     async def get_all(self) -> Sequence[Advice]:
         raise NotImplementedError
@@ -28,17 +125,86 @@ class AdviceRepository(Protocol):
     ) -> Sequence[Advice]:
         raise NotImplementedError
 
+    async def get_catalog_index(self) -> AdviceCatalogIndex:
+        """Kind and category indexes over the whole catalog."""
+        raise NotImplementedError
+
+
+class AdviceVectorSearch(Protocol):
+    """
+    Retrieval done by the storage itself: only the `k` best advices (by
+    cosine similarity to `query_embedding`) and their scores are returned.
+    """
+
+    async def match_advices(
+        self,
+        query_embedding: Sequence[float],
+        k: int,
+        *,
+        kind: AdviceKind | None = None,
+        min_score: float | None = None,
+    ) -> Sequence[tuple[Advice, float]]:
+        raise NotImplementedError
+
+    async def count_matchable(self, kind: AdviceKind | None = None) -> int:
+        """Advices (of `kind`) `match_advices` can return: those with an embedding."""
+        raise NotImplementedError
+
 
 class SupabaseAdviceRepository(AdviceRepository):
+    """
+    Advices from Supabase. With a positive `catalog_ttl_seconds` (default
+    `ADVICE_CATALOG_TTL_SECONDS`) all read methods are answered from the
+    indexes of an in-process catalog snapshot refreshed in the background;
+    the application's own writes invalidate it.
+    """
+
     _TABLE_NAME = "advices"
+    _TOMBSTONE_TABLE_NAME = "advice_tombstones"
+    # Changes are re-read this far behind the watermark: a transaction that
+    # commits late carries an `updated_at` older than rows already seen.
+    _SYNC_OVERLAP = timedelta(seconds=30)
 
-    def __init__(self, client: AsyncClient) -> None:  # type: ignore[misc]
+    def __init__(
+        self,
+        client: AsyncClient,  # type: ignore[misc]
+        *,
+        catalog_ttl_seconds: float | None = None,
+        catalog_sync: str | None = None,
+    ) -> None:
         self._client = client
+        settings = get_advice_catalog_settings()
+        ttl = (settings.ttl_seconds if catalog_ttl_seconds is None
+               else catalog_ttl_seconds)
+        delta_sync = (catalog_sync or settings.sync) == "delta"
+        self._catalog: AdviceCatalogSnapshot | None = (
+            AdviceCatalogSnapshot(
+                self._fetch_advices,
+                load_changes=self.fetch_changes if delta_sync else None,
+                ttl_seconds=ttl,
+                max_stale_seconds=settings.max_stale_seconds,
+            )
+            if ttl > 0
+            else None
+        )
+
+    @property
+    def catalog(self) -> AdviceCatalogSnapshot | None:
+        return self._catalog
+
+    def invalidate_catalog(self) -> None:
+        """Next read loads the catalog from the database again."""
+        if self._catalog is not None:
+            self._catalog.invalidate()
 
     async def get_all(self) -> Sequence[Advice]:
+        if self._catalog is not None:
+            return await self._catalog.get()
         return await self._fetch_advices()
 
     async def get_by_kind(self, kind: AdviceKind) -> Sequence[Advice]:
+        if self._catalog is not None:
+            return (await self._catalog.get_index()).by_kind(kind)
         return await self._fetch_advices(lambda query: query.eq("kind", kind.value))
 
     async def get_by_kind_and_containing_any_category(
@@ -50,6 +216,10 @@ class SupabaseAdviceRepository(AdviceRepository):
         if not category_names:
             return ()
 
+        if self._catalog is not None:
+            # Same match as the `in` filter below: exact category names.
+            return (await self._catalog.get_index()).with_any_category(
+                category_names, kind=kind)
         return await self._fetch_advices(
             lambda query: query.eq("kind", kind.value).filter(
                 "advice_category_links.category.name",
@@ -59,11 +229,78 @@ class SupabaseAdviceRepository(AdviceRepository):
             inner_join_categories=True,
         )
 
+    async def get_catalog_index(self) -> AdviceCatalogIndex:
+        if self._catalog is not None:
+            return await self._catalog.get_index()
+        return AdviceCatalogIndex(await self._fetch_advices())
+
+    async def fetch_changes(self, since: datetime | None) -> AdviceCatalogDelta:
+        """
+        Advices changed (`updated_at`) and deleted (`advice_tombstones`) since
+        `since`, for delta sync of the catalog snapshot; `None` returns the
+        whole catalog. Needs the `updated_at` migration from
+        `supabase/migrations`.
+        """
+        if since is None:
+            rows = await self._fetch_rows(extra_columns=("updated_at",))
+            return AdviceCatalogDelta(
+                changed=tuple(self._map_advice(row) for row in rows),
+                watermark=self._latest(rows, "updated_at"),
+                full=True,
+            )
+        start = (since - self._SYNC_OVERLAP).isoformat()
+        rows = await self._fetch_rows(
+            lambda query: query.gte("updated_at", start),
+            extra_columns=("updated_at",),
+        )
+        response = await (
+            self._client.table(self._TOMBSTONE_TABLE_NAME)
+            .select("advice_id,deleted_at")
+            .gte("deleted_at", start)
+            .execute()
+        )
+        self._raise_on_error(response)
+        tombstones = cast(
+            Sequence[AdviceRow], getattr(response, "data", None) or [])
+        changed = tuple(self._map_advice(row) for row in rows)
+        # A row that exists again (or still) is not deleted.
+        alive = {advice.id for advice in changed}
+        watermark = max(
+            (moment for moment in (
+                since,
+                self._latest(rows, "updated_at"),
+                self._latest(tombstones, "deleted_at"),
+            ) if moment is not None),
+        )
+        return AdviceCatalogDelta(
+            changed=changed,
+            deleted_ids=tuple(
+                int(row["advice_id"]) for row in tombstones
+                if int(row["advice_id"]) not in alive
+            ),
+            watermark=watermark,
+        )
+
+    @staticmethod
+    def _latest(rows: Sequence[AdviceRow], column: str) -> datetime | None:
+        moments = [datetime.fromisoformat(str(row[column]))
+                   for row in rows if row.get(column)]
+        return max(moments) if moments else None
+
     async def _fetch_advices(
         self,
         apply_filters: Callable[[QueryBuilder], QueryBuilder] | None = None,
         inner_join_categories: bool = False,
     ) -> Sequence[Advice]:
+        rows = await self._fetch_rows(apply_filters, inner_join_categories)
+        return tuple(self._map_advice(row) for row in rows)
+
+    async def _fetch_rows(
+        self,
+        apply_filters: Callable[[QueryBuilder], QueryBuilder] | None = None,
+        inner_join_categories: bool = False,
+        extra_columns: Sequence[str] = (),
+    ) -> Sequence[AdviceRow]:
         category_select = (
             "advice_category_links:advice_category_links"
             f"{'!inner' if inner_join_categories else ''}"
@@ -71,7 +308,7 @@ class SupabaseAdviceRepository(AdviceRepository):
         )
 
         # Nie ładuj embeddings przy get_all() - oszczędność pamięci
-        # Embeddings będą ładowane lazy gdy potrzebne
+        # Embeddings ładuje hurtowo `load_embedding_matrix()` / `get_embeddings()`
         base_query = self._client.table(self._TABLE_NAME).select(
             ",".join(
                 [
@@ -83,7 +320,11 @@ class SupabaseAdviceRepository(AdviceRepository):
                     "link",
                     "image_url",
                     "author",
-                    # "embedding",  # Nie ładuj - oszczędność pamięci, będzie lazy loaded
+                    # "embedding",  # Nie ładuj - oszczędność pamięci, ładowane hurtowo
+                    # Wersja embeddingu (model + hash tekstu) - wykrywanie nieaktualnych
+                    "embedding_model",
+                    "embedding_text_hash",
+                    *extra_columns,
                     category_select,
                 ]
             )
@@ -95,8 +336,7 @@ class SupabaseAdviceRepository(AdviceRepository):
         # Supabase client stubs type `data` as a JSON-like union; at runtime we know
         # it is a list of dicts for this query, so we narrow the type here.
         raw_rows = getattr(response, "data", None) or []
-        rows = cast(Sequence[AdviceRow], raw_rows)
-        return tuple(self._map_advice(row) for row in rows)
+        return cast(Sequence[AdviceRow], raw_rows)
 
     @staticmethod
     def _build_supabase_in_filter(values: Sequence[Any]) -> str:
@@ -135,6 +375,8 @@ class SupabaseAdviceRepository(AdviceRepository):
             author=row.get("author"),
             categories=self._extract_categories(row),
             embedding=row.get("embedding"),
+            embedding_model=row.get("embedding_model"),
+            embedding_text_hash=row.get("embedding_text_hash"),
         )
 
     @staticmethod
@@ -150,57 +392,437 @@ class SupabaseAdviceRepository(AdviceRepository):
         return tuple(categories)
 
 
-class InMemoryAdviceRepository(AdviceRepository):
+class InMemoryAdviceRepository(AdviceRepository, AdviceVectorSearch):
     def __init__(self, advice_items: Sequence[Advice]) -> None:
         self._advice_items = tuple(advice_items)
+        self._index = AdviceCatalogIndex(self._advice_items)
+
+    async def match_advices(
+        self,
+        query_embedding: Sequence[float],
+        k: int,
+        *,
+        kind: AdviceKind | None = None,
+        min_score: float | None = None,
+    ) -> Sequence[tuple[Advice, float]]:
+        """
+        Local stand-in for the `match_advices` database function with the same
+        semantics (cosine similarity, same-size vectors only, kind filter,
+        threshold, best first, at most `k` rows).
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query))
+        if k <= 0 or query_norm == 0.0:
+            return ()
+        matches: list[tuple[Advice, float]] = []
+        for item in self._advice_items:
+            if not item.embedding or len(item.embedding) != len(query):
+                continue
+            if kind is not None and item.kind != kind:
+                continue
+            vector = np.asarray(item.embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            if norm == 0.0:
+                continue
+            score = float(vector @ query) / (norm * query_norm)
+            if min_score is None or score >= min_score:
+                matches.append((item, score))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return tuple(matches[:k])
+
+    async def count_matchable(self, kind: AdviceKind | None = None) -> int:
+        return sum(
+            1 for item in self._advice_items
+            if item.embedding and (kind is None or item.kind == kind)
+        )
 
     async def get_all(self) -> Sequence[Advice]:
         return self._advice_items
 
     async def get_by_kind(self, kind: AdviceKind) -> Sequence[Advice]:
-        return tuple(item for item in self._advice_items if item.kind == kind)
+        return self._index.by_kind(kind)
 
     async def get_by_kind_and_containing_any_category(
         self,
         kind: AdviceKind,
         categories: Sequence[str],
     ) -> Sequence[Advice]:
-        category_set = {category.lower() for category in categories}
-        return tuple(
-            item
-            for item in self._advice_items
-            if item.kind == kind
-            and any(category.lower() in category_set for category in item.categories)
-        )
+        return self._index.with_any_category(categories, kind=kind, casefold=True)
+
+    async def get_catalog_index(self) -> AdviceCatalogIndex:
+        return self._index
 
 
-class EmbeddingUpdatableAdviceRepository(SupabaseAdviceRepository):
+class EmbeddingUpdatableAdviceRepository(SupabaseAdviceRepository, AdviceVectorSearch):
     """
     Extension of SupabaseAdviceRepository that exposes an explicit method
     for updating cached advice embeddings in the database.
     """
 
-    async def update_embedding(self, advice_id: int, embedding: Sequence[float]) -> None:
-        await (
+    _MATCH_FUNCTION = "match_advices"
+
+    def __init__(
+        self,
+        client: AsyncClient,  # type: ignore[misc]
+        *,
+        embedding_storage: EmbeddingStorage | None = None,
+        catalog_ttl_seconds: float | None = None,
+        catalog_sync: str | None = None,
+    ) -> None:
+        super().__init__(
+            client,
+            catalog_ttl_seconds=catalog_ttl_seconds,
+            catalog_sync=catalog_sync,
+        )
+        self._embedding_storage = embedding_storage or get_embedding_storage()
+
+    @property
+    def embedding_storage(self) -> EmbeddingStorage:
+        return self._embedding_storage
+
+    @property
+    def _packed(self) -> bool:
+        return self._embedding_storage != "json"
+
+    async def match_advices(
+        self,
+        query_embedding: Sequence[float],
+        k: int,
+        *,
+        kind: AdviceKind | None = None,
+        min_score: float | None = None,
+    ) -> Sequence[tuple[Advice, float]]:
+        """
+        Wyszukiwanie po stronie bazy (funkcja `match_advices`, migracja w
+        `supabase/migrations`): z bazy wraca tylko `k` najlepszych porad.
+        """
+        if k <= 0:
+            return ()
+        response = await self._client.rpc(
+            self._MATCH_FUNCTION,
+            {
+                "query_embedding": _embedding_payload(query_embedding),
+                "match_count": k,
+                "filter_kind": kind.value if kind is not None else None,
+                "min_similarity": min_score,
+            },
+        ).execute()
+        self._raise_on_error(response)
+        rows = cast(Sequence[AdviceRow], getattr(response, "data", None) or [])
+        return tuple(
+            (
+                replace(
+                    self._map_advice(row),
+                    categories=tuple(row.get("categories") or ()),
+                ),
+                float(row["similarity"]),
+            )
+            for row in rows
+        )
+
+    async def count_matchable(self, kind: AdviceKind | None = None) -> int:
+        query = (
             self._client.table(self._TABLE_NAME)
-            .update({"embedding": list(embedding)})
-            .eq("id", advice_id)
-            .execute()
+            .select("id", count="exact", head=True)
+            .not_.is_("embedding", "null")
         )
+        if kind is not None:
+            query = query.eq("kind", kind.value)
+        response = await query.execute()
+        self._raise_on_error(response)
+        return int(getattr(response, "count", None) or 0)
 
-    async def get_embedding(self, advice_id: int) -> Sequence[float] | None:
-        """Pobiera embedding dla konkretnej porady z bazy (lazy loading)."""
-        response = (
-            await self._client.table(self._TABLE_NAME)
-            .select("embedding")
+    async def update_embedding(
+        self,
+        advice_id: int,
+        embedding: Sequence[float],
+        *,
+        model: str | None = None,
+        text_hash: str | None = None,
+    ) -> None:
+        response = await (
+            self._client.table(self._TABLE_NAME)
+            .update(_embedding_update(
+                embedding, model, text_hash, self._embedding_storage))
             .eq("id", advice_id)
-            .limit(1)
             .execute()
         )
-        records = response.data or []
-        if not records:
+        # E.g. `embedding_packed` missing because the migration was not applied.
+        self._raise_on_error(response)
+        # The snapshot carries the embedding version tags.
+        self.invalidate_catalog()
+
+    async def get_embedding(self, advice_id: int) -> np.ndarray | None:
+        """
+        Pobiera embedding dla konkretnej porady z bazy (lazy loading), dekodując
+        go jak `get_embeddings` (kolumna binarna, tekst pgvector "[...]").
+        """
+        return (await self.get_embeddings([advice_id])).get(advice_id)
+
+    async def get_embeddings(
+        self, advice_ids: Sequence[int], *, chunk_size: int = 200
+    ) -> dict[int, np.ndarray]:
+        """
+        Pobiera embeddingi wielu porad naraz (jedno zapytanie na `chunk_size`
+        identyfikatorów) jako wektory float32. Porady bez embeddingu są pomijane.
+        """
+        unique_ids = list(dict.fromkeys(advice_ids))
+        embeddings: dict[int, np.ndarray] = {}
+        column = PACKED_EMBEDDING_COLUMN if self._packed else "embedding"
+        for start in range(0, len(unique_ids), chunk_size):
+            chunk = unique_ids[start:start + chunk_size]
+            embeddings.update(await self._select_embeddings(column, chunk))
+        if self._packed:
+            # Wiersze sprzed migracji mają tylko kolumnę JSON.
+            unpacked = [advice_id for advice_id in unique_ids
+                        if advice_id not in embeddings]
+            for start in range(0, len(unpacked), chunk_size):
+                chunk = unpacked[start:start + chunk_size]
+                embeddings.update(await self._select_embeddings("embedding", chunk))
+        return embeddings
+
+    async def _select_embeddings(
+        self, column: str, advice_ids: Sequence[int]
+    ) -> dict[int, np.ndarray]:
+        response = await (
+            self._client.table(self._TABLE_NAME)
+            .select(f"id,{column}")
+            .in_("id", list(advice_ids))
+            .execute()
+        )
+        self._raise_on_error(response)
+        embeddings: dict[int, np.ndarray] = {}
+        for row in getattr(response, "data", None) or []:
+            vector = self._decode_column(column, row.get(column))
+            if vector is not None:
+                embeddings[int(row["id"])] = vector
+        return embeddings
+
+    async def load_embedding_matrix(
+        self, *, page_size: int = 1000
+    ) -> tuple[tuple[int, ...], np.ndarray]:
+        """
+        Wczytuje embeddingi całego katalogu stronicowanym zapytaniem (po id)
+        i zwraca identyfikatory porad oraz macierz float32 (wiersz na poradę).
+
+        Wektory o innej liczbie wymiarów niż większość (np. z innego modelu)
+        są pomijane, bo nie da się ich porównać z resztą.
+        """
+        if self._packed:
+            ids, vectors = await self._scan_embeddings(
+                PACKED_EMBEDDING_COLUMN,
+                lambda query: query.not_.is_(PACKED_EMBEDDING_COLUMN, "null"),
+                page_size,
+            )
+            # Wiersze sprzed migracji: tylko kolumna JSON (zwykle żadnych).
+            legacy_ids, legacy_vectors = await self._scan_embeddings(
+                "embedding",
+                lambda query: query.is_(PACKED_EMBEDDING_COLUMN, "null")
+                .not_.is_("embedding", "null"),
+                page_size,
+            )
+            if legacy_ids:
+                logger.info(
+                    "%d porad nie ma jeszcze binarnego embeddingu - uruchom "
+                    "`python -m app.services.embedding_storage_migration`.",
+                    len(legacy_ids),
+                )
+                merged = sorted(zip(ids + legacy_ids, vectors + legacy_vectors),
+                                key=lambda item: item[0])
+                ids = [advice_id for advice_id, _ in merged]
+                vectors = [vector for _, vector in merged]
+        else:
+            ids, vectors = await self._scan_embeddings(
+                "embedding",
+                lambda query: query.not_.is_("embedding", "null"),
+                page_size,
+            )
+
+        if not vectors:
+            return (), np.empty((0, 0), dtype=np.float32)
+        dimensions = Counter(len(vector)
+                             for vector in vectors).most_common(1)[0][0]
+        keep = [index for index, vector in enumerate(vectors)
+                if len(vector) == dimensions]
+        if len(keep) != len(vectors):
+            logger.warning(
+                "Pomijam %d embeddingów o innej liczbie wymiarów niż %d.",
+                len(vectors) - len(keep),
+                dimensions,
+            )
+        matrix = np.empty((len(keep), dimensions), dtype=np.float32)
+        for row_index, index in enumerate(keep):
+            matrix[row_index] = vectors[index]
+        return tuple(ids[index] for index in keep), matrix
+
+    async def _scan_embeddings(
+        self,
+        column: str,
+        apply_filters: Callable[[QueryBuilder], QueryBuilder],
+        page_size: int,
+    ) -> tuple[list[int], list[np.ndarray]]:
+        ids: list[int] = []
+        vectors: list[np.ndarray] = []
+        last_id = 0
+        while True:
+            query = (
+                self._client.table(self._TABLE_NAME)
+                .select(f"id,{column}")
+                .gt("id", last_id)
+            )
+            response = await (
+                apply_filters(query).order("id").limit(page_size).execute()
+            )
+            self._raise_on_error(response)
+            rows = getattr(response, "data", None) or []
+            for row in rows:
+                vector = self._decode_column(column, row.get(column))
+                if vector is not None:
+                    ids.append(int(row["id"]))
+                    vectors.append(vector)
+            if len(rows) < page_size:
+                break
+            last_id = int(rows[-1]["id"])
+        return ids, vectors
+
+    @classmethod
+    def _decode_column(cls, column: str, value: Any) -> np.ndarray | None:
+        if column == PACKED_EMBEDDING_COLUMN:
+            return unpack_embedding(value)
+        return cls._decode_embedding(value)
+
+    @staticmethod
+    def _decode_embedding(value: Any) -> np.ndarray | None:
+        if not value:
             return None
-        embedding = records[0].get("embedding")
-        if embedding and isinstance(embedding, list):
-            return embedding
-        return None
+        if isinstance(value, str):
+            # Kolumna pgvector / real[] może przyjść jako tekst "[...]" lub "{...}".
+            value = value.strip("[]{}").split(",")
+        try:
+            return np.asarray(value, dtype=np.float32)
+        except (TypeError, ValueError):
+            return None
+
+    async def update_embeddings(
+        self,
+        embeddings: Mapping[int, Sequence[float]],
+        *,
+        model: str | None = None,
+        text_hashes: Mapping[int, str] | None = None,
+        concurrency: int = 8,
+    ) -> None:
+        """
+        Zapisuje wiele embeddingów naraz (równoległe aktualizacje wierszy),
+        razem z modelem i hashem tekstu, z którego je policzono.
+
+        Upsert PostgREST wymagałby pełnych wierszy, więc każdy wiersz jest
+        aktualizowany osobno, z ograniczoną liczbą zapytań w locie.
+        """
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        text_hashes = text_hashes or {}
+
+        async def update(advice_id: int, embedding: Sequence[float]) -> None:
+            async with semaphore:
+                response = await (
+                    self._client.table(self._TABLE_NAME)
+                    .update(_embedding_update(
+                        embedding,
+                        model,
+                        text_hashes.get(advice_id),
+                        self._embedding_storage,
+                    ))
+                    .eq("id", advice_id)
+                    .execute()
+                )
+                self._raise_on_error(response)
+
+        try:
+            await asyncio.gather(
+                *(update(advice_id, embedding)
+                  for advice_id, embedding in embeddings.items())
+            )
+        finally:
+            self.invalidate_catalog()
+
+    async def get_embedding_backfill_page(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 500,
+        include_embedded: bool = False,
+    ) -> Sequence[Advice]:
+        """
+        Zwraca kolejną stronę porad (rosnąco po id, id > `after_id`) do
+        uzupełnienia embeddingów, z wersją zapisanego embeddingu (bez wektora).
+        Domyślnie tylko porady bez embeddingu; z `include_embedded` także te,
+        które już go mają.
+        """
+        columns = [
+            "id", "name", "kind", "description",
+            "embedding_model", "embedding_text_hash",
+        ]
+        query = (
+            self._client.table(self._TABLE_NAME)
+            .select(",".join(columns))
+            .gt("id", after_id)
+        )
+        if not include_embedded:
+            query = query.is_("embedding", "null")
+        response = await query.order("id").limit(limit).execute()
+        self._raise_on_error(response)
+        rows = cast(Sequence[AdviceRow], getattr(response, "data", None) or [])
+        return tuple(self._map_advice(row) for row in rows)
+
+    async def get_embeddings_to_pack(
+        self,
+        *,
+        after_id: int = 0,
+        limit: int = 500,
+        repack: bool = False,
+    ) -> Sequence[tuple[int, np.ndarray]]:
+        """
+        Kolejna strona (rosnąco po id) embeddingów z kolumny JSON do zapisania
+        w kolumnie binarnej. Domyślnie tylko wiersze bez wersji binarnej; z
+        `repack` wszystkie (np. po zmianie float32 <-> float16).
+        """
+        query = (
+            self._client.table(self._TABLE_NAME)
+            .select("id,embedding")
+            .gt("id", after_id)
+            .not_.is_("embedding", "null")
+        )
+        if not repack:
+            query = query.is_(PACKED_EMBEDDING_COLUMN, "null")
+        response = await query.order("id").limit(limit).execute()
+        self._raise_on_error(response)
+        page: list[tuple[int, np.ndarray]] = []
+        for row in getattr(response, "data", None) or []:
+            vector = self._decode_embedding(row.get("embedding"))
+            if vector is not None:
+                page.append((int(row["id"]), vector))
+        return page
+
+    async def update_packed_embeddings(
+        self,
+        embeddings: Mapping[int, Sequence[float]],
+        *,
+        storage: EmbeddingStorage = "float32",
+        concurrency: int = 8,
+    ) -> None:
+        """Zapisuje tylko kolumnę binarną (wektor i jego wersja bez zmian)."""
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def update(advice_id: int, embedding: Sequence[float]) -> None:
+            async with semaphore:
+                response = await (
+                    self._client.table(self._TABLE_NAME)
+                    .update({PACKED_EMBEDDING_COLUMN: pack_embedding(embedding, storage)})
+                    .eq("id", advice_id)
+                    .execute()
+                )
+                self._raise_on_error(response)
+
+        await asyncio.gather(
+            *(update(advice_id, embedding)
+              for advice_id, embedding in embeddings.items())
+        )
@@ -4,7 +4,8 @@ from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from fastapi.responses import JSONResponse
 
 from app.models.advice import AdviceRequestContext, AdviceResponsePayload, UserIdentifier
-from app.services.advice_service import AdviceService, get_advice_service
+from app.services.advice_service import AdviceService
+from app.services.registry import get_advice_service
 from app.services.advice_selection import AdviceNotFoundError
 
 router = APIRouter(prefix="/advice", tags=["advice"])
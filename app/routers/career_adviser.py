@@ -4,7 +4,7 @@ from typing import Literal
 
 from fastapi import APIRouter, HTTPException, Query
 
-from app.integrations.supabase import create_supabase_async_client
+from app.integrations.supabase import get_supabase_async_client
 from app.models.tests import PSYCHO_TRAITS, VOCATION_TRAITS
 from app.repositories.job_demand_repository import (
     DemandLevel,
@@ -21,8 +21,7 @@ logger = logging.getLogger(__name__)
 
 
 def _get_test_repository() -> TestRepository:
-    client = create_supabase_async_client()
-    return TestRepository(client)
+    return TestRepository(get_supabase_async_client())
 
 
 def _map_demand_value_to_level(value: int) -> DemandLevel:
@@ -1,24 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
 
-from app.integrations.supabase import create_supabase_async_client
 from app.repositories.user_persona_repository import UserPersonaProvider
-from app.services.advice_service import build_user_persona_provider
+from app.services.registry import get_persona_provider
 
 router = APIRouter(prefix="/personas", tags=["personas"])
 
 
-def get_persona_repository() -> UserPersonaProvider:
-    client = create_supabase_async_client()
-    return build_user_persona_provider(client)
-
-
 @router.get("", summary="Get user persona text")
 async def get_persona(
     user_id: str = Query(..., description="User ID"),
     persona_type: str = Query(
         "psychology", description="Type of persona: psychology, vocational, or tests"),
-    repo: UserPersonaProvider = Depends(get_persona_repository),
+    repo: UserPersonaProvider = Depends(get_persona_provider),
 ) -> dict:
     """Get the persona text for a user."""
     if persona_type == "psychology" or persona_type == "vocational":
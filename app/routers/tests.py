@@ -7,15 +7,12 @@ from app.models.tests import (
     VocationalTestRequest,
     VocationalTestResultsResponse,
 )
-from app.services.test_service import TestProcessingService, build_test_processing_service
+from app.services.registry import get_test_service
+from app.services.test_service import TestProcessingService
 
 router = APIRouter(prefix="/tests", tags=["tests"])
 
 
-def get_test_service() -> TestProcessingService:
-    return build_test_processing_service()
-
-
 @router.post(
     "/psychology",
     response_model=TestSubmissionResponse,
@@ -0,0 +1,558 @@
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Literal, Sequence
+
+import numpy as np
+
+from app.integrations.embeddings import embedding_text_hash
+from app.models.advice import Advice, AdviceKind
+from app.services.ann_index import IVFIndex
+from app.services.vector_math import (
+    VECTOR_DTYPE,
+    get_storage_dtype,
+    normalize_rows,
+    normalize_vector,
+    score_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+_KIND_CODES: dict[AdviceKind, int] = {
+    kind: code for code, kind in enumerate(AdviceKind)
+}
+# Rows dequantized to float32 at a time during the int8 first pass.
+_INT8_BLOCK_ROWS = 512
+# Rows compared at a time when looking for changed vectors between indexes.
+_COMPARE_BLOCK_ROWS = 4096
+# Spare rows allocated past the catalog size: a fraction of it, at least
+# the minimum, so small deltas never have to move the matrix.
+_SPARE_ROWS_DIVISOR = 4
+_MIN_SPARE_ROWS = 64
+# Kind code of a free row.
+_FREE_KIND = -1
+# Retrain IVF centroids once the catalog outgrows this multiple of the
+# size they were trained on; lists get too long to stay fast otherwise.
+_IVF_RETRAIN_GROWTH = 2.0
+
+Quantization = Literal["none", "int8"]
+AnnBackend = Literal["none", "ivf"]
+
+DEFAULT_RESCORE_PATH = (
+    Path(__file__).parent.parent.parent / "data" / "cache" / "advice_rescore.npy"
+)
+DEFAULT_ANN_SNAPSHOT_PATH = (
+    Path(__file__).parent.parent.parent / "data" / "cache" / "advice_ivf.npz"
+)
+
+
+def advice_embedding_text(advice: Advice) -> str:
+    """Text embedded for an advice in the embedding selection mode."""
+    return f"Rodzaj: {advice.kind.value}\n{advice.description}"
+
+
+def advice_embedding_hash(advice: Advice) -> str:
+    """Hash of `advice_embedding_text`, stored next to the embedding."""
+    return embedding_text_hash(advice_embedding_text(advice))
+
+
+def is_embedding_stale(advice: Advice, model: str) -> bool:
+    """
+    True when the stored embedding of `advice` was computed by another model
+    or from another text (untagged legacy embeddings count as stale).
+    """
+    return (
+        advice.embedding_model != model
+        or advice.embedding_text_hash != advice_embedding_hash(advice)
+    )
+
+
+@dataclass(frozen=True)
+class AdviceIndexSettings:
+    """
+    - `quantization`: `none` keeps one float matrix; `int8` keeps per-row
+      scaled int8 codes for the first pass and re-scores the best
+      `rescore_candidates` rows exactly.
+    - `rescore_path`: where the exact vectors of an int8 index are written
+      and memory-mapped from (`None` keeps them in RAM).
+    - `ann`: `ivf` narrows the search to the `ivf_nprobe` closest of
+      `ivf_nlist` clusters (0 = about 4·√N) once the catalog has at least
+      `ann_min_size` advices; smaller catalogs are always scanned exactly.
+    - `ann_snapshot_path`: trained IVF centroids, reused after a restart.
+    """
+
+    quantization: Quantization = "none"
+    rescore_candidates: int = 48
+    rescore_path: Path | None = None
+    ann: AnnBackend = "none"
+    ann_min_size: int = 2000
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 8
+    ann_snapshot_path: Path | None = None
+
+    @classmethod
+    def from_env(cls) -> "AdviceIndexSettings":
+        quantization = (
+            os.getenv("ADVICE_INDEX_QUANTIZATION") or "none").strip().lower()
+        if quantization not in ("none", "int8"):
+            logger.warning(
+                "Unknown ADVICE_INDEX_QUANTIZATION '%s', using none.", quantization)
+            quantization = "none"
+        ann = (os.getenv("ADVICE_INDEX_ANN") or "none").strip().lower()
+        if ann not in ("none", "ivf"):
+            logger.warning("Unknown ADVICE_INDEX_ANN '%s', using none.", ann)
+            ann = "none"
+        # Unset -> default file; set to an empty string -> keep vectors in RAM.
+        rescore_path = os.environ.get(
+            "ADVICE_INDEX_RESCORE_PATH", str(DEFAULT_RESCORE_PATH))
+        # Unset -> default file; set to an empty string -> no snapshot.
+        snapshot_path = os.environ.get(
+            "ADVICE_INDEX_ANN_SNAPSHOT_PATH", str(DEFAULT_ANN_SNAPSHOT_PATH))
+        return cls(
+            quantization=quantization,  # type: ignore[arg-type]
+            rescore_candidates=int(
+                os.getenv("ADVICE_INDEX_RESCORE_CANDIDATES", "48") or 48),
+            rescore_path=Path(rescore_path) if rescore_path else None,
+            ann=ann,  # type: ignore[arg-type]
+            ann_min_size=int(os.getenv("ADVICE_INDEX_ANN_MIN_SIZE", "2000") or 2000),
+            ivf_nlist=int(os.getenv("ADVICE_INDEX_IVF_NLIST", "0") or 0),
+            ivf_nprobe=int(os.getenv("ADVICE_INDEX_IVF_NPROBE", "8") or 8),
+            ann_snapshot_path=Path(snapshot_path) if snapshot_path else None,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_advice_index_settings() -> AdviceIndexSettings:
+    return AdviceIndexSettings.from_env()
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes and float32 scales (row ≈ codes * scale)."""
+    matrix = np.asarray(matrix, dtype=VECTOR_DTYPE)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0.0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(VECTOR_DTYPE)
+
+
+def _score_int8(
+    codes: np.ndarray, scales: np.ndarray, query: np.ndarray
+) -> np.ndarray:
+    scores = np.empty(len(codes), dtype=VECTOR_DTYPE)
+    for start in range(0, len(codes), _INT8_BLOCK_ROWS):
+        block = codes[start:start + _INT8_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(VECTOR_DTYPE) @ query
+    return scores * scales
+
+
+def _memory_map(matrix: np.ndarray, path: Path) -> np.ndarray:
+    """
+    Writes `matrix` next to `path`, atomically replaces it (an older index
+    that still maps the previous file keeps working) and maps it writable,
+    so catalog deltas update rows in place.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=path.stem, suffix=".npy", delete=False
+    ) as handle:
+        np.save(handle, matrix)
+    os.replace(handle.name, path)
+    return np.load(path, mmap_mode="r+")
+
+
+def _capacity(size: int) -> int:
+    """Rows allocated for `size` advices, leaving room for catalog growth."""
+    return size + max(size // _SPARE_ROWS_DIVISOR, _MIN_SPARE_ROWS) if size else 0
+
+
+class AdviceVectorIndex:
+    """
+    Embeddings of the whole advice catalog in one contiguous matrix (float32,
+    or float16 per `EMBEDDING_STORAGE_DTYPE`).
+
+    Rows are unit length, so scoring a query against every advice is a single
+    matrix-vector product. A parallel kind column allows masking by
+    `AdviceKind`, and top-k selection uses `argpartition`, so a request never
+    touches advices one by one.
+
+    In `int8` mode only the quantized codes stay resident; the exact vectors
+    are consulted for the best `rescore_candidates` rows of the first pass.
+
+    With `ann="ivf"` an `IVFIndex` picks the candidate rows first. Passing the
+    `previous` index lets a rebuild keep its trained centroids and only
+    re-assign advices that were added or whose vector changed; centroids of
+    another `model_tag` or size are never reused.
+
+    The matrix keeps spare rows: `apply_changes` writes changed advices into
+    their rows (or free ones) in place and frees the rows of removed advices,
+    so a catalog delta costs its own size rather than the catalog's.
+    """
+
+    def __init__(
+        self,
+        advices: Sequence[Advice],
+        vectors: Sequence[Sequence[float]] | np.ndarray,
+        *,
+        settings: AdviceIndexSettings | None = None,
+        dtype: type[np.floating] | None = None,
+        previous: AdviceVectorIndex | None = None,
+        model_tag: str | None = None,
+    ) -> None:
+        if len(advices) != len(vectors):
+            raise ValueError(
+                f"Got {len(advices)} advices for {len(vectors)} vectors.")
+        self._settings = settings or get_advice_index_settings()
+        self._model_tag = model_tag
+        advices = tuple(advices)
+        dtype = dtype or get_storage_dtype()
+        if advices:
+            matrix = normalize_rows(vectors, dtype)
+        else:
+            matrix = np.empty((0, 0), dtype=dtype)
+        self._allocate(advices, matrix)
+        self._ann: IVFIndex | None = None
+        if self._wants_ann():
+            self._ann = self._build_ivf(previous)
+
+    def apply_changes(
+        self,
+        upserts: Sequence[tuple[Advice, Sequence[float]]],
+        removed_ids: Iterable[int] = (),
+    ) -> None:
+        """
+        Drops `removed_ids` and adds or replaces `upserts` in place. Only the
+        changed rows are normalized, quantized and written (into the mapped
+        rescore file in `int8` mode), and IVF re-assigns only them.
+        """
+        upserts = [(advice, vector) for advice, vector in upserts
+                   if advice.id is not None]
+        if not self.dimensions:
+            # Nothing to patch yet: the first vectors fix the row size.
+            advices = tuple(advice for advice, _ in upserts)
+            if advices:
+                self._allocate(advices, normalize_rows(
+                    [vector for _, vector in upserts], self._matrix.dtype.type))
+                self._update_ann((), [advice.id for advice in advices])  # type: ignore[misc]
+            return
+        replaced = {advice.id for advice, _ in upserts}
+        dropped = [advice_id for advice_id in dict.fromkeys(removed_ids)
+                   if advice_id not in replaced and advice_id in self._positions]
+        for advice_id in dropped:
+            position = self._positions.pop(advice_id)
+            self._advices[position] = None
+            self._kinds[position] = _FREE_KIND
+            self._free.append(position)
+        self._size -= len(dropped)
+        added = len(replaced - self._positions.keys())
+        if added > len(self._free):
+            self._grow(_capacity(self._size + added))
+        slots: list[int] = []
+        for advice, _ in upserts:
+            position = self._positions.get(advice.id)  # type: ignore[arg-type]
+            if position is None:
+                position = self._free.pop()
+                self._positions[advice.id] = position  # type: ignore[index]
+                self._size += 1
+            self._advices[position] = advice
+            self._kinds[position] = _KIND_CODES[advice.kind]
+            slots.append(position)
+        if slots:
+            fresh = normalize_rows(
+                [vector for _, vector in upserts], self._matrix.dtype.type)
+            self._matrix[slots] = fresh
+            if self._codes is not None and self._scales is not None:
+                self._codes[slots], self._scales[slots] = quantize_int8(fresh)
+        self._live = None
+        self._listing = None
+        self._update_ann(dropped, [advice.id for advice, _ in upserts])  # type: ignore[misc]
+
+    def _allocate(self, advices: tuple[Advice, ...], matrix: np.ndarray) -> None:
+        size = len(advices)
+        capacity = _capacity(size)
+        self._advices: list[Advice | None] = [*advices, *([None] * (capacity - size))]
+        self._kinds = np.full(capacity, _FREE_KIND, dtype=np.int16)
+        self._kinds[:size] = [_KIND_CODES[advice.kind] for advice in advices]
+        buffer = np.zeros((capacity, matrix.shape[1]), dtype=matrix.dtype)
+        buffer[:size] = matrix
+        self._codes: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        if self._settings.quantization == "int8" and size:
+            self._codes = np.zeros(buffer.shape, dtype=np.int8)
+            self._scales = np.ones(capacity, dtype=VECTOR_DTYPE)
+            self._codes[:size], self._scales[:size] = quantize_int8(matrix)
+        self._matrix = self._place(buffer)
+        self._positions = {
+            advice.id: position
+            for position, advice in enumerate(advices)
+            if advice.id is not None
+        }
+        self._size = size
+        # Popped from the end, so the lowest free rows are reused first.
+        self._free = list(range(capacity - 1, size - 1, -1))
+        self._live: np.ndarray | None = None
+        self._listing: tuple[Advice, ...] | None = None
+
+    def _grow(self, capacity: int) -> None:
+        """Moves the rows into larger buffers; amortized over many deltas."""
+        old = len(self._advices)
+        capacity = max(capacity, 2 * old)
+        self._advices.extend([None] * (capacity - old))
+        self._kinds = np.concatenate(
+            [self._kinds, np.full(capacity - old, _FREE_KIND, dtype=np.int16)])
+        buffer = np.zeros((capacity, self.dimensions), dtype=self._matrix.dtype)
+        buffer[:old] = self._matrix
+        self._matrix = self._place(buffer)
+        if self._codes is not None and self._scales is not None:
+            codes = np.zeros(buffer.shape, dtype=np.int8)
+            codes[:old] = self._codes
+            scales = np.ones(capacity, dtype=VECTOR_DTYPE)
+            scales[:old] = self._scales
+            self._codes, self._scales = codes, scales
+        self._free[:0] = range(capacity - 1, old - 1, -1)
+
+    def _place(self, buffer: np.ndarray) -> np.ndarray:
+        path = self._settings.rescore_path
+        if self._settings.quantization == "int8" and path is not None and len(buffer):
+            return _memory_map(buffer, path)
+        return buffer
+
+    @property
+    def advices(self) -> tuple[Advice, ...]:
+        if self._listing is None:
+            self._listing = tuple(
+                advice for advice in self._advices if advice is not None)
+        return self._listing
+
+    @property
+    def quantization(self) -> Quantization:
+        return "int8" if self._codes is not None else "none"
+
+    @property
+    def ann(self) -> IVFIndex | None:
+        return self._ann
+
+    @property
+    def model_tag(self) -> str | None:
+        return self._model_tag
+
+    @property
+    def dimensions(self) -> int:
+        return int(self._matrix.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes; a memory-mapped exact matrix is not counted."""
+        total = self._kinds.nbytes
+        if self._codes is not None and self._scales is not None:
+            total += self._codes.nbytes + self._scales.nbytes
+        if not isinstance(self._matrix, np.memmap):
+            total += self._matrix.nbytes
+        return int(total)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, advice_id: object) -> bool:
+        return advice_id in self._positions
+
+    def get(self, advice_id: int) -> Advice | None:
+        position = self._positions.get(advice_id)
+        return None if position is None else self._advices[position]
+
+    def vector(self, advice_id: int) -> np.ndarray | None:
+        position = self._positions.get(advice_id)
+        # A copy: the row is overwritten in place when the advice changes.
+        return None if position is None else np.array(self._matrix[position])
+
+    def count(self, kind: AdviceKind | None = None) -> int:
+        if kind is None:
+            return self._size
+        return int(np.count_nonzero(self._kinds == _KIND_CODES[kind]))
+
+    def top_k(
+        self,
+        query: Sequence[float] | np.ndarray,
+        k: int,
+        *,
+        kind: AdviceKind | None = None,
+        min_score: float | None = None,
+    ) -> list[tuple[Advice, float]]:
+        """
+        Returns up to `k` advices most similar to `query`, best first,
+        optionally restricted to one kind and to scores >= `min_score`.
+        """
+        if not self._size or k <= 0:
+            return []
+        normalized = normalize_vector(query)
+        if kind is not None:
+            candidates = np.flatnonzero(self._kinds == _KIND_CODES[kind])
+        else:
+            candidates = self._live_positions()
+        probed = self._probe(normalized, kind, k)
+        if probed is not None:
+            candidates = probed
+        if candidates.size == 0:
+            return []
+
+        if self._codes is not None and self._scales is not None:
+            # First pass on int8 codes, then exact scores for the shortlist.
+            if probed is not None:
+                approximate = np.zeros(len(self._kinds), dtype=VECTOR_DTYPE)
+                approximate[candidates] = _score_int8(
+                    self._codes[candidates], self._scales[candidates], normalized)
+            else:
+                approximate = _score_int8(self._codes, self._scales, normalized)
+            candidates = self._best(
+                candidates, approximate, max(k, self._settings.rescore_candidates)
+            )
+            scores = np.zeros(len(self._kinds), dtype=VECTOR_DTYPE)
+            scores[candidates] = score_rows(
+                np.asarray(self._matrix[candidates]), normalized)
+        elif probed is not None:
+            scores = np.zeros(len(self._kinds), dtype=VECTOR_DTYPE)
+            scores[candidates] = score_rows(self._matrix[candidates], normalized)
+        else:
+            scores = score_rows(self._matrix, normalized)
+
+        if min_score is not None:
+            candidates = candidates[scores[candidates] >= min_score]
+        if candidates.size == 0:
+            return []
+        candidates = self._best(candidates, scores, k)
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            (self._advices[position], float(scores[position]))  # type: ignore[misc]
+            for position in ordered.tolist()
+        ]
+
+    def _live_positions(self) -> np.ndarray:
+        if self._live is None:
+            self._live = np.flatnonzero(self._kinds != _FREE_KIND)
+        return self._live
+
+    def _probe(
+        self, query: np.ndarray, kind: AdviceKind | None, k: int
+    ) -> np.ndarray | None:
+        """
+        Rows in the IVF lists closest to `query`, or `None` for an exact scan
+        (no ANN, or the probed lists hold fewer than `k` advices of the kind).
+        """
+        if self._ann is None:
+            return None
+        positions = self._lookup(self._ann.candidates(query))
+        if kind is not None:
+            positions = positions[self._kinds[positions] == _KIND_CODES[kind]]
+        if positions.size < k:
+            return None
+        return positions
+
+    def _lookup(self, advice_ids: np.ndarray) -> np.ndarray:
+        positions = self._positions
+        return np.fromiter(
+            (positions[advice_id] for advice_id in advice_ids.tolist()
+             if advice_id in positions),
+            dtype=np.int64,
+        )
+
+    def _wants_ann(self) -> bool:
+        return (
+            self._settings.ann == "ivf"
+            and len(self._positions) >= max(self._settings.ann_min_size, 1)
+        )
+
+    def _update_ann(self, removed: Sequence[int], changed: Sequence[int]) -> None:
+        """Keeps IVF in step with `apply_changes`, retraining only when needed."""
+        if not self._wants_ann():
+            self._ann = None
+        elif self._ann is None or not self._can_reuse(self._ann):
+            self._ann = self._build_ivf(None)
+        else:
+            self._ann.remove(removed)
+            self._ann.add(changed, self._rows(changed))
+
+    def _build_ivf(self, previous: AdviceVectorIndex | None) -> IVFIndex:
+        settings = self._settings
+        ids = list(self._positions)
+        base = previous.ann if previous is not None else None
+        if base is not None and not self._can_reuse(base):
+            base = None
+        if base is not None and previous is not None:
+            ivf = base.copy()
+            ivf.remove(ivf.keys() - self._positions.keys())
+            changed = self._changed_ids(previous)
+            ivf.add(changed, self._rows(changed))
+            logger.info(
+                "IVF index updated incrementally: %d advices re-assigned.",
+                len(changed),
+            )
+            return ivf.with_nprobe(settings.ivf_nprobe)
+
+        ivf = None
+        snapshot = settings.ann_snapshot_path
+        if snapshot is not None and snapshot.exists():
+            try:
+                ivf = IVFIndex.load(snapshot, nprobe=settings.ivf_nprobe)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("Cannot read IVF snapshot %s: %s", snapshot, exc)
+            if ivf is not None and not self._can_reuse(ivf):
+                ivf = None
+        if ivf is None:
+            ivf = IVFIndex.train(
+                self._rows(ids),
+                nlist=settings.ivf_nlist or None,
+                nprobe=settings.ivf_nprobe,
+                model_tag=self._model_tag,
+            )
+            logger.info(
+                "Trained IVF index: %d lists for %d advices.", ivf.nlist, len(ids))
+            if snapshot is not None:
+                try:
+                    ivf.save(snapshot)
+                except OSError as exc:
+                    logger.warning(
+                        "Cannot write IVF snapshot %s: %s", snapshot, exc)
+        ivf.add(ids, self._rows(ids))
+        return ivf
+
+    def _can_reuse(self, ivf: IVFIndex) -> bool:
+        # Centroids from another embedding space would scatter the advices
+        # over meaningless lists even when the sizes happen to match.
+        return (
+            ivf.model_tag == self._model_tag
+            and ivf.dimensions == self.dimensions
+            and len(self._positions) <= ivf.trained_size * _IVF_RETRAIN_GROWTH
+            and (not self._settings.ivf_nlist or ivf.nlist == self._settings.ivf_nlist)
+        )
+
+    def _rows(self, advice_ids: Sequence[int]) -> np.ndarray:
+        positions = [self._positions[advice_id] for advice_id in advice_ids]
+        return np.asarray(self._matrix[positions], dtype=VECTOR_DTYPE)
+
+    def _changed_ids(self, previous: AdviceVectorIndex) -> list[int]:
+        """Ids that are new in this index or whose vector differs."""
+        changed = [
+            advice_id for advice_id in self._positions if advice_id not in previous
+        ]
+        common = [advice_id for advice_id in self._positions if advice_id in previous]
+        for start in range(0, len(common), _COMPARE_BLOCK_ROWS):
+            block = common[start:start + _COMPARE_BLOCK_ROWS]
+            ours = self._rows(block)
+            theirs = previous._rows(block)
+            if ours.shape != theirs.shape:
+                return list(self._positions)
+            differs = np.any(ours != theirs, axis=1)
+            changed.extend(
+                advice_id for advice_id, flag in zip(block, differs) if flag)
+        return changed
+
+    @staticmethod
+    def _best(candidates: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+        if candidates.size <= k:
+            return candidates
+        best = np.argpartition(-scores[candidates], k - 1)[:k]
+        return candidates[best]
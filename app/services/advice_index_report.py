@@ -0,0 +1,180 @@
+"""
+Recall-vs-memory report for the advice vector index settings.
+
+Compares every index variant (float32, float16, int8 with several re-scoring
+shortlist sizes, IVF with several probe counts) against exact float32 search
+and prints recall@k, resident memory and query latency, so a deployment can
+pick its `EMBEDDING_STORAGE_DTYPE` / `ADVICE_INDEX_QUANTIZATION` /
+`ADVICE_INDEX_RESCORE_CANDIDATES` / `ADVICE_INDEX_ANN` /
+`ADVICE_INDEX_IVF_NPROBE`:
+
+    python -m app.services.advice_index_report            # catalog from Supabase
+    python -m app.services.advice_index_report --synthetic 5000 --dimensions 3072
+
+Queries are catalog vectors perturbed with Gaussian noise, which mimics a
+user message that is close to, but not identical with, an advice.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from app.models.advice import Advice, AdviceKind
+from app.services import vector_math
+from app.services.advice_index import AdviceIndexSettings, AdviceVectorIndex
+
+
+async def _load_catalog_matrix() -> np.ndarray:
+    from app.integrations.supabase import (
+        close_supabase_async_client,
+        get_supabase_async_client,
+    )
+    from app.repositories.advice_repository import EmbeddingUpdatableAdviceRepository
+
+    repository = EmbeddingUpdatableAdviceRepository(get_supabase_async_client())
+    try:
+        _, matrix = await repository.load_embedding_matrix()
+    finally:
+        await close_supabase_async_client()
+    return matrix
+
+
+def _synthetic_matrix(size: int, dimensions: int, clusters: int) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(clusters, dimensions))
+    members = rng.integers(0, clusters, size=size)
+    return (centers[members] + rng.normal(
+        scale=0.7, size=(size, dimensions))).astype(np.float32)
+
+
+def run_report(
+    matrix: np.ndarray,
+    *,
+    queries: int = 200,
+    k: int = 6,
+    noise: float = 1.0,
+    rescore_sizes: Sequence[int] = (6, 12, 24, 48, 96),
+    nprobes: Sequence[int] = (1, 4, 8, 16, 32),
+    nlist: int = 0,
+    seed: int = 0,
+) -> list[dict[str, float | str]]:
+    rng = np.random.default_rng(seed)
+    kinds = list(AdviceKind)
+    advices = [
+        Advice(name=f"advice-{index}", kind=kinds[index % len(kinds)],
+               description="", id=index)
+        for index in range(len(matrix))
+    ]
+    normalized = vector_math.normalize_rows(matrix)
+    picks = rng.integers(0, len(matrix), size=queries)
+    query_vectors = normalized[picks] + rng.normal(
+        scale=noise / np.sqrt(matrix.shape[1]), size=(queries, matrix.shape[1])
+    ).astype(np.float32)
+
+    reference = AdviceVectorIndex(
+        advices, matrix, settings=AdviceIndexSettings(), dtype=np.float32)
+    expected = [
+        {advice.id for advice, _ in reference.top_k(query, k)}
+        for query in query_vectors
+    ]
+
+    # Rescore memmaps are as large as the catalog; removed with the directory.
+    with tempfile.TemporaryDirectory(prefix="advice-index-report-") as directory:
+        rescore_dir = Path(directory)
+        variants: list[tuple[str, type[np.floating], AdviceIndexSettings]] = [
+            ("float32", np.float32, AdviceIndexSettings()),
+            ("float16", np.float16, AdviceIndexSettings()),
+        ]
+        for size in rescore_sizes:
+            variants.append((
+                f"int8+rescore{size}",
+                np.float16,
+                AdviceIndexSettings(
+                    quantization="int8",
+                    rescore_candidates=size,
+                    rescore_path=rescore_dir / f"rescore-{size}.npy",
+                ),
+            ))
+        for nprobe in nprobes:
+            variants.append((
+                f"ivf+nprobe{nprobe}",
+                np.float32,
+                AdviceIndexSettings(
+                    ann="ivf", ann_min_size=1, ivf_nlist=nlist, ivf_nprobe=nprobe),
+            ))
+
+        rows: list[dict[str, float | str]] = []
+        trained: AdviceVectorIndex | None = None
+        for name, dtype, settings in variants:
+            # IVF variants share one set of centroids and differ only in nprobe.
+            index = AdviceVectorIndex(
+                advices, matrix, settings=settings, dtype=dtype, previous=trained)
+            if index.ann is not None:
+                trained = index
+            started = time.perf_counter()
+            found = [
+                {advice.id for advice, _ in index.top_k(query, k)}
+                for query in query_vectors
+            ]
+            elapsed = time.perf_counter() - started
+            recall = float(np.mean([
+                len(got & want) / max(len(want), 1)
+                for got, want in zip(found, expected)
+            ]))
+            rows.append({
+                "variant": name,
+                f"recall@{k}": recall,
+                "resident_mib": index.nbytes / 2**20,
+                "ms_per_query": elapsed * 1000 / max(queries, 1),
+            })
+    return rows
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Raport recall vs pamięć dla indeksu embeddingów porad.")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="liczba losowych wektorów zamiast katalogu z Supabase")
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--clusters", type=int, default=0,
+                        help="liczba skupisk w danych syntetycznych "
+                             "(0 = ok. N/50; embeddingi tekstów nie są jednorodne)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--noise", type=float, default=1.0,
+                        help="odległość zapytań od porad (względem długości wektora)")
+    parser.add_argument("--nlist", type=int, default=0,
+                        help="liczba list IVF (0 = ok. 4·√N)")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        matrix = _synthetic_matrix(
+            args.synthetic, args.dimensions, args.clusters or max(args.synthetic // 50, 1))
+    else:
+        matrix = asyncio.run(_load_catalog_matrix())
+    if not len(matrix):
+        print("Brak embeddingów do porównania.")
+        return 1
+
+    rows = run_report(matrix, queries=args.queries, k=args.k, noise=args.noise,
+                      nlist=args.nlist)
+    print(f"{len(matrix)} porad x {matrix.shape[1]} wymiarów, {args.queries} zapytań")
+    header = list(rows[0])
+    print("  ".join(f"{column:>18}" for column in header))
+    for row in rows:
+        print("  ".join(
+            f"{value:>18.4f}" if isinstance(value, float) else f"{value:>18}"
+            for value in row.values()
+        ))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
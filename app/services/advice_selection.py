@@ -7,23 +7,52 @@ import os
 import random
 import re
 import sys
+import time
 import unicodedata
 from collections import Counter, OrderedDict
-from typing import TYPE_CHECKING, Any, Callable, Mapping, Protocol, Sequence, cast
+from contextvars import ContextVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Mapping,
+    Protocol,
+    Sequence,
+    cast,
+)
+
+import numpy as np
 
 from app.models.advice import Advice, AdviceKind, AdviceRecommendation, AdviceRequestContext
 from app.repositories.advice_repository import (
     AdviceRepository,
+    AdviceVectorSearch,
     EmbeddingUpdatableAdviceRepository,
 )
+from app.repositories.advice_catalog import AdviceCatalogUpdate
 from app.repositories.category_repository import AdviceCategoryRepository
+from app.integrations.embeddings import (
+    EmbeddingProvider,
+    create_embedding_provider,
+    start_message_embedding_scope,
+)
 from app.integrations.openai import (
     OpenAISettings,
     create_async_openai_client,
+    create_chat_completion,
     get_openai_settings,
     get_reasoning_effort,
 )
 from app.repositories.user_persona_repository import UserPersonaProvider
+from app.services.advice_index import (
+    AdviceVectorIndex,
+    advice_embedding_hash,
+    advice_embedding_text,
+    is_embedding_stale,
+)
+from app.services.definition_embeddings import embed_definitions
+from app.services.vector_math import VectorMatrix
 
 if TYPE_CHECKING:  # pragma: no cover - typing helper
     from openai import AsyncOpenAI as OpenAIClient  # type: ignore[import]
@@ -37,6 +66,53 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Pipelines are shared by the whole process, so the per-request event log lives
+# in the request's context instead of on the pipeline instance.
+_REQUEST_EVENTS: ContextVar[list[str] | None] = ContextVar(
+    "advice_request_events", default=None
+)
+
+
+def _start_request_events() -> None:
+    _REQUEST_EVENTS.set([])
+
+
+def _get_request_events() -> Sequence[str]:
+    return tuple(_REQUEST_EVENTS.get() or ())
+
+
+def _record_request_event(message: str) -> None:
+    events = _REQUEST_EVENTS.get()
+    if events is not None:
+        events.append(message)
+    logger.info(message)
+
+
+async def _warm_up_component(name: str, component: object) -> Mapping[str, bool]:
+    """Runs the optional `warm_up()` hook of a pipeline stage."""
+    warm_up = getattr(component, "warm_up", None)
+    if not callable(warm_up):
+        return {}
+    try:
+        return await warm_up()
+    except Exception as exc:  # pragma: no cover - network guard
+        logger.warning("Warm-up of %s failed: %s", name, exc)
+        return {name: False}
+
+
+async def _cancel_tasks(tasks: Iterable[asyncio.Task[Any] | None]) -> None:
+    """Cancels background tasks and waits until they have finished."""
+    pending = [task for task in tasks if task is not None and not task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _close_catalog(repository: object) -> None:
+    catalog = getattr(repository, "catalog", None)
+    if catalog is not None:
+        await catalog.aclose()
+
 
 @dataclass(frozen=True)
 class CategoryMatch:
@@ -108,7 +184,9 @@ class AdviceSelectionPipeline:
         self._category_frequency_cache: dict[str, int] | None = None
         self._total_advice_count: int = 0
         self._frequency_lock = asyncio.Lock()
-        self._latest_events: list[str] = []
+        catalog = getattr(advice_repository, "catalog", None)
+        if catalog is not None:
+            catalog.add_listener(self._on_catalog_update)
         if hasattr(self._response_generator, "set_log_sink"):
             try:
                 self._response_generator.set_log_sink(
@@ -117,7 +195,8 @@ class AdviceSelectionPipeline:
                 pass
 
     async def recommend(self, request: AdviceRequestContext) -> AdviceRecommendation:
-        self._latest_events = []
+        _start_request_events()
+        start_message_embedding_scope()
         category_matches = await self._infer_categories(request.user_message)
         if not category_matches:
             self._record(
@@ -150,12 +229,30 @@ class AdviceSelectionPipeline:
         )
         return AdviceRecommendation(advice=advice, chat_response=chat_response)
 
+    async def aclose(self) -> None:
+        """Stops background refreshes of the catalog snapshot."""
+        await _close_catalog(self._advice_repository)
+
+    async def warm_up(self) -> Mapping[str, bool]:
+        status: dict[str, bool] = {}
+        status.update(await _warm_up_component(
+            "category_embeddings", self._category_classifier))
+        status.update(await _warm_up_component(
+            "intent_embeddings", self._intent_detector))
+        try:
+            await self._category_repository.get_all()
+            await self._ensure_category_frequencies()
+            status["advice_catalog"] = True
+        except Exception as exc:  # pragma: no cover - network guard
+            logger.warning("Warm-up of advice catalog failed: %s", exc)
+            status["advice_catalog"] = False
+        return status
+
     def get_latest_events(self) -> Sequence[str]:
-        return tuple(self._latest_events)
+        return _get_request_events()
 
     def _record(self, message: str) -> None:
-        self._latest_events.append(message)
-        logger.info(message)
+        _record_request_event(message)
 
     async def _infer_categories(self, user_message: str) -> Sequence[CategoryMatch]:
         inferred_matches = await self._category_classifier.infer_categories(
@@ -218,12 +315,9 @@ class AdviceSelectionPipeline:
 
         if not candidates:
             if matched_categories:
-                all_advice = await self._advice_repository.get_all()
-                candidates = tuple(
-                    advice
-                    for advice in all_advice
-                    if self._contains_any_category(advice, category_names)
-                )
+                catalog_index = await self._advice_repository.get_catalog_index()
+                candidates = catalog_index.with_any_category(
+                    category_names, casefold=True)
 
         if not candidates:
             candidates = await self._advice_repository.get_all()
@@ -244,15 +338,6 @@ class AdviceSelectionPipeline:
                 "Nie udało się wybrać porady na podstawie dostępnych kandydatów.")
         return selected
 
-    @staticmethod
-    def _contains_any_category(advice: Advice, categories: Sequence[str]) -> bool:
-        advice_categories = {category.lower()
-                             for category in advice.categories}
-        for category in categories:
-            if category.lower() in advice_categories:
-                return True
-        return False
-
     def _rank_candidates(
         self,
         candidates: Sequence[Advice],
@@ -406,21 +491,19 @@ class AdviceSelectionPipeline:
         async with self._frequency_lock:
             if self._category_frequency_cache is not None:
                 return
-            all_advice = await self._advice_repository.get_all()
-            counter: Counter[str] = Counter()
-            for advice in all_advice:
-                seen = set()
-                for category in advice.categories:
-                    normalized = category.lower()
-                    if normalized not in seen:
-                        counter[normalized] += 1
-                        seen.add(normalized)
-            self._category_frequency_cache = dict(counter)
-            self._total_advice_count = len(all_advice)
+            # Counted once per catalog version by the catalog index.
+            catalog_index = await self._advice_repository.get_catalog_index()
+            self._category_frequency_cache = dict(
+                catalog_index.category_frequencies)
+            self._total_advice_count = len(catalog_index)
             self._record(
                 f"Zaktualizowano częstotliwości kategorii na podstawie {self._total_advice_count} porad."
             )
 
+    def _on_catalog_update(self, update: AdviceCatalogUpdate) -> None:
+        # The snapshot's index already carries the patched frequencies.
+        self._category_frequency_cache = None
+
     def _log_weights(
         self,
         population: Sequence[Advice],
@@ -494,25 +577,67 @@ class PersonaEmbeddingAdviceSelectionPipeline:
             or os.getenv("OPENAI_ADVICE_EMBEDDING_MODEL")
             or settings.embeddings_model
         )
-
-        self._latest_events: list[str] = []
-        # In-memory cache keyed by advice id
-        # Embedding cache z limitem - używa OrderedDict dla LRU eviction
-        self._embedding_cache: OrderedDict[int,
-                                           tuple[float, ...]] = OrderedDict()
-        self._embedding_cache_max_size = int(
-            os.getenv("ADVICE_EMBEDDING_CACHE_SIZE", "20") or 20
+        self._embeddings: EmbeddingProvider = create_embedding_provider(
+            self._client,
+            self._embeddings_model,
+            dimensions=settings.embeddings_dimensions,
         )
+        self._similarity_threshold *= self._embeddings.similarity_scale
+
+        # ADVICE_RETRIEVAL_MODE: `local` (indeks w pamięci procesu) albo
+        # `database` (funkcja match_advices; do aplikacji trafia tylko TOP6).
+        self._retrieval_mode = (
+            os.getenv("ADVICE_RETRIEVAL_MODE") or "local").strip().lower()
+        if self._retrieval_mode not in ("local", "database"):
+            logger.warning(
+                "Unknown ADVICE_RETRIEVAL_MODE '%s', using local.",
+                self._retrieval_mode,
+            )
+            self._retrieval_mode = "local"
+        if self._retrieval_mode == "database" and not hasattr(
+            self._advice_repository, "match_advices"
+        ):
+            logger.warning(
+                "%s does not support database vector search, using local retrieval.",
+                type(self._advice_repository).__name__,
+            )
+            self._retrieval_mode = "local"
+        if self._retrieval_mode == "database" and self._embeddings.is_local:
+            # Vectors stored in the database come from another model.
+            logger.warning(
+                "Database vector search needs stored embeddings of the same "
+                "model; using local retrieval with EMBEDDING_PROVIDER=local.")
+            self._retrieval_mode = "local"
+
+        # Embeddingi całego katalogu w jednej macierzy float32, odświeżane
+        # w tle co ADVICE_INDEX_REFRESH_SECONDS (0 = tylko przy przebudowie).
+        self._advice_index: AdviceVectorIndex | None = None
+        self._advice_index_loaded_at = 0.0
+        self._index_lock = asyncio.Lock()
+        self._index_refresh_task: asyncio.Task[None] | None = None
+        self._index_refresh_seconds = float(
+            os.getenv("ADVICE_INDEX_REFRESH_SECONDS", "300") or 300
+        )
+        # Nieaktualne embeddingi (zmieniona porada lub model) są przeliczane
+        # w tle, najwyżej ADVICE_EMBEDDING_REFRESH_LIMIT na przebudowę indeksu.
+        self._stale_refresh_limit = int(
+            os.getenv("ADVICE_EMBEDDING_REFRESH_LIMIT", "500") or 0
+        )
+        self._stale_refresh_task: asyncio.Task[None] | None = None
+        # Delta sync katalogu (ADVICE_CATALOG_SYNC=delta) łata indeks zamiast
+        # przebudowywać go w całości.
+        self._catalog_update_tasks: set[asyncio.Task[None]] = set()
+        # Set by `aclose()`; no background task is started afterwards.
+        self._closed = False
+        catalog = getattr(self._advice_repository, "catalog", None)
+        if catalog is not None:
+            catalog.add_listener(self._on_catalog_update)
         # Zmniejszony limit result cache - LLM responses są długie
         self._cache_max_size = int(
             os.getenv("ADVICE_RESULT_CACHE_SIZE", "5") or 5)
         self._result_cache: OrderedDict[
             tuple[str, str], AdviceRecommendation
         ] = OrderedDict()
-        # Limit liczby porad przetwarzanych jednocześnie (dla oszczędności pamięci)
-        self._max_candidates_to_process = int(
-            os.getenv("ADVICE_MAX_CANDIDATES", "20") or 20
-        )
 
         if hasattr(self._response_generator, "set_log_sink"):
             try:
@@ -522,14 +647,44 @@ class PersonaEmbeddingAdviceSelectionPipeline:
                 pass
 
     def get_latest_events(self) -> Sequence[str]:
-        return tuple(self._latest_events)
+        return _get_request_events()
 
     def _record(self, message: str) -> None:
-        self._latest_events.append(message)
-        logger.info(message)
+        _record_request_event(message)
+
+    async def aclose(self) -> None:
+        """
+        Cancels and awaits the background index refresh, the stale embedding
+        refresh and pending catalog patches, then stops the catalog snapshot.
+        """
+        self._closed = True
+        await _cancel_tasks([
+            self._index_refresh_task,
+            self._stale_refresh_task,
+            *self._catalog_update_tasks,
+        ])
+        await _close_catalog(self._advice_repository)
+
+    async def warm_up(self) -> Mapping[str, bool]:
+        status: dict[str, bool] = {}
+        status.update(await _warm_up_component(
+            "intent_embeddings", self._intent_detector))
+        if self._retrieval_mode == "database":
+            # The catalog stays in the database; there is no index to build.
+            return status
+        try:
+            index = await self.refresh_advice_index()
+            status["advice_catalog"] = True
+        except Exception as exc:  # pragma: no cover - network guard
+            logger.warning("Warm-up of advice catalog failed: %s", exc)
+            status["advice_catalog"] = False
+            return status
+        status["advice_embeddings"] = bool(len(index))
+        return status
 
     async def recommend(self, request: AdviceRequestContext) -> AdviceRecommendation:
-        self._latest_events = []
+        _start_request_events()
+        start_message_embedding_scope()
         user_id = request.user_identifier.user_id
         if not user_id:
             self._record(
@@ -563,9 +718,14 @@ class PersonaEmbeddingAdviceSelectionPipeline:
             )
             return cached_result
 
-        # 1. Intent detection (kind)
-        intent_match = await self._intent_detector.detect_preferred_kind(
-            request.user_message
+        # 1-2. Intent detection (kind) embeds the raw message and the query
+        # embedding embeds it with a prefix (the similarity threshold and TOP6
+        # selection are tuned for that text). Started together, both lookups
+        # land in the same EmbeddingBatcher window: one upstream call.
+        embedding_input = f"Wiadomość użytkownika: {request.user_message}"
+        intent_match, query_embedding = await asyncio.gather(
+            self._intent_detector.detect_preferred_kind(request.user_message),
+            self._embed_text(embedding_input),
         )
         if intent_match:
             self._record(
@@ -576,106 +736,21 @@ class PersonaEmbeddingAdviceSelectionPipeline:
                 "Brak jednoznacznej prośby o konkretny rodzaj porady (kind) – rozważam wszystkie rodzaje."
             )
 
-        # 2. Build embedding input combining profiles and current message
-        embedding_input_lines = []
-        # embedding_input_lines = [
-        #     f"Profil psychologiczny użytkownika: {psych_profile}",
-        # ]
-        # if vocational_profile:
-        #     embedding_input_lines.append(
-        #         f"Profil zawodowy użytkownika: {vocational_profile}"
-        #     )
-        embedding_input_lines.append(
-            f"Wiadomość użytkownika: {request.user_message}")
-        embedding_input = "\n".join(embedding_input_lines)
-
-        query_embedding = await self._embed_text(embedding_input)
-        if not query_embedding:
+        if query_embedding is None or not query_embedding.size:
             self._record("Nie udało się wygenerować embeddingu dla żądania.")
             raise AdviceNotFoundError(
                 "Błąd podczas analizowania profilu użytkownika – spróbuj ponownie."
             )
 
-        # 3. Fetch candidate advices filtered by intent (kind), if recognised
-        if intent_match:
-            candidates = await self._advice_repository.get_by_kind(intent_match.kind)
-            if candidates:
-                self._record(
-                    f"Rozważam {len(candidates)} porad rodzaju {intent_match.kind.value}."
-                )
-            else:
-                self._record(
-                    f"Brak porad rodzaju {intent_match.kind.value} – rozważam pełny katalog."
-                )
+        # 3-4. Keep the TOP6 matches above the similarity threshold, restricted
+        # to the requested kind when the catalog has advices of that kind.
+        if self._retrieval_mode == "database":
+            top_candidates = await self._match_in_database(
+                query_embedding, intent_match)
         else:
-            candidates = ()
-
-        if not candidates:
-            candidates = await self._advice_repository.get_all()
-            self._record(
-                f"Rozpoznano łącznie {len(candidates)} porad w katalogu (bez filtrowania po kategoriach)."
-            )
-
-        # Ograniczenie liczby kandydatów dla oszczędności pamięci
-        original_count = len(candidates)
-        if len(candidates) > self._max_candidates_to_process:
-            candidates = list(candidates)[:self._max_candidates_to_process]
-            self._record(
-                f"Ograniczono liczbę kandydatów z {original_count} do {len(candidates)} "
-                f"(limit: {self._max_candidates_to_process}) dla oszczędności pamięci."
-            )
-
-        # Monitoring pamięci przed przetwarzaniem
-        cache_size = len(self._embedding_cache)
-        self._record(
-            f"📊 Pamięć: embedding_cache={cache_size}/{self._embedding_cache_max_size}, "
-            f"kandydaci={len(candidates)}"
-        )
-
-        # 4. Ensure advice embeddings exist (lazy cache + Supabase update)
-        similarities: list[tuple[Advice, float]] = []
-        for advice in candidates:
-            if advice.id is None:
-                # Should not happen for Supabase-backed repository, but be defensive
-                self._record(
-                    f"Porada '{advice.name}' nie ma identyfikatora – pomijam w trybie embeddingowym."
-                )
-                continue
-
-            vector = await self._get_or_create_advice_embedding(advice)
-            if not vector:
-                self._record(
-                    f"Nie udało się wygenerować embeddingu dla porady '{advice.name}' – pomijam."
-                )
-                continue
-            score = OpenAIEmbeddingCategoryClassifier._cosine_similarity(
-                query_embedding, vector
-            )
-            similarities.append((advice, score))
-
-        # Monitoring pamięci po przetworzeniu embeddings
-        final_cache_size = len(self._embedding_cache)
-        if final_cache_size != cache_size:
-            self._record(
-                f"📊 Pamięć po przetworzeniu: embedding_cache={final_cache_size}/{self._embedding_cache_max_size} "
-                f"(dodano {final_cache_size - cache_size} embeddings)"
-            )
-
-        if not similarities:
-            self._record(
-                "Żadna porada nie otrzymała poprawnego embeddingu – nie można nic zaproponować."
-            )
-            raise AdviceNotFoundError(
-                "Brak porad możliwych do dopasowania w trybie embeddingowym."
-            )
-
-        # 5. Filter by minimal similarity threshold
-        filtered = [
-            (advice, score)
-            for advice, score in similarities
-            if score >= self._similarity_threshold
-        ]
-        if not filtered:
+            top_candidates = await self._match_in_index(
+                query_embedding, intent_match)
+        if not top_candidates:
             self._record(
                 f"Wszystkie porady miały zbyt niski wynik podobieństwa (< {self._similarity_threshold:.2f})."
             )
@@ -683,14 +758,7 @@ class PersonaEmbeddingAdviceSelectionPipeline:
                 "Brak wystarczająco dopasowanej porady do profilu użytkownika."
             )
 
-        # Ograniczamy się do TOP5 dopasowań
-        filtered.sort(key=lambda item: item[1], reverse=True)
-        top_candidates = filtered[:6]
-
-        if not top_candidates:
-            raise AdviceNotFoundError("Brak kandydatów do wyboru.")
-
-        # 6. Probabilistic selection: waga zależy głównie od score'a
+        # 5. Probabilistic selection: waga zależy głównie od score'a
         # Znajdź najwyższy score dla normalizacji
         max_score = top_candidates[0][1]
         min_score = top_candidates[-1][1]
@@ -772,106 +840,389 @@ class PersonaEmbeddingAdviceSelectionPipeline:
         self._store_cached_result(cache_key, recommendation)
         return recommendation
 
-    async def _get_or_create_advice_embedding(
-        self, advice: Advice
-    ) -> tuple[float, ...]:
-        assert advice.id is not None
-        # Sprawdź cache (z LRU - przenieś na koniec jeśli istnieje)
-        if advice.id in self._embedding_cache:
-            # Przenieś na koniec (najnowsze użycie) dla LRU
-            vector = self._embedding_cache.pop(advice.id)
-            self._embedding_cache[advice.id] = vector
-            return vector
-
-        # If Supabase already has an embedding in the object, reuse it and cache locally
-        if advice.embedding:
-            vector = tuple(float(x) for x in advice.embedding)
-            # Dodaj do cache z LRU eviction
-            self._add_to_embedding_cache(advice.id, vector)
-            return vector
-
-        # Lazy load embedding z bazy (jeśli nie było w obiekcie Advice)
-        if isinstance(self._advice_repository, EmbeddingUpdatableAdviceRepository):
-            try:
-                db_embedding = await self._advice_repository.get_embedding(advice.id)
-                if db_embedding:
-                    vector = tuple(float(x) for x in db_embedding)
-                    # Dodaj do cache z LRU eviction
-                    self._add_to_embedding_cache(advice.id, vector)
-                    return vector
-            except Exception as exc:
+    async def _match_in_index(
+        self,
+        query_embedding: np.ndarray,
+        intent_match: AdviceIntentMatch | None,
+    ) -> list[tuple[Advice, float]]:
+        # Score the whole catalog at once in the in-process vector index.
+        index = await self._ensure_advice_index()
+        if not len(index):
+            self._record(
+                "Żadna porada nie otrzymała poprawnego embeddingu – nie można nic zaproponować."
+            )
+            raise AdviceNotFoundError(
+                "Brak porad możliwych do dopasowania w trybie embeddingowym."
+            )
+        if len(query_embedding) != index.dimensions:
+            self._record(
+                f"Embedding zapytania ma inny wymiar ({len(query_embedding)}) niż indeks porad ({index.dimensions})."
+            )
+            raise AdviceNotFoundError(
+                "Błąd podczas analizowania profilu użytkownika – spróbuj ponownie."
+            )
+
+        kind_filter: AdviceKind | None = None
+        if intent_match:
+            kind_count = index.count(intent_match.kind)
+            if kind_count:
+                kind_filter = intent_match.kind
                 self._record(
-                    f"Błąd pobierania embeddingu z bazy dla porady '{advice.name}': {exc}"
+                    f"Rozważam {kind_count} porad rodzaju {intent_match.kind.value}."
                 )
-
-        # Jeśli porada nie ma opisu w bazie, na razie ją pomijamy
-        description = advice.description or ""
-        if not description.strip():
+            else:
+                self._record(
+                    f"Brak porad rodzaju {intent_match.kind.value} – rozważam pełny katalog."
+                )
+        if kind_filter is None:
             self._record(
-                f"Porada '{advice.name}' nie ma opisu w bazie – pomijam w trybie embeddingowym."
+                f"Rozpoznano łącznie {len(index)} porad w katalogu (bez filtrowania po kategoriach)."
             )
-            return ()
+        return index.top_k(
+            query_embedding,
+            6,
+            kind=kind_filter,
+            min_score=self._similarity_threshold,
+        )
 
-        # Generuj nowy embedding
-        text = f"Rodzaj: {advice.kind.value}\n{description}"
-        try:
-            response = await self._client.embeddings.create(
-                model=self._embeddings_model,
-                input=[text],
+    async def _match_in_database(
+        self,
+        query_embedding: np.ndarray,
+        intent_match: AdviceIntentMatch | None,
+    ) -> list[tuple[Advice, float]]:
+        # Only the best rows leave the database; the catalog is never loaded.
+        search = cast(AdviceVectorSearch, self._advice_repository)
+        if intent_match:
+            # As in the local index: the kind filter holds unless the kind has
+            # no advices at all, even when none of them reaches the threshold.
+            kind_count, matches = await asyncio.gather(
+                search.count_matchable(intent_match.kind),
+                search.match_advices(
+                    query_embedding,
+                    6,
+                    kind=intent_match.kind,
+                    min_score=self._similarity_threshold,
+                ),
             )
-            embedding = tuple(response.data[0].embedding)
-        except Exception as exc:  # pragma: no cover - network guard
+            if kind_count:
+                self._record(
+                    f"Rozważam {kind_count} porad rodzaju {intent_match.kind.value}; "
+                    f"baza zwróciła {len(matches)}."
+                )
+                return list(matches)
             self._record(
-                f"Błąd generowania embeddingu dla porady '{advice.name}': {exc}"
+                f"Brak porad rodzaju {intent_match.kind.value} – rozważam pełny katalog."
             )
-            return ()
+        matches = await search.match_advices(
+            query_embedding, 6, min_score=self._similarity_threshold
+        )
+        self._record(
+            f"Baza zwróciła {len(matches)} porad (wyszukiwanie po stronie bazy)."
+        )
+        return list(matches)
+
+    async def refresh_advice_index(self) -> AdviceVectorIndex:
+        """
+        Reloads the catalog and rebuilds the vector index, reusing vectors of
+        advices whose kind and description did not change.
+        """
+        async with self._index_lock:
+            index = await self._build_advice_index(self._advice_index)
+            self._advice_index = index
+            self._advice_index_loaded_at = time.monotonic()
+            return index
+
+    async def _ensure_advice_index(self) -> AdviceVectorIndex:
+        index = self._advice_index
+        if index is None:
+            async with self._index_lock:
+                if self._advice_index is None:
+                    self._advice_index = await self._build_advice_index(None)
+                    self._advice_index_loaded_at = time.monotonic()
+                return self._advice_index
+        age = time.monotonic() - self._advice_index_loaded_at
+        if (
+            self._index_refresh_seconds > 0
+            and not self._closed
+            and age > self._index_refresh_seconds
+            and (self._index_refresh_task is None or self._index_refresh_task.done())
+        ):
+            # Serve the current index while a fresh one is built in the background.
+            self._index_refresh_task = asyncio.create_task(
+                self._refresh_advice_index_in_background()
+            )
+        return index
 
-        # Persist in Supabase as cache
-        if isinstance(self._advice_repository, EmbeddingUpdatableAdviceRepository):
-            try:
-                await self._advice_repository.update_embedding(advice.id, embedding)
-                self._record(
-                    f"Zapisano embedding w bazie dla porady '{advice.name}' (id={advice.id})."
+    async def _refresh_advice_index_in_background(self) -> None:
+        catalog = getattr(self._advice_repository, "catalog", None)
+        try:
+            if (
+                catalog is not None
+                and catalog.incremental
+                and catalog.watermark is not None
+            ):
+                # Deltas reach the index through `_on_catalog_update`.
+                await catalog.refresh()
+                self._advice_index_loaded_at = time.monotonic()
+                return
+            await self.refresh_advice_index()
+        except Exception as exc:  # pragma: no cover - network guard
+            logger.warning("Advice index refresh failed: %s", exc)
+            self._advice_index_loaded_at = time.monotonic()
+
+    async def _build_advice_index(
+        self, previous: AdviceVectorIndex | None
+    ) -> AdviceVectorIndex:
+        started = time.monotonic()
+        catalog = await self._advice_repository.get_all()
+        vectors: dict[int, Sequence[float]] = {}
+        advices: list[Advice] = []
+        for advice in catalog:
+            if advice.id is None:
+                # Should not happen for Supabase-backed repository, but be defensive
+                logger.info(
+                    "Porada '%s' nie ma identyfikatora – pomijam w trybie embeddingowym.",
+                    advice.name,
                 )
-            except Exception as exc:  # pragma: no cover - defensive DB layer
-                self._record(
-                    f"Nie udało się zapisać embeddingu w bazie dla porady '{advice.name}': {exc}"
+                continue
+            advices.append(advice)
+            if advice.embedding and not self._embeddings.is_local:
+                vectors[advice.id] = advice.embedding
+                continue
+            previous_advice = previous.get(advice.id) if previous else None
+            if (
+                previous is not None
+                and previous_advice is not None
+                and self._same_embedding_version(previous_advice, advice)
+            ):
+                vectors[advice.id] = previous.vector(advice.id)  # type: ignore[assignment]
+
+        if self._embeddings.is_local:
+            # Lokalne embeddingi są tanie i nie trafiają do bazy - liczymy je tu.
+            await self._embed_catalog_locally(
+                [advice for advice in advices if advice.id not in vectors],
+                vectors,
+            )
+        else:
+            await self._load_stored_embeddings(
+                [advice for advice in advices if advice.id not in vectors],
+                vectors,
+                whole_catalog=previous is None,
+            )
+        missing = [advice.name for advice in advices if advice.id not in vectors]
+        if missing:
+            # Embeddingi katalogu liczy offline `python -m app.services.embedding_backfill`,
+            # żeby żądanie użytkownika nigdy za nie nie płaciło.
+            logger.warning(
+                "Pomijam %d porad bez embeddingu (uruchom backfill): %s",
+                len(missing),
+                ", ".join(missing[:20]),
+            )
+
+        indexed = [advice for advice in advices if advice.id in vectors]
+        if indexed:
+            # Vectors of another size (other model or OPENAI_EMBEDDINGS_DIMENSIONS)
+            # cannot be compared with the query; backfill re-embeds them.
+            dimensions = self._embeddings.dimensions or Counter(
+                len(vectors[advice.id]) for advice in indexed  # type: ignore[index]
+            ).most_common(1)[0][0]
+            skipped = [
+                advice.name for advice in indexed
+                if len(vectors[advice.id]) != dimensions  # type: ignore[index]
+            ]
+            if skipped:
+                logger.warning(
+                    "Pomijam %d porad z embeddingiem o innym wymiarze niż %d "
+                    "(uruchom backfill z --dimensions %d): %s",
+                    len(skipped),
+                    dimensions,
+                    dimensions,
+                    ", ".join(skipped[:20]),
                 )
+            indexed = [
+                advice for advice in indexed
+                if len(vectors[advice.id]) == dimensions  # type: ignore[index]
+            ]
+        index = AdviceVectorIndex(
+            indexed,
+            [vectors[advice.id] for advice in indexed],  # type: ignore[index]
+            previous=previous,
+            model_tag=self._embeddings.model_tag,
+        )
+        logger.info(
+            "Zbudowano indeks embeddingów porad: %d/%d porad, %.1f KiB, %.2fs.",
+            len(index),
+            len(advices),
+            index.nbytes / 1024,
+            time.monotonic() - started,
+        )
+        self._schedule_stale_refresh(advices)
+        return index
 
-        # Dodaj do cache z LRU eviction
-        self._add_to_embedding_cache(advice.id, embedding)
-        return embedding
+    @staticmethod
+    def _same_embedding_version(previous: Advice, advice: Advice) -> bool:
+        return (
+            previous.kind == advice.kind
+            and previous.description == advice.description
+            and previous.embedding_model == advice.embedding_model
+            and previous.embedding_text_hash == advice.embedding_text_hash
+        )
 
-    def _add_to_embedding_cache(self, advice_id: int, embedding: tuple[float, ...]) -> None:
-        """Dodaje embedding do cache z LRU eviction jeśli przekroczony limit."""
-        # Jeśli już istnieje, usuń żeby przenieść na koniec
-        if advice_id in self._embedding_cache:
-            self._embedding_cache.pop(advice_id)
+    def _on_catalog_update(self, update: AdviceCatalogUpdate) -> None:
+        # Full reloads are picked up by the regular index refresh.
+        if update.full or self._advice_index is None or self._closed:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._apply_catalog_update(update))
+        self._catalog_update_tasks.add(task)
+        task.add_done_callback(self._catalog_update_tasks.discard)
+
+    async def _apply_catalog_update(self, update: AdviceCatalogUpdate) -> None:
+        """
+        Patches the vector index with a catalog delta: removed advices leave
+        it, changed ones keep their vector when its version did not change
+        and otherwise get the stored (or locally computed) one.
+        """
+        try:
+            async with self._index_lock:
+                index = self._advice_index
+                if index is None:
+                    return
+                started = time.monotonic()
+                changed = [advice for advice in update.current if advice.id is not None]
+                vectors: dict[int, Sequence[float]] = {}
+                for advice in changed:
+                    indexed = index.get(advice.id)  # type: ignore[arg-type]
+                    if indexed is not None and self._same_embedding_version(
+                        indexed, advice
+                    ):
+                        vectors[advice.id] = index.vector(advice.id)  # type: ignore
+                pending = [advice for advice in changed if advice.id not in vectors]
+                if self._embeddings.is_local:
+                    await self._embed_catalog_locally(pending, vectors)
+                else:
+                    await self._load_stored_embeddings(
+                        pending, vectors, whole_catalog=False)
+                upserts = [
+                    (advice, vectors[advice.id]) for advice in changed
+                    if advice.id in vectors
+                    and (not index.dimensions
+                         or len(vectors[advice.id]) == index.dimensions)
+                ]
+                removed = [advice.id for advice in update.previous
+                           if advice.id is not None]
+                # In place: readers never hold the index across an await.
+                index.apply_changes(upserts, removed)
+                logger.info(
+                    "Indeks porad załatany: %d zmienionych, %d usuniętych, %.3fs.",
+                    len(upserts),
+                    len(set(removed) - {advice.id for advice, _ in upserts}),
+                    time.monotonic() - started,
+                )
+            self._schedule_stale_refresh(changed)
+        except Exception as exc:  # pragma: no cover - network guard
+            logger.warning("Patching the advice index failed: %s", exc)
 
-        # Dodaj na koniec (najnowsze)
-        self._embedding_cache[advice_id] = embedding
+    def _schedule_stale_refresh(self, advices: Sequence[Advice]) -> None:
+        # Only the Supabase repository stores embedding versions, and only
+        # provider vectors (never local ones) are written back.
+        if self._embeddings.is_local or not isinstance(
+            self._advice_repository, EmbeddingUpdatableAdviceRepository
+        ):
+            return
+        model_tag = self._embeddings.model_tag
+        stale = [
+            advice for advice in advices
+            if advice.description.strip() and is_embedding_stale(advice, model_tag)
+        ]
+        if not stale:
+            return
+        logger.warning(
+            "%d porad ma brakujący lub nieaktualny embedding (model %s).",
+            len(stale),
+            model_tag,
+        )
+        if (
+            self._stale_refresh_limit <= 0
+            or self._closed
+            or (self._stale_refresh_task is not None and not self._stale_refresh_task.done())
+        ):
+            return
+        # Pozostałe porady trafią do kolejnego odświeżenia indeksu.
+        self._stale_refresh_task = asyncio.create_task(
+            self._refresh_stale_embeddings(stale[:self._stale_refresh_limit])
+        )
 
-        # LRU eviction: usuń najstarsze jeśli przekroczony limit
-        while len(self._embedding_cache) > self._embedding_cache_max_size:
-            oldest_key = next(iter(self._embedding_cache))
-            self._embedding_cache.pop(oldest_key)
-            self._record(
-                f"Usunięto najstarszy embedding z cache (id={oldest_key}, cache_size={len(self._embedding_cache)})"
+    async def _refresh_stale_embeddings(
+        self, advices: Sequence[Advice], *, batch_size: int = 100
+    ) -> None:
+        repository = cast(EmbeddingUpdatableAdviceRepository, self._advice_repository)
+        model_tag = self._embeddings.model_tag
+        started = time.monotonic()
+        try:
+            for start in range(0, len(advices), batch_size):
+                batch = advices[start:start + batch_size]
+                vectors = await self._embeddings.embed(
+                    [advice_embedding_text(advice) for advice in batch]
+                )
+                await repository.update_embeddings(
+                    {advice.id: vector for advice, vector in zip(batch, vectors)
+                     if advice.id is not None},
+                    model=model_tag,
+                    text_hashes={advice.id: advice_embedding_hash(advice)
+                                 for advice in batch if advice.id is not None},
+                )
+            logger.info(
+                "Przeliczono %d nieaktualnych embeddingów porad w %.1fs.",
+                len(advices),
+                time.monotonic() - started,
             )
+            await self.refresh_advice_index()
+        except Exception as exc:  # pragma: no cover - network guard
+            logger.warning("Refresh of stale advice embeddings failed: %s", exc)
 
-    async def _embed_text(self, text: str) -> tuple[float, ...]:
+    async def _embed_catalog_locally(
+        self,
+        advices: Sequence[Advice],
+        vectors: dict[int, Sequence[float]],
+    ) -> None:
+        embedded = await self._embeddings.embed(
+            [advice_embedding_text(advice) for advice in advices]
+        )
+        for advice, vector in zip(advices, embedded):
+            if advice.id is not None and advice.description.strip():
+                vectors[advice.id] = vector
+
+    async def _load_stored_embeddings(
+        self,
+        advices: Sequence[Advice],
+        vectors: dict[int, Sequence[float]],
+        *,
+        whole_catalog: bool,
+    ) -> None:
+        if not advices or not isinstance(
+            self._advice_repository, EmbeddingUpdatableAdviceRepository
+        ):
+            return
+        wanted = [advice.id for advice in advices if advice.id is not None]
+        if whole_catalog:
+            # Cały katalog w jednym stronicowanym zapytaniu zamiast N zapytań.
+            ids, matrix = await self._advice_repository.load_embedding_matrix()
+            loaded: Mapping[int, Sequence[float]] = dict(zip(ids, matrix))
+        else:
+            # Przy odświeżaniu brakuje zwykle tylko nowych lub zmienionych porad.
+            loaded = await self._advice_repository.get_embeddings(wanted)
+        for advice_id in wanted:
+            vector = loaded.get(advice_id)
+            if vector is not None:
+                vectors[advice_id] = vector
+
+    async def _embed_text(self, text: str) -> np.ndarray | None:
         try:
-            response = await self._client.embeddings.create(
-                model=self._embeddings_model,
-                input=[text],
-            )
+            return await self._embeddings.embed_message(text)
         except Exception as exc:  # pragma: no cover - network guard
             self._record(f"Błąd generowania embeddingu zapytania: {exc}")
-            return ()
-        data = response.data or []
-        if not data:
-            return ()
-        return tuple(data[0].embedding)
+            return None
 
     def _get_cached_result(
         self, key: tuple[str, str]
@@ -956,10 +1307,15 @@ class OpenAIEmbeddingAdviceIntentDetector(AdviceIntentDetector):
             )
         self._client = runtime_client
         self._model = model or self._settings.embeddings_model
-        self._threshold = threshold
+        self._embeddings: EmbeddingProvider = create_embedding_provider(
+            self._client,
+            self._model,
+            dimensions=self._settings.embeddings_dimensions,
+        )
+        self._threshold = threshold * self._embeddings.similarity_scale
         self._definitions = tuple(definitions)
         self._log_limit = log_limit
-        self._definition_embeddings: tuple[tuple[float, ...], ...] | None = None
+        self._definition_embeddings: VectorMatrix[AdviceIntentDefinition] | None = None
         self._prepare_lock = asyncio.Lock()
 
     async def detect_preferred_kind(
@@ -971,18 +1327,12 @@ class OpenAIEmbeddingAdviceIntentDetector(AdviceIntentDetector):
         await self._ensure_definition_embeddings()
         if not self._definition_embeddings:
             return None
-        message_embedding = await self._embed_text(message)
-        if not message_embedding:
+        message_embedding = await self._embeddings.embed_message(message)
+        if not message_embedding.size:
             return None
 
-        scored = []
-        for vector, definition in zip(
-            self._definition_embeddings, self._definitions
-        ):
-            score = OpenAIEmbeddingCategoryClassifier._cosine_similarity(
-                message_embedding, vector
-            )
-            scored.append((score, definition))
+        scores = self._definition_embeddings.scores(message_embedding)
+        scored = list(zip(scores.tolist(), self._definition_embeddings.keys))
 
         scored.sort(reverse=True, key=lambda item: item[0])
         if not scored:
@@ -1008,31 +1358,31 @@ class OpenAIEmbeddingAdviceIntentDetector(AdviceIntentDetector):
 
         return AdviceIntentMatch(kind=best_definition.kind, score=best_score)
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        await self._ensure_definition_embeddings()
+        return {"intent_embeddings": bool(self._definition_embeddings)}
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embeddings
+
+    def definition_texts(self) -> Sequence[str]:
+        return [definition.description for definition in self._definitions]
+
     async def _ensure_definition_embeddings(self) -> None:
         if self._definition_embeddings is not None:
             return
         async with self._prepare_lock:
             if self._definition_embeddings is not None:
                 return
-            inputs = [definition.description for definition in self._definitions]
-            embeddings = await self._embed_texts(inputs)
-            self._definition_embeddings = tuple(
-                tuple(vec) for vec in embeddings)
-
-    async def _embed_text(self, text: str) -> tuple[float, ...]:
-        embeddings = await self._embed_texts([text])
-        if not embeddings:
-            return ()
-        return tuple(embeddings[0])
+            embeddings = await self._embed_texts(self.definition_texts())
+            self._definition_embeddings = VectorMatrix(
+                self._definitions, embeddings)
 
     async def _embed_texts(
         self, texts: Sequence[str]
     ) -> Sequence[Sequence[float]]:
-        response = await self._client.embeddings.create(
-            model=self._model,
-            input=list(texts),
-        )
-        return [tuple(item.embedding) for item in response.data]
+        return await embed_definitions(self._embeddings, texts)
 
 
 class LLMAdviceResponseGenerator(AdviceResponseGenerator):
@@ -1152,7 +1502,7 @@ class LLMAdviceResponseGenerator(AdviceResponseGenerator):
             # Dodaj reasoning_effort tylko jeśli jest ustawione (dla modeli z reasoning)
             if self._reasoning_effort is not None:
                 create_kwargs["reasoning_effort"] = self._reasoning_effort
-            response = await self._client.chat.completions.create(**create_kwargs)
+            response = await create_chat_completion(self._client, **create_kwargs)
             request_end = time.time()
             self._log(
                 f"⏱️ OpenAI API odpowiedział w {request_end - request_start:.2f}s")
@@ -1297,7 +1647,13 @@ class OpenAIEmbeddingCategoryClassifier(AdviceCategoryClassifier):
                 "client must be an instance of openai.AsyncOpenAI.")
         self._client = runtime_client
         self._model = model or self._settings.embeddings_model
-        self._similarity_threshold = similarity_threshold
+        self._embeddings: EmbeddingProvider = create_embedding_provider(
+            self._client,
+            self._model,
+            dimensions=self._settings.embeddings_dimensions,
+        )
+        self._similarity_threshold = (
+            similarity_threshold * self._embeddings.similarity_scale)
         self._max_categories = max_categories
         self._definitions = tuple(
             EmbeddingCategoryDefinition(
@@ -1306,7 +1662,7 @@ class OpenAIEmbeddingCategoryClassifier(AdviceCategoryClassifier):
             )
             for definition in categories
         )
-        self._category_embeddings: tuple[tuple[float, ...], ...] | None = None
+        self._category_embeddings: VectorMatrix[str] | None = None
         self._prepare_lock = asyncio.Lock()
         logger.info(
             "Initialized OpenAIEmbeddingCategoryClassifier with %d categories "
@@ -1324,15 +1680,16 @@ class OpenAIEmbeddingCategoryClassifier(AdviceCategoryClassifier):
         await self._ensure_category_embeddings()
         if not self._category_embeddings:
             return ()
-        message_embedding = await self._embed_text(message)
-        if not message_embedding:
+        message_embedding = await self._embeddings.embed_message(message)
+        if not message_embedding.size:
             return ()
 
-        scored_pairs: list[tuple[float, str]] = []
-        for vector, definition in zip(self._category_embeddings, self._definitions):
-            score = self._cosine_similarity(message_embedding, vector)
-            if score >= self._similarity_threshold:
-                scored_pairs.append((score, definition.name))
+        scores = self._category_embeddings.scores(message_embedding)
+        scored_pairs: list[tuple[float, str]] = [
+            (score, name)
+            for score, name in zip(scores.tolist(), self._category_embeddings.keys)
+            if score >= self._similarity_threshold
+        ]
 
         scored_pairs.sort(reverse=True, key=lambda item: item[0])
         if scored_pairs:
@@ -1359,6 +1716,17 @@ class OpenAIEmbeddingCategoryClassifier(AdviceCategoryClassifier):
         )
         return matches
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        await self._ensure_category_embeddings()
+        return {"category_embeddings": bool(self._category_embeddings)}
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embeddings
+
+    def definition_texts(self) -> Sequence[str]:
+        return [definition.description for definition in self._definitions]
+
     async def _ensure_category_embeddings(self) -> None:
         if self._category_embeddings is not None:
             return
@@ -1366,36 +1734,15 @@ class OpenAIEmbeddingCategoryClassifier(AdviceCategoryClassifier):
             if self._category_embeddings is not None:
                 return
             logger.info(
-                "Embedding %d category descriptions via OpenAI model '%s'",
+                "Preparing %d category embeddings for model '%s'",
                 len(self._definitions),
-                self._model,
+                self._embeddings.model_tag,
+            )
+            embeddings = await self._embed_texts(self.definition_texts())
+            self._category_embeddings = VectorMatrix(
+                [definition.name for definition in self._definitions], embeddings
             )
-            inputs = [definition.description for definition in self._definitions]
-            embeddings = await self._embed_texts(inputs)
-            self._category_embeddings = tuple(
-                tuple(vector) for vector in embeddings)
             logger.info("Cached category embeddings.")
 
-    async def _embed_text(self, text: str) -> tuple[float, ...]:
-        embeddings = await self._embed_texts([text])
-        if not embeddings:
-            return ()
-        return tuple(embeddings[0])
-
     async def _embed_texts(self, texts: Sequence[str]) -> Sequence[Sequence[float]]:
-        response = await self._client.embeddings.create(
-            model=self._model,
-            input=list(texts),
-        )
-        return [tuple(item.embedding) for item in response.data]
-
-    @staticmethod
-    def _cosine_similarity(
-        left: Sequence[float], right: Sequence[float]
-    ) -> float:
-        dot = sum(a * b for a, b in zip(left, right))
-        left_norm = sum(a * a for a in left) ** 0.5
-        right_norm = sum(b * b for b in right) ** 0.5
-        if left_norm == 0 or right_norm == 0:
-            return 0.0
-        return dot / (left_norm * right_norm)
+        return await embed_definitions(self._embeddings, texts)
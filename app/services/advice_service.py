@@ -1,10 +1,10 @@
 from __future__ import annotations
 import logging
 import os
-from typing import Protocol, Sequence
+from typing import Mapping, Protocol, Sequence
 
 from app.integrations.openai import create_async_openai_client, get_openai_settings
-from app.integrations.supabase import create_supabase_async_client
+from app.integrations.supabase import get_supabase_async_client
 from app.repositories.advice_repository import SupabaseAdviceRepository, EmbeddingUpdatableAdviceRepository
 from app.repositories.category_repository import SupabaseAdviceCategoryRepository
 from app.models.advice import (
@@ -68,6 +68,18 @@ class AdviceService:
             return ()
         return ()
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        warm_up = getattr(self._provider, "warm_up", None)
+        if callable(warm_up):
+            return await warm_up()
+        return {}
+
+    async def aclose(self) -> None:
+        """Stops background tasks of the provider (index and catalog refreshes)."""
+        aclose = getattr(self._provider, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
 
 class SelectionEngine(Protocol):
     async def recommend(self, request: AdviceRequestContext) -> AdviceRecommendation:
@@ -89,6 +101,17 @@ class PipelineAdviceProvider:
     def get_latest_events(self) -> Sequence[str]:
         return self._pipeline.get_latest_events()
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        warm_up = getattr(self._pipeline, "warm_up", None)
+        if callable(warm_up):
+            return await warm_up()
+        return {}
+
+    async def aclose(self) -> None:
+        aclose = getattr(self._pipeline, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
 
 def build_default_advice_repository() -> AdviceRepository:
     return InMemoryAdviceRepository(
@@ -133,8 +156,8 @@ def build_default_advice_pipeline() -> AdviceSelectionPipeline:
     )
 
 
-def build_supabase_advice_pipeline() -> SelectionEngine:
-    client = create_supabase_async_client()
+def build_supabase_advice_pipeline(client=None) -> SelectionEngine:
+    client = client or get_supabase_async_client()
     advice_repository = EmbeddingUpdatableAdviceRepository(client)
     category_repository = SupabaseAdviceCategoryRepository(client)
     # Build category classifier only for the legacy, category-based mode.
@@ -204,8 +227,8 @@ def build_supabase_advice_pipeline() -> SelectionEngine:
     )
 
 
-def get_advice_service() -> AdviceService:
-    pipeline = build_supabase_advice_pipeline()
+def build_advice_service(client=None) -> AdviceService:
+    pipeline = build_supabase_advice_pipeline(client)
     provider = PipelineAdviceProvider(pipeline=pipeline)
     return AdviceService(provider=provider)
 
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, Protocol, Sequence
+
+import numpy as np
+
+from app.services.vector_math import VECTOR_DTYPE, normalize_rows, normalize_vector
+
+# Rows scored against the centroids at a time while assigning lists.
+_ASSIGN_BLOCK_ROWS = 4096
+
+
+class CandidateIndex(Protocol):
+    """
+    Approximate first stage of advice retrieval: returns the keys (advice ids)
+    worth scoring exactly for a query. Implementations must support
+    incremental inserts, so a catalog change does not require retraining.
+    """
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def add(self, keys: Sequence[int], vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def remove(self, keys: Iterable[int]) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class IVFIndex(CandidateIndex):
+    """
+    Inverted-file index: vectors are assigned to the nearest of `nlist`
+    spherical k-means centroids, and a query only visits the `nprobe` lists
+    whose centroids are closest to it.
+
+    Only the centroids are learned; inserting or updating a vector is a single
+    nearest-centroid assignment, and only the lists it leaves or joins are
+    rebuilt before the next query. The centroids (with the size and the model
+    tag of the vectors they were trained on) are what `save()` snapshots, so
+    a restart skips training.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        *,
+        nprobe: int = 8,
+        trained_size: int = 0,
+        model_tag: str | None = None,
+    ) -> None:
+        self._centroids = normalize_rows(centroids)
+        self._centroids.setflags(write=False)
+        self._nprobe = max(1, min(nprobe, len(self._centroids)))
+        self._trained_size = trained_size
+        self._model_tag = model_tag
+        self._assignments: dict[int, int] = {}
+        self._members: list[set[int]] = [set() for _ in range(len(self._centroids))]
+        # Per-list key arrays; `None` marks a list changed since it was built.
+        self._lists: list[np.ndarray | None] = [None] * len(self._centroids)
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        *,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        iterations: int = 12,
+        sample_size: int = 50_000,
+        seed: int = 0,
+        model_tag: str | None = None,
+    ) -> "IVFIndex":
+        data = normalize_rows(vectors)
+        if not len(data):
+            raise ValueError("Cannot train an IVF index without vectors.")
+        nlist = nlist or default_nlist(len(data))
+        nlist = max(1, min(nlist, len(data)))
+        rng = np.random.default_rng(seed)
+        if len(data) > sample_size:
+            data = data[rng.choice(len(data), sample_size, replace=False)]
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(centroids, data)
+            for cluster in range(nlist):
+                members = data[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.sum(axis=0)
+                else:
+                    # Re-seed empty clusters with a random point.
+                    centroids[cluster] = data[rng.integers(len(data))]
+            centroids = normalize_rows(centroids)
+        return cls(
+            centroids, nprobe=nprobe, trained_size=len(vectors), model_tag=model_tag)
+
+    @property
+    def dimensions(self) -> int:
+        return int(self._centroids.shape[1])
+
+    @property
+    def nlist(self) -> int:
+        return len(self._centroids)
+
+    @property
+    def nprobe(self) -> int:
+        return self._nprobe
+
+    @property
+    def trained_size(self) -> int:
+        return self._trained_size
+
+    @property
+    def model_tag(self) -> str | None:
+        """Embedding model the centroids were trained for (`None` if unknown)."""
+        return self._model_tag
+
+    def __len__(self) -> int:
+        return len(self._assignments)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._assignments
+
+    def keys(self) -> set[int]:
+        return set(self._assignments)
+
+    def with_nprobe(self, nprobe: int) -> "IVFIndex":
+        clone = self.copy()
+        clone._nprobe = max(1, min(nprobe, self.nlist))
+        return clone
+
+    def copy(self) -> "IVFIndex":
+        clone = IVFIndex(
+            self._centroids,
+            nprobe=self._nprobe,
+            trained_size=self._trained_size,
+            model_tag=self._model_tag,
+        )
+        clone._assignments = dict(self._assignments)
+        clone._members = [set(members) for members in self._members]
+        clone._lists = list(self._lists)
+        return clone
+
+    def add(self, keys: Sequence[int], vectors: np.ndarray) -> None:
+        """Inserts or re-assigns `keys` (existing keys are moved)."""
+        if not len(keys):
+            return
+        assignments = _nearest(self._centroids, normalize_rows(vectors))
+        for key, cluster in zip(keys, assignments.tolist()):
+            key = int(key)
+            previous = self._assignments.get(key)
+            if previous == cluster:
+                continue
+            if previous is not None:
+                self._members[previous].discard(key)
+                self._lists[previous] = None
+            self._assignments[key] = cluster
+            self._members[cluster].add(key)
+            self._lists[cluster] = None
+
+    def remove(self, keys: Iterable[int]) -> None:
+        for key in keys:
+            cluster = self._assignments.pop(int(key), None)
+            if cluster is not None:
+                self._members[cluster].discard(int(key))
+                self._lists[cluster] = None
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        scores = self._centroids @ normalize_vector(query)
+        if self._nprobe < len(scores):
+            probes = np.argpartition(-scores, self._nprobe - 1)[: self._nprobe]
+        else:
+            probes = np.arange(len(scores))
+        selected = [
+            keys for keys in (self._inverted_list(cluster) for cluster in probes.tolist())
+            if len(keys)
+        ]
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(selected)
+
+    def save(self, path: Path) -> None:
+        """Snapshots the trained centroids atomically to an `.npz` file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=path.stem, suffix=".npz", delete=False
+        ) as handle:
+            np.savez(
+                handle,
+                centroids=self._centroids,
+                trained_size=np.int64(self._trained_size),
+                model_tag=np.asarray(self._model_tag or ""),
+            )
+        os.replace(handle.name, path)
+
+    @classmethod
+    def load(cls, path: Path, *, nprobe: int = 8) -> "IVFIndex":
+        """Restores trained centroids; lists are filled again with `add()`."""
+        with np.load(path) as snapshot:
+            # Snapshots written before the tag was stored load as untagged.
+            model_tag = (
+                str(snapshot["model_tag"]) if "model_tag" in snapshot.files else "")
+            return cls(
+                snapshot["centroids"],
+                nprobe=nprobe,
+                trained_size=int(snapshot["trained_size"]),
+                model_tag=model_tag or None,
+            )
+
+    def _inverted_list(self, cluster: int) -> np.ndarray:
+        keys = self._lists[cluster]
+        if keys is None:
+            members = self._members[cluster]
+            keys = np.fromiter(members, dtype=np.int64, count=len(members))
+            self._lists[cluster] = keys
+        return keys
+
+
+def default_nlist(size: int) -> int:
+    """Rule of thumb: about 4·√N lists, never more than N / 8."""
+    return max(1, min(int(4 * np.sqrt(size)), size // 8 or 1))
+
+
+def _nearest(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(
+            vectors[start:start + _ASSIGN_BLOCK_ROWS], dtype=VECTOR_DTYPE)
+        assignments[start:start + len(block)] = np.argmax(
+            block @ centroids.T, axis=1)
+    return assignments
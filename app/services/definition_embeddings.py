@@ -0,0 +1,281 @@
+"""
+Build-time embeddings of the static definitions.
+
+Category definitions, intent definitions and open-answer trait descriptions
+(with their negative variants) are constants, so their vectors are computed
+once, before deployment, and shipped as an `.npz` artifact:
+
+    python -m app.services.definition_embeddings [--output PATH]
+
+Vectors are keyed by the provider's model tag (`model@dimensions`) and the
+normalized text hash. At startup the classifiers memory-map the artifact and
+only embed via the API the texts it does not cover (a definition was edited
+or a different model is configured).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import struct
+import tempfile
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Final, Mapping, Protocol, Sequence
+
+import numpy as np
+
+from app.integrations.embeddings import EmbeddingProvider, embedding_text_hash
+from app.services.vector_math import VECTOR_DTYPE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACT_PATH: Final[Path] = (
+    Path(__file__).parent.parent.parent / "data" / "definition_embeddings.npz"
+)
+ARTIFACT_FORMAT_VERSION: Final[int] = 1
+# Fixed part of a zip local file header, followed by the name and extra field.
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+class DefinitionSource(Protocol):
+    """Component embedding static definitions (classifiers, intent detector)."""
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        raise NotImplementedError
+
+    def definition_texts(self) -> Sequence[str]:
+        raise NotImplementedError
+
+
+class DefinitionEmbeddingArtifact:
+    """
+    Read-only view of the artifact: per model tag, a sorted array of text
+    hashes and a memory-mapped float32 matrix with one row per hash.
+    """
+
+    def __init__(self, tables: Mapping[str, tuple[np.ndarray, np.ndarray]]) -> None:
+        self._tables = dict(tables)
+
+    @property
+    def models(self) -> list[str]:
+        return sorted(self._tables)
+
+    def __len__(self) -> int:
+        return sum(len(hashes) for hashes, _ in self._tables.values())
+
+    def lookup(self, model_tag: str, texts: Sequence[str]) -> dict[str, np.ndarray]:
+        """Vectors of the texts present in the artifact, keyed by text hash."""
+        table = self._tables.get(model_tag)
+        if table is None:
+            return {}
+        hashes, vectors = table
+        found: dict[str, np.ndarray] = {}
+        for text in texts:
+            text_hash = embedding_text_hash(text)
+            position = int(np.searchsorted(hashes, text_hash))
+            if position < len(hashes) and hashes[position] == text_hash:
+                found[text_hash] = vectors[position]
+        return found
+
+    @classmethod
+    def load(cls, path: Path) -> "DefinitionEmbeddingArtifact":
+        with np.load(path, allow_pickle=False) as archive:
+            version = int(archive["format_version"])
+            if version != ARTIFACT_FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported definition embeddings format {version} "
+                    f"(expected {ARTIFACT_FORMAT_VERSION})."
+                )
+            models = [str(model) for model in archive["models"]]
+            hashes = [archive[f"hashes_{i}"] for i in range(len(models))]
+        tables = {
+            model: (hashes[i], _memory_map_member(path, f"vectors_{i}"))
+            for i, model in enumerate(models)
+        }
+        return cls(tables)
+
+    @staticmethod
+    def write(path: Path, vectors: Mapping[str, Mapping[str, np.ndarray]]) -> None:
+        """
+        Writes `{model_tag: {text_hash: vector}}` atomically. Members are
+        stored uncompressed so the loader can memory-map them.
+        """
+        arrays: dict[str, np.ndarray] = {
+            "format_version": np.int64(ARTIFACT_FORMAT_VERSION),
+            "models": np.asarray(sorted(vectors), dtype=str),
+        }
+        for i, model in enumerate(sorted(vectors)):
+            rows = sorted(vectors[model].items())
+            arrays[f"hashes_{i}"] = np.asarray([key for key, _ in rows], dtype=str)
+            arrays[f"vectors_{i}"] = np.vstack(
+                [np.asarray(vector, dtype=VECTOR_DTYPE) for _, vector in rows])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=path.stem, suffix=".npz", delete=False
+        ) as handle:
+            np.savez(handle, **arrays)
+        os.replace(handle.name, path)
+
+
+def _memory_map_member(path: Path, name: str) -> np.ndarray:
+    """
+    Maps an `.npy` member of an uncompressed `.npz` straight from the archive
+    file; `np.load(mmap_mode=...)` ignores the mode for archives.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path, allow_pickle=False) as archive:
+            return archive[name]
+    with open(path, "rb") as handle:
+        handle.seek(info.header_offset)
+        header = _ZIP_LOCAL_HEADER.unpack(handle.read(_ZIP_LOCAL_HEADER.size))
+        name_length, extra_length = header[-2:]
+        handle.seek(name_length + extra_length, os.SEEK_CUR)
+        version = np.lib.format.read_magic(handle)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(handle)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(handle)
+        offset = handle.tell()
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        shape=shape,
+        offset=offset,
+        order="F" if fortran_order else "C",
+    )
+
+
+@lru_cache(maxsize=1)
+def get_definition_artifact() -> DefinitionEmbeddingArtifact | None:
+    """
+    Process-wide artifact from `DEFINITION_EMBEDDINGS_PATH` (default
+    `data/definition_embeddings.npz`); `None` when it is absent or unreadable.
+    """
+    path = Path(os.getenv("DEFINITION_EMBEDDINGS_PATH") or DEFAULT_ARTIFACT_PATH)
+    if not path.exists():
+        logger.info("Definition embeddings artifact %s not found.", path)
+        return None
+    try:
+        artifact = DefinitionEmbeddingArtifact.load(path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as exc:
+        logger.warning(
+            "Failed to load definition embeddings artifact %s: %s", path, exc)
+        return None
+    logger.info(
+        "Loaded %d definition embeddings for models %s from %s.",
+        len(artifact),
+        ", ".join(artifact.models),
+        path,
+    )
+    return artifact
+
+
+async def embed_definitions(
+    provider: EmbeddingProvider, texts: Sequence[str]
+) -> list[np.ndarray]:
+    """
+    Embeds static definition texts, serving them from the build-time
+    artifact when it has them for the provider's model tag. Local providers
+    compute vectors in-process and skip the artifact.
+    """
+    if not texts or provider.is_local:
+        return await provider.embed(texts)
+    artifact = get_definition_artifact()
+    found = artifact.lookup(provider.model_tag, texts) if artifact is not None else {}
+    hashes = [embedding_text_hash(text) for text in texts]
+    missing = [text for text, text_hash in zip(texts, hashes) if text_hash not in found]
+    if missing:
+        if artifact is not None:
+            logger.warning(
+                "%d of %d definitions are not in the embeddings artifact for "
+                "model '%s'; embedding them via the API. Rebuild it with "
+                "`python -m app.services.definition_embeddings`.",
+                len(missing),
+                len(texts),
+                provider.model_tag,
+            )
+        for text, vector in zip(missing, await provider.embed(missing)):
+            found[embedding_text_hash(text)] = vector
+    return [found[text_hash] for text_hash in hashes]
+
+
+def _definition_sources() -> list[DefinitionSource]:
+    # Built exactly like the application builds them, so model tags and
+    # texts match what the classifiers look up at startup.
+    from app.services.advice_service import (
+        build_openai_category_classifier,
+        build_openai_intent_detector,
+    )
+    from app.services.test_service import build_open_answer_trait_classifiers
+
+    return [
+        build_openai_category_classifier(),
+        build_openai_intent_detector(),
+        *build_open_answer_trait_classifiers(),
+    ]
+
+
+async def build_artifact(path: Path) -> dict[str, int]:
+    """Embeds every static definition and writes the artifact to `path`."""
+    texts_by_model: dict[str, dict[str, str]] = {}
+    providers: dict[str, EmbeddingProvider] = {}
+    for source in _definition_sources():
+        provider = source.embedding_provider
+        if provider.is_local:
+            continue
+        providers.setdefault(provider.model_tag, provider)
+        texts = texts_by_model.setdefault(provider.model_tag, {})
+        for text in source.definition_texts():
+            texts.setdefault(embedding_text_hash(text), text)
+
+    vectors: dict[str, dict[str, np.ndarray]] = {}
+    for model_tag, texts in texts_by_model.items():
+        embedded = await providers[model_tag].embed(list(texts.values()))
+        vectors[model_tag] = dict(zip(texts, embedded))
+    if vectors:
+        DefinitionEmbeddingArtifact.write(path, vectors)
+    return {model_tag: len(rows) for model_tag, rows in vectors.items()}
+
+
+async def _run(path: Path) -> dict[str, int]:
+    from app.integrations.openai import close_openai_http_client
+
+    try:
+        return await build_artifact(path)
+    finally:
+        await close_openai_http_client()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Generuje artefakt z embeddingami statycznych definicji.")
+    parser.add_argument(
+        "--output",
+        default=os.getenv("DEFINITION_EMBEDDINGS_PATH") or str(DEFAULT_ARTIFACT_PATH),
+        help="ścieżka pliku .npz (domyślnie DEFINITION_EMBEDDINGS_PATH)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    counts = asyncio.run(_run(Path(args.output)))
+    if not counts:
+        logger.error(
+            "No definitions to embed (EMBEDDING_PROVIDER=local?); nothing written.")
+        return 1
+    for model_tag, count in sorted(counts.items()):
+        logger.info("Model '%s': %d definition embeddings.", model_tag, count)
+    logger.info("Definition embeddings written to %s.", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,257 @@
+"""
+Offline backfill of advice embeddings.
+
+Embeds advices that have no (or a stale) embedding in large batches and
+writes the vectors back to Supabase, so user requests never pay for catalog
+embedding. An embedding is stale when its stored model tag or text hash no
+longer match (advice edited, model or dimensions changed). Run it after
+importing or editing advices:
+
+    python -m app.services.embedding_backfill [--all] [--batch-size 100]
+
+Progress is checkpointed (last processed advice id), so an interrupted run
+continues where it stopped when started again with `--resume`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+from app.integrations.embeddings import CachedOpenAIEmbeddings, get_embedding_cache
+from app.integrations.openai import (
+    close_openai_http_client,
+    create_async_openai_client,
+    get_openai_settings,
+)
+from app.integrations.supabase import (
+    close_supabase_async_client,
+    get_supabase_async_client,
+)
+from app.models.advice import Advice
+from app.repositories.advice_repository import EmbeddingUpdatableAdviceRepository
+from app.services.advice_index import (
+    advice_embedding_hash,
+    advice_embedding_text,
+    is_embedding_stale,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = (
+    Path(__file__).parent.parent.parent / "data" / "cache" / "embedding_backfill.json"
+)
+
+
+@dataclass
+class BackfillReport:
+    scanned: int = 0
+    embedded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    last_id: int = 0
+    first_failed_id: int | None = None
+
+    @property
+    def checkpoint_id(self) -> int:
+        """Last id below which every advice was handled successfully."""
+        if self.first_failed_id is None:
+            return self.last_id
+        return min(self.last_id, self.first_failed_id - 1)
+
+
+def _needs_embedding(advice: Advice, *, force: bool, model: str) -> bool:
+    return force or is_embedding_stale(advice, model)
+
+
+def _load_checkpoint(path: Path) -> int:
+    try:
+        return int(json.loads(path.read_text(encoding="utf-8"))["last_id"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def _save_checkpoint(path: Path, last_id: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"last_id": last_id}), encoding="utf-8")
+
+
+async def backfill_advice_embeddings(
+    repository: EmbeddingUpdatableAdviceRepository,
+    embeddings: CachedOpenAIEmbeddings,
+    *,
+    batch_size: int = 100,
+    page_size: int = 500,
+    concurrency: int = 4,
+    force: bool = False,
+    missing_only: bool = False,
+    start_after_id: int = 0,
+    checkpoint_path: Path | None = None,
+) -> BackfillReport:
+    """
+    Embeds advices with a missing or stale embedding (all advices with
+    `force`, only missing ones with `missing_only`) page by page and stores
+    them tagged with `embeddings.model_tag` and the text hash.
+
+    Each page is split into batches of `batch_size` texts; up to `concurrency`
+    batches are embedded and written back at the same time. A batch that
+    fails is counted and left for the next run.
+    """
+    report = BackfillReport(last_id=start_after_id)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    include_embedded = force or not missing_only
+    started = time.monotonic()
+
+    async def process(batch: Sequence[Advice]) -> None:
+        async with semaphore:
+            try:
+                vectors = await embeddings.embed(
+                    [advice_embedding_text(advice) for advice in batch]
+                )
+                await repository.update_embeddings(
+                    {
+                        advice.id: vector
+                        for advice, vector in zip(batch, vectors)
+                        if advice.id is not None
+                    },
+                    model=embeddings.model_tag,
+                    text_hashes={
+                        advice.id: advice_embedding_hash(advice)
+                        for advice in batch
+                        if advice.id is not None
+                    },
+                )
+            except Exception as exc:
+                report.failed += len(batch)
+                batch_first_id = batch[0].id or 0
+                if report.first_failed_id is None or batch_first_id < report.first_failed_id:
+                    report.first_failed_id = batch_first_id
+                logger.warning(
+                    "Batch of %d advices (ids %s-%s) failed: %s",
+                    len(batch),
+                    batch[0].id,
+                    batch[-1].id,
+                    exc,
+                )
+                return
+            report.embedded += len(batch)
+
+    while True:
+        page = await repository.get_embedding_backfill_page(
+            after_id=report.last_id,
+            limit=page_size,
+            include_embedded=include_embedded,
+        )
+        if not page:
+            break
+        report.scanned += len(page)
+        pending = []
+        for advice in page:
+            if not advice.description.strip():
+                report.skipped += 1
+            elif _needs_embedding(advice, force=force, model=embeddings.model_tag):
+                pending.append(advice)
+        batches = [
+            pending[start:start + batch_size]
+            for start in range(0, len(pending), max(batch_size, 1))
+        ]
+        await asyncio.gather(*(process(batch) for batch in batches))
+
+        report.last_id = max(advice.id or 0 for advice in page)
+        if checkpoint_path is not None:
+            _save_checkpoint(checkpoint_path, report.checkpoint_id)
+        logger.info(
+            "Backfill progress: scanned=%d embedded=%d skipped=%d failed=%d "
+            "last_id=%d (%.1fs)",
+            report.scanned,
+            report.embedded,
+            report.skipped,
+            report.failed,
+            report.last_id,
+            time.monotonic() - started,
+        )
+        if len(page) < page_size:
+            break
+
+    if checkpoint_path is not None and not report.failed:
+        checkpoint_path.unlink(missing_ok=True)
+    return report
+
+
+async def _run(args: argparse.Namespace) -> BackfillReport:
+    settings = get_openai_settings()
+    model = (
+        args.model
+        or os.getenv("OPENAI_ADVICE_EMBEDDING_MODEL")
+        or settings.embeddings_model
+    )
+    embeddings = CachedOpenAIEmbeddings(
+        create_async_openai_client(settings),
+        model,
+        get_embedding_cache(),
+        dimensions=args.dimensions or settings.embeddings_dimensions,
+    )
+    repository = EmbeddingUpdatableAdviceRepository(get_supabase_async_client())
+    checkpoint_path = Path(args.checkpoint)
+    start_after_id = _load_checkpoint(checkpoint_path) if args.resume else 0
+    if start_after_id:
+        logger.info("Resuming backfill after advice id %d.", start_after_id)
+    try:
+        return await backfill_advice_embeddings(
+            repository,
+            embeddings,
+            batch_size=args.batch_size,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            force=args.all,
+            missing_only=args.missing_only,
+            start_after_id=start_after_id,
+            checkpoint_path=checkpoint_path,
+        )
+    finally:
+        await close_supabase_async_client()
+        await close_openai_http_client()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Uzupełnia embeddingi porad w Supabase.")
+    parser.add_argument("--all", action="store_true",
+                        help="przelicz embeddingi wszystkich porad")
+    parser.add_argument("--missing-only", action="store_true",
+                        help="tylko porady bez embeddingu (bez nieaktualnych)")
+    parser.add_argument("--dimensions", type=int, default=None,
+                        help="liczba wymiarów embeddingów "
+                             "(domyślnie OPENAI_EMBEDDINGS_DIMENSIONS)")
+    parser.add_argument("--model", default=None,
+                        help="model embeddingów (domyślnie jak w trybie embedding)")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--resume", action="store_true",
+                        help="kontynuuj od ostatniego zapisanego id")
+    parser.add_argument("--checkpoint", default=str(DEFAULT_CHECKPOINT_PATH))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    report = asyncio.run(_run(args))
+    logger.info(
+        "Backfill finished: scanned=%d embedded=%d skipped=%d failed=%d",
+        report.scanned,
+        report.embedded,
+        report.skipped,
+        report.failed,
+    )
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
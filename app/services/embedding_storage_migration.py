@@ -0,0 +1,111 @@
+"""
+Fills the binary embedding column (`embedding_packed`) from the JSON one.
+
+Needed once after applying
+`supabase/migrations/20261017000200_advice_embedding_packed.sql` and enabling
+`ADVICE_EMBEDDING_STORAGE=float32|float16`; new writes fill both columns.
+
+    python -m app.services.embedding_storage_migration [--dtype float16] [--repack]
+
+No embeddings are recomputed and the version columns are not touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Sequence
+
+from app.integrations.supabase import (
+    close_supabase_async_client,
+    get_supabase_async_client,
+)
+from app.repositories.advice_repository import (
+    EmbeddingStorage,
+    EmbeddingUpdatableAdviceRepository,
+    get_embedding_storage,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackReport:
+    packed: int = 0
+    pages: int = 0
+
+
+async def pack_advice_embeddings(
+    repository: EmbeddingUpdatableAdviceRepository,
+    *,
+    storage: EmbeddingStorage,
+    page_size: int = 500,
+    concurrency: int = 8,
+    repack: bool = False,
+) -> PackReport:
+    report = PackReport()
+    last_id = 0
+    while True:
+        page = await repository.get_embeddings_to_pack(
+            after_id=last_id, limit=page_size, repack=repack)
+        if not page:
+            break
+        await repository.update_packed_embeddings(
+            dict(page), storage=storage, concurrency=concurrency)
+        report.packed += len(page)
+        report.pages += 1
+        last_id = page[-1][0]
+        logger.info("Packed %d embeddings (last id %d).", report.packed, last_id)
+        if len(page) < page_size:
+            break
+    return report
+
+
+async def _run(args: argparse.Namespace) -> PackReport:
+    storage: EmbeddingStorage = args.dtype
+    repository = EmbeddingUpdatableAdviceRepository(
+        get_supabase_async_client(), embedding_storage=storage)
+    try:
+        return await pack_advice_embeddings(
+            repository,
+            storage=storage,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            repack=args.repack,
+        )
+    finally:
+        await close_supabase_async_client()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    configured = get_embedding_storage()
+    parser = argparse.ArgumentParser(
+        description="Zapisuje embeddingi porad w kolumnie binarnej.")
+    parser.add_argument(
+        "--dtype",
+        choices=("float32", "float16"),
+        default=configured if configured != "json" else "float32",
+        help="typ wartości w kolumnie binarnej (domyślnie ADVICE_EMBEDDING_STORAGE)",
+    )
+    parser.add_argument("--repack", action="store_true",
+                        help="przepisz także wiersze, które mają już wersję binarną")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    report = asyncio.run(_run(args))
+    logger.info(
+        "Migration finished: packed=%d pages=%d dtype=%s",
+        report.packed,
+        report.pages,
+        args.dtype,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
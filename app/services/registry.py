@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Mapping
+
+from fastapi import Request
+
+from app.integrations.embeddings import (
+    get_embedding_batcher,
+    get_embedding_cache,
+    get_embedding_provider_name,
+)
+from app.integrations.openai import (
+    close_openai_http_client,
+    get_openai_settings,
+    get_single_flight,
+)
+from app.integrations.supabase import (
+    close_supabase_async_client,
+    get_supabase_async_client,
+    get_supabase_pool_stats,
+)
+from app.repositories.advice_catalog import get_advice_catalog_settings
+from app.repositories.user_persona_repository import UserPersonaProvider
+from app.services.advice_index import get_advice_index_settings
+from app.services.advice_service import (
+    AdviceService,
+    build_advice_service,
+    build_user_persona_provider,
+)
+from app.services.definition_embeddings import get_definition_artifact
+from app.services.test_service import (
+    TestProcessingService,
+    build_test_processing_service,
+)
+from app.services.vector_math import get_storage_dtype
+
+logger = logging.getLogger(__name__)
+
+# Cached configuration that services read while they are built; cleared by
+# `rebuild()`. Getters holding live resources (HTTP pools, the embedding
+# cache and batcher, single-flight) are shared by both registries and keep
+# the configuration they were created with.
+_SETTINGS_GETTERS = (
+    get_openai_settings,
+    get_embedding_provider_name,
+    get_storage_dtype,
+    get_advice_index_settings,
+    get_advice_catalog_settings,
+    get_definition_artifact,
+)
+
+
+class ServiceRegistry:
+    """
+    Process-wide holder of the expensive, stateful services.
+
+    Pipelines keep embedding caches, result caches and category frequencies in
+    memory, so they are built once per process (lazily, on first use) and shared
+    by all routers instead of being rebuilt on every request. The registry is
+    created and closed by the application lifespan in `app.main`.
+    """
+
+    def __init__(
+        self,
+        *,
+        client_factory: Callable[[], Any] = get_supabase_async_client,
+        advice_service_factory: Callable[[Any], AdviceService] = build_advice_service,
+        test_service_factory: Callable[[Any], TestProcessingService] = build_test_processing_service,
+        persona_provider_factory: Callable[[Any], UserPersonaProvider] = build_user_persona_provider,
+    ) -> None:
+        self._client_factory = client_factory
+        self._advice_service_factory = advice_service_factory
+        self._test_service_factory = test_service_factory
+        self._persona_provider_factory = persona_provider_factory
+        self._client: Any | None = None
+        self._advice_service: AdviceService | None = None
+        self._test_service: TestProcessingService | None = None
+        self._persona_provider: UserPersonaProvider | None = None
+        self._warm_up_done = False
+        self._warm_caches: dict[str, bool] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self._warm_up_done
+
+    def readiness(self) -> dict[str, Any]:
+        if not self._warm_up_done:
+            status = "warming"
+        elif all(self._warm_caches.values()):
+            status = "ready"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "caches": dict(self._warm_caches),
+            "supabase_pool": get_supabase_pool_stats(),
+            "embedding_batches": get_embedding_batcher().stats,
+            "openai_single_flight": get_single_flight().stats,
+        }
+
+    @property
+    def supabase_client(self) -> Any:
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def advice_service(self) -> AdviceService:
+        if self._advice_service is None:
+            logger.info("Building process-wide advice pipeline.")
+            self._advice_service = self._advice_service_factory(
+                self.supabase_client)
+        return self._advice_service
+
+    @property
+    def test_service(self) -> TestProcessingService:
+        if self._test_service is None:
+            logger.info("Building process-wide test processing service.")
+            self._test_service = self._test_service_factory(
+                self.supabase_client)
+        return self._test_service
+
+    @property
+    def persona_provider(self) -> UserPersonaProvider:
+        if self._persona_provider is None:
+            self._persona_provider = self._persona_provider_factory(
+                self.supabase_client)
+        return self._persona_provider
+
+    async def warm_up(self) -> None:
+        """
+        Builds all services and fills their caches (definition embeddings,
+        advice catalog, trait embeddings, career model) so the first user
+        request does not pay for it. Failures are logged and reported as cold
+        caches; they never prevent the application from starting.
+        """
+        self._warm_up_done = False
+        caches: dict[str, bool] = {}
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        caches.update(await self._run_warm_up_step(
+            "advice", lambda: self.advice_service.warm_up()))
+        caches.update(await self._run_warm_up_step(
+            "tests", lambda: self.test_service.warm_up()))
+        caches.update(await self._run_warm_up_step(
+            "career_model", _warm_up_career_model))
+        self._warm_caches = caches
+        self._warm_up_done = True
+        logger.info(
+            "Warm-up finished in %.2fs: %s",
+            loop.time() - started,
+            ", ".join(f"{name}={'warm' if warm else 'cold'}" for name,
+                      warm in caches.items()),
+        )
+
+    @staticmethod
+    async def _run_warm_up_step(
+        name: str, step: Callable[[], Awaitable[Mapping[str, bool]]]
+    ) -> Mapping[str, bool]:
+        try:
+            return await step()
+        except Exception as exc:
+            logger.warning("Warm-up step '%s' failed: %s", name, exc)
+            return {name: False}
+
+    async def rebuild(self) -> "ServiceRegistry":
+        """
+        Builds and warms up a new registry with the same factories, e.g. after
+        a catalog import or a new definition embeddings artifact. The caller
+        swaps it in and then `release()`s this one; requests still running
+        keep using the old services.
+
+        Cached settings (`_SETTINGS_GETTERS`) are read again, but only from
+        this process's environment, which a signal cannot change: edited
+        environment variables still need a restart. The process-wide OpenAI
+        and Supabase pools, the embedding cache and the batcher are shared by
+        both registries and stay open with their settings.
+        """
+        logger.info("Rebuilding service registry.")
+        for getter in _SETTINGS_GETTERS:
+            getter.cache_clear()
+        fresh = ServiceRegistry(
+            client_factory=self._client_factory,
+            advice_service_factory=self._advice_service_factory,
+            test_service_factory=self._test_service_factory,
+            persona_provider_factory=self._persona_provider_factory,
+        )
+        await fresh.warm_up()
+        return fresh
+
+    async def release(self) -> None:
+        """
+        Drops the services (and their caches) and stops their background
+        tasks (index refreshes, catalog reloads and patches) without closing
+        the shared clients.
+        """
+        advice_service = self._advice_service
+        self._warm_up_done = False
+        self._warm_caches = {}
+        self._advice_service = None
+        self._test_service = None
+        self._persona_provider = None
+        self._client = None
+        if advice_service is not None:
+            try:
+                await advice_service.aclose()
+            except Exception as exc:  # pragma: no cover - shutdown guard
+                logger.warning("Failed to stop advice service tasks: %s", exc)
+
+    async def aclose(self) -> None:
+        """Releases the services and closes the process-wide clients (shutdown)."""
+        await self.release()
+        # Batches in flight still use the OpenAI client closed below.
+        await get_embedding_batcher().aclose()
+        cache = get_embedding_cache()
+        if cache is not None:
+            try:
+                await cache.aflush()
+            except Exception as exc:  # pragma: no cover - shutdown guard
+                logger.warning("Failed to flush embedding cache: %s", exc)
+        try:
+            await close_supabase_async_client()
+        except Exception as exc:  # pragma: no cover - shutdown guard
+            logger.warning("Failed to close Supabase client: %s", exc)
+        await close_openai_http_client()
+
+
+async def _warm_up_career_model() -> Mapping[str, bool]:
+    from code.career_adviser import warm_up
+
+    await asyncio.to_thread(warm_up)
+    return {"career_model": True}
+
+
+async def rebuild_service_registry(app: Any) -> None:
+    """
+    Replaces `app.state.services` with a freshly built and warmed-up registry.
+    The old one is released only after the swap, so requests keep being served
+    (by the old services) while the new ones warm up.
+    """
+    previous: ServiceRegistry = app.state.services
+    try:
+        fresh = await previous.rebuild()
+    except Exception as exc:  # pragma: no cover - warm-up guard
+        logger.warning("Service registry rebuild failed, keeping the old one: %s", exc)
+        return
+    app.state.services = fresh
+    await previous.release()
+    logger.info("Service registry rebuilt.")
+
+
+def get_service_registry(request: Request) -> ServiceRegistry:
+    return request.app.state.services
+
+
+def get_advice_service(request: Request) -> AdviceService:
+    return get_service_registry(request).advice_service
+
+
+def get_test_service(request: Request) -> TestProcessingService:
+    return get_service_registry(request).test_service
+
+
+def get_persona_provider(request: Request) -> UserPersonaProvider:
+    return get_service_registry(request).persona_provider
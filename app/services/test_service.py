@@ -1,18 +1,19 @@
 from __future__ import annotations
 
 import asyncio
-import math
 import re
 from collections import defaultdict
 from typing import Any, Literal, Mapping, Sequence, cast
 import os
 
+from app.integrations.embeddings import EmbeddingProvider, create_embedding_provider
 from app.integrations.openai import (
     create_async_openai_client,
+    create_chat_completion,
     get_openai_settings,
     get_reasoning_effort,
 )
-from app.integrations.supabase import create_supabase_async_client
+from app.integrations.supabase import get_supabase_async_client
 from app.models.tests import (
     PSYCHO_TRAITS,
     VOCATION_TRAITS,
@@ -27,6 +28,8 @@ from app.repositories.user_persona_repository import (
     SupabaseUserPersonaRepository,
     UserPersonaProvider,
 )
+from app.services.definition_embeddings import embed_definitions
+from app.services.vector_math import VectorMatrix
 
 # --- Question configuration ---
 
@@ -187,12 +190,16 @@ class OpenAnswerTraitClassifier:
         settings = get_openai_settings()
         self._client = create_async_openai_client(settings)
         self._model = model or settings.embeddings_model
-        self._threshold = threshold
+        self._embeddings: EmbeddingProvider = create_embedding_provider(
+            self._client,
+            self._model,
+            dimensions=settings.embeddings_dimensions,
+        )
+        self._threshold = threshold * self._embeddings.similarity_scale
         self._max_boost = max_boost
-        self._trait_embeddings: list[tuple[str, Sequence[float]]] | None = None
+        self._trait_embeddings: VectorMatrix[str] | None = None
         self._prepare_lock = asyncio.Lock()
-        self._negative_trait_embeddings: list[tuple[str,
-                                                    Sequence[float]]] | None = None
+        self._negative_trait_embeddings: VectorMatrix[str] | None = None
         self._allow_negative = allow_negative
         self._negative_weight = negative_weight
 
@@ -210,29 +217,50 @@ class OpenAnswerTraitClassifier:
                 return
             items = list(self._trait_descriptions.items())
             texts = [desc for _, desc in items]
-            response = await self._client.embeddings.create(
-                model=self._model,
-                input=texts,
-            )
-            embeddings = [tuple(item.embedding) for item in response.data]
-            self._trait_embeddings = list(
-                zip(self._trait_descriptions.keys(), embeddings)
+            embeddings = await embed_definitions(self._embeddings, texts)
+            self._trait_embeddings = VectorMatrix(
+                [trait for trait, _ in items], embeddings
             )
             if self._allow_negative:
                 negative_texts = [
                     self._build_negative_description(trait, desc) for trait, desc in items
                 ]
-                negative_response = await self._client.embeddings.create(
-                    model=self._model,
-                    input=negative_texts,
-                )
-                negative_embeddings = [
-                    tuple(item.embedding) for item in negative_response.data
-                ]
-                self._negative_trait_embeddings = list(
-                    zip(self._trait_descriptions.keys(), negative_embeddings)
+                negative_embeddings = await embed_definitions(
+                    self._embeddings, negative_texts)
+                self._negative_trait_embeddings = VectorMatrix(
+                    [trait for trait, _ in items], negative_embeddings
                 )
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        await self._ensure_embeddings()
+        return {"trait_embeddings": bool(self._trait_embeddings)}
+
+    @property
+    def embedding_provider(self) -> EmbeddingProvider:
+        return self._embeddings
+
+    def definition_texts(self) -> Sequence[str]:
+        """Trait descriptions and, when enabled, their negative variants."""
+        texts = list(self._trait_descriptions.values())
+        if self._allow_negative:
+            texts.extend(
+                self._build_negative_description(trait, desc)
+                for trait, desc in self._trait_descriptions.items()
+            )
+        return texts
+
+    def _score_answers(
+        self, answer_embeddings: Sequence[Sequence[float]]
+    ) -> tuple[list[list[float]], list[list[float]] | None]:
+        """Cosine similarity of every answer against every (negative) trait."""
+        assert self._trait_embeddings is not None
+        positive = self._trait_embeddings.score_many(answer_embeddings).tolist()
+        negative = None
+        if self._allow_negative and self._negative_trait_embeddings:
+            negative = self._negative_trait_embeddings.score_many(
+                answer_embeddings).tolist()
+        return positive, negative
+
     async def score_open_answers(
         self,
         answers: Sequence[str],
@@ -245,15 +273,12 @@ class OpenAnswerTraitClassifier:
         if not self._trait_embeddings:
             return {}
         embedding_inputs = _build_embedding_inputs(answers, question_prompts)
-        response = await self._client.embeddings.create(
-            model=self._model,
-            input=embedding_inputs,
-        )
+        answer_embeddings = await self._embeddings.embed(embedding_inputs)
+        positive_scores, negative_scores = self._score_answers(answer_embeddings)
         contributions: dict[str, list[float]] = defaultdict(list)
-        for answer_embedding in response.data:
-            for idx, (trait, trait_embedding) in enumerate(self._trait_embeddings):
-                score = _cosine_similarity(
-                    answer_embedding.embedding, trait_embedding)
+        for answer_idx in range(len(answer_embeddings)):
+            for idx, trait in enumerate(self._trait_embeddings.keys):
+                score = positive_scores[answer_idx][idx]
                 if score >= self._threshold:
                     # Skalowalny boost - im bardziej ponad threshold, tym większy wkład
                     excess = score - self._threshold
@@ -261,11 +286,8 @@ class OpenAnswerTraitClassifier:
                         (excess / (1.0 - self._threshold)) * 3.0  # Do 4x więcej
                     contributions[trait].append(
                         score * self._max_boost * boost_factor)
-                if self._allow_negative and self._negative_trait_embeddings:
-                    negative_embedding = self._negative_trait_embeddings[idx][1]
-                    negative_score = _cosine_similarity(
-                        answer_embedding.embedding, negative_embedding
-                    )
+                if negative_scores is not None:
+                    negative_score = negative_scores[answer_idx][idx]
                     if negative_score >= self._threshold:
                         negative_excess = negative_score - self._threshold
                         negative_boost = 1.0 + (
@@ -301,13 +323,11 @@ class OpenAnswerTraitClassifier:
             return []
 
         embedding_inputs = _build_embedding_inputs(answers, question_prompts)
-        response = await self._client.embeddings.create(
-            model=self._model,
-            input=embedding_inputs,
-        )
+        answer_embeddings = await self._embeddings.embed(embedding_inputs)
+        positive_scores, negative_scores = self._score_answers(answer_embeddings)
 
         details = []
-        for answer_idx, answer_embedding in enumerate(response.data):
+        for answer_idx in range(len(answer_embeddings)):
             answer_text = answers[answer_idx]
             answer_detail = {
                 "answer_number": answer_idx + 1,
@@ -317,9 +337,8 @@ class OpenAnswerTraitClassifier:
 
             trait_contributions: dict[str, list[dict]] = defaultdict(list)
 
-            for idx, (trait, trait_embedding) in enumerate(self._trait_embeddings):
-                score = _cosine_similarity(
-                    answer_embedding.embedding, trait_embedding)
+            for idx, trait in enumerate(self._trait_embeddings.keys):
+                score = positive_scores[answer_idx][idx]
                 if score >= self._threshold:
                     excess = score - self._threshold
                     boost_factor = 1.0 + \
@@ -333,11 +352,8 @@ class OpenAnswerTraitClassifier:
                         "match_kind": "positive",
                     })
 
-                if self._allow_negative and self._negative_trait_embeddings:
-                    neg_embedding = self._negative_trait_embeddings[idx][1]
-                    neg_score = _cosine_similarity(
-                        answer_embedding.embedding, neg_embedding
-                    )
+                if negative_scores is not None:
+                    neg_score = negative_scores[answer_idx][idx]
                     if neg_score >= self._threshold:
                         neg_excess = neg_score - self._threshold
                         neg_boost = 1.0 + (
@@ -444,7 +460,7 @@ class PersonaNarrativeGenerator:
             # Dodaj reasoning_effort tylko jeśli jest ustawione (dla modeli z reasoning)
             if self._reasoning_effort is not None:
                 create_kwargs["reasoning_effort"] = self._reasoning_effort
-            response = await self._client.chat.completions.create(**create_kwargs)
+            response = await create_chat_completion(self._client, **create_kwargs)
             persona_text = response.choices[0].message.content or ""
             persona_text = persona_text.strip()
             persona_text = _enforce_sentence_count(persona_text, 10)
@@ -495,7 +511,7 @@ class PersonaNarrativeGenerator:
             # Dodaj reasoning_effort tylko jeśli jest ustawione (dla modeli z reasoning)
             if self._reasoning_effort is not None:
                 create_kwargs["reasoning_effort"] = self._reasoning_effort
-            response = await self._client.chat.completions.create(**create_kwargs)
+            response = await create_chat_completion(self._client, **create_kwargs)
             persona_text = response.choices[0].message.content or ""
             persona_text = persona_text.strip()
             persona_text = _enforce_sentence_count(persona_text, 6)
@@ -533,6 +549,16 @@ class TestProcessingService:
         self._persona_generator = persona_generator
         self._persona_repository = persona_repository
 
+    async def warm_up(self) -> Mapping[str, bool]:
+        status: dict[str, bool] = {}
+        for test_name, classifier in (
+            ("psychology", self._psych_open_classifier),
+            ("vocation", self._vocation_open_classifier),
+        ):
+            for name, warm in (await classifier.warm_up()).items():
+                status[f"{test_name}_{name}"] = warm
+        return status
+
     async def submit_psychology_test(
         self, payload: PsychologyTestRequest
     ) -> TestSubmissionResponse:
@@ -820,15 +846,6 @@ def _build_embedding_inputs(
     return inputs
 
 
-def _cosine_similarity(left: Sequence[float], right: Sequence[float]) -> float:
-    dot = sum(a * b for a, b in zip(left, right))
-    left_norm = math.sqrt(sum(a * a for a in left))
-    right_norm = math.sqrt(sum(b * b for b in right))
-    if left_norm == 0 or right_norm == 0:
-        return 0.0
-    return dot / (left_norm * right_norm)
-
-
 def _top_trait_summary(traits: Mapping[str, float], top: int = 5) -> str:
     if not traits:
         return "brak danych"
@@ -870,10 +887,10 @@ def _fallback_persona_text(
     return " ".join(sentences)
 
 
-def build_test_processing_service() -> TestProcessingService:
-    client = create_supabase_async_client()
-    repository = TestRepository(client)
-    persona_provider = _build_persona_provider(client)
+def build_open_answer_trait_classifiers() -> tuple[
+    OpenAnswerTraitClassifier, OpenAnswerTraitClassifier
+]:
+    """Psychological and vocational open-answer classifiers."""
     psych_classifier = OpenAnswerTraitClassifier(
         trait_descriptions=PSYCHO_TRAIT_DESCRIPTIONS,
         threshold=0.46,
@@ -886,6 +903,14 @@ def build_test_processing_service() -> TestProcessingService:
         max_boost=0.12,
         model=os.getenv("OPENAI_CATEGORY_MODEL"),
     )
+    return psych_classifier, vocation_classifier
+
+
+def build_test_processing_service(client=None) -> TestProcessingService:
+    client = client or get_supabase_async_client()
+    repository = TestRepository(client)
+    persona_provider = _build_persona_provider(client)
+    psych_classifier, vocation_classifier = build_open_answer_trait_classifiers()
     persona_generator = PersonaNarrativeGenerator(
         persona_repository=persona_provider,
         model=os.getenv("OPENAI_RESPONSE_MODEL"),
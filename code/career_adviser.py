@@ -1,4 +1,4 @@
-from code.neural_net_lite import recommendations_tflite
+from code.neural_net_lite import recommendations_tflite, warm_up
 import numpy as np
 
 
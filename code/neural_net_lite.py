@@ -1,4 +1,5 @@
 import numpy as np
+from functools import lru_cache
 from pathlib import Path
 
 try:
@@ -47,10 +48,28 @@ def _get_data_path(filename: str) -> str:
     return str(data_path)
 
 
-def recommendations_tflite(personality_vector, wpep_mode, job_count):
-    model_path = _get_model_path()
-    interpreter = Interpreter(model_path=model_path)
+@lru_cache(maxsize=1)
+def _get_interpreter():
+    """Ładuje model tflite raz na proces."""
+    interpreter = Interpreter(model_path=_get_model_path())
     interpreter.allocate_tensors()
+    return interpreter
+
+
+@lru_cache(maxsize=None)
+def _load_income(filename: str):
+    return np.loadtxt(_get_data_path(filename), delimiter=',')
+
+
+def warm_up():
+    """Wczytuje model i dane WPEP przed pierwszym zapytaniem."""
+    _get_interpreter()
+    _load_income("wpep.csv")
+    _load_income("wpep5years.csv")
+
+
+def recommendations_tflite(personality_vector, wpep_mode, job_count):
+    interpreter = _get_interpreter()
     input_details = interpreter.get_input_details()
     output_details = interpreter.get_output_details()
 
@@ -67,13 +86,12 @@ def recommendations_tflite(personality_vector, wpep_mode, job_count):
         nincome = np.ones(len(top_indices))
     else:
         if wpep_mode == 1:
-            income = np.loadtxt(_get_data_path("wpep.csv"), delimiter=',')
+            income = _load_income("wpep.csv")
         elif wpep_mode == 2:
-            income = np.loadtxt(_get_data_path(
-                "wpep5years.csv"), delimiter=',')
+            income = _load_income("wpep5years.csv")
         else:
             # Fallback dla nieoczekiwanych wartości wpep_mode
-            income = np.loadtxt(_get_data_path("wpep.csv"), delimiter=',')
+            income = _load_income("wpep.csv")
         tincome = [income[i] for i in top_indices]
         nincome = normalise(np.array(tincome))
     out = outscores-(1-nincome)
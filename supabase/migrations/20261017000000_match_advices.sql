@@ -0,0 +1,90 @@
+-- Server-side top-k advice retrieval for ADVICE_RETRIEVAL_MODE=database.
+--
+-- The embedding pipeline calls this function over PostgREST RPC
+-- (`EmbeddingUpdatableAdviceRepository.match_advices`), so only `match_count`
+-- rows ever leave the database, whatever the catalog size.
+
+create extension if not exists vector;
+
+-- The original schema stored embeddings as `real[]`; `<=>` and `vector_dims`
+-- need a pgvector column. The cast keeps existing values (and NULLs).
+alter table public.advices add column if not exists embedding vector;
+
+do $$
+begin
+    if exists (
+        select 1
+        from information_schema.columns
+        where table_schema = 'public'
+            and table_name = 'advices'
+            and column_name = 'embedding'
+            and udt_name <> 'vector'
+    ) then
+        alter table public.advices
+            alter column embedding type vector using embedding::vector;
+    end if;
+end;
+$$;
+
+create or replace function public.match_advices(
+    query_embedding vector,
+    match_count integer default 6,
+    filter_kind text default null,
+    min_similarity double precision default null
+)
+returns table (
+    id bigint,
+    name text,
+    kind text,
+    description text,
+    llm_description text,
+    link text,
+    image_url text,
+    author text,
+    categories text[],
+    similarity double precision
+)
+language sql
+stable
+as $$
+    select
+        a.id,
+        a.name,
+        a.kind::text,
+        a.description,
+        a.llm_description,
+        a.link,
+        a.image_url,
+        a.author,
+        coalesce(
+            (
+                select array_agg(c.name order by c.name)
+                from public.advice_category_links l
+                join public.advice_categories c on c.id = l.category_id
+                where l.advice_id = a.id
+            ),
+            '{}'
+        ) as categories,
+        1 - (a.embedding <=> query_embedding) as similarity
+    from public.advices a
+    where a.embedding is not null
+        -- Vectors of another size (other model or dimensions) cannot be compared.
+        and vector_dims(a.embedding) = vector_dims(query_embedding)
+        and (filter_kind is null or a.kind::text = filter_kind)
+        and (
+            min_similarity is null
+            or 1 - (a.embedding <=> query_embedding) >= min_similarity
+        )
+    order by a.embedding <=> query_embedding
+    limit greatest(match_count, 0);
+$$;
+
+grant execute on function public.match_advices(vector, integer, text, double precision)
+    to anon, authenticated, service_role;
+
+-- For large catalogs add an approximate index. HNSW needs a fixed-size column,
+-- so first pin the dimension used by OPENAI_EMBEDDINGS_DIMENSIONS, e.g.:
+--
+--   alter table public.advices alter column embedding type vector(1536);
+--   create index if not exists advices_embedding_hnsw
+--       on public.advices using hnsw (embedding vector_cosine_ops);
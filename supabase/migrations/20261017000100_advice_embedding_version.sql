@@ -0,0 +1,9 @@
+-- Version tag of the stored advice embedding: the model it was computed with
+-- (`model@dimensions` when OPENAI_EMBEDDINGS_DIMENSIONS is set) and the SHA-256
+-- of the embedded text ("Rodzaj: {kind}\n{description}", whitespace-normalized).
+-- Rows whose tag does not match the current model and text are stale and get
+-- re-embedded by the backfill or the background refresh.
+
+alter table public.advices
+    add column if not exists embedding_model text,
+    add column if not exists embedding_text_hash text;
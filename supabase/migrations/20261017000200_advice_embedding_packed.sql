@@ -0,0 +1,13 @@
+-- Compact binary copy of the advice embedding for ADVICE_EMBEDDING_STORAGE=float32
+-- or float16: "<dtype code>:<base64>", where the code is `f4` (little-endian
+-- float32) or `f2` (float16) and the payload is the raw vector bytes. The
+-- catalog snapshot reads this column instead of the pgvector text, which is
+-- several times larger and has to be parsed float by float.
+--
+-- The `embedding` column stays the source for `match_advices`; the application
+-- writes both. Fill the new column for existing rows with:
+--
+--   python -m app.services.embedding_storage_migration
+
+alter table public.advices
+    add column if not exists embedding_packed text;
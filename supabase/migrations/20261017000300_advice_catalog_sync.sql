@@ -0,0 +1,99 @@
+-- Change tracking for ADVICE_CATALOG_SYNC=delta.
+--
+-- The application keeps the advice catalog in memory and, instead of reloading
+-- it, asks for rows with `updated_at` past its last sync and for tombstones of
+-- deleted advices (`SupabaseAdviceRepository.fetch_changes`).
+
+alter table public.advices
+    add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists advices_updated_at_idx
+    on public.advices (updated_at);
+
+create or replace function public.touch_advice_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists advices_touch_updated_at on public.advices;
+create trigger advices_touch_updated_at
+    before update on public.advices
+    for each row execute function public.touch_advice_updated_at();
+
+-- Category links are part of the cached advice, so linking or unlinking a
+-- category marks the advice as changed.
+create or replace function public.touch_advice_from_category_link()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        update public.advices set updated_at = now() where id = old.advice_id;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        update public.advices set updated_at = now() where id = new.advice_id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists advice_category_links_touch_advice
+    on public.advice_category_links;
+create trigger advice_category_links_touch_advice
+    after insert or update or delete on public.advice_category_links
+    for each row execute function public.touch_advice_from_category_link();
+
+-- Renaming a category changes every advice that carries it.
+create or replace function public.touch_advices_of_category()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.advices a
+    set updated_at = now()
+    from public.advice_category_links l
+    where l.category_id = new.id and l.advice_id = a.id;
+    return null;
+end;
+$$;
+
+drop trigger if exists advice_categories_touch_advices on public.advice_categories;
+create trigger advice_categories_touch_advices
+    after update of name on public.advice_categories
+    for each row execute function public.touch_advices_of_category();
+
+-- Deleted advices leave a tombstone so running processes can drop them.
+create table if not exists public.advice_tombstones (
+    advice_id bigint primary key,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists advice_tombstones_deleted_at_idx
+    on public.advice_tombstones (deleted_at);
+
+create or replace function public.record_advice_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.advice_tombstones (advice_id, deleted_at)
+    values (old.id, now())
+    on conflict (advice_id) do update set deleted_at = excluded.deleted_at;
+    return old;
+end;
+$$;
+
+drop trigger if exists advices_record_tombstone on public.advices;
+create trigger advices_record_tombstone
+    after delete on public.advices
+    for each row execute function public.record_advice_tombstone();
+
+-- Processes sync every ADVICE_CATALOG_TTL_SECONDS and start with a full load,
+-- so old tombstones can be pruned, e.g.:
+--
+--   delete from public.advice_tombstones where deleted_at < now() - interval '30 days';
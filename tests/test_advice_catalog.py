@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+
+from app.models.advice import Advice, AdviceKind
+from app.repositories.advice_catalog import (
+    AdviceCatalogIndex,
+    AdviceCatalogSnapshot,
+    AdviceCatalogUpdate,
+)
+
+_KINDS = list(AdviceKind)
+_CATEGORIES = ["Stres", "stres", "Sen", "Praca", "Relacje", "Ruch", "Uważność"]
+
+
+def _advice(rng: random.Random, advice_id: int) -> Advice:
+    return Advice(
+        name=f"Porada {advice_id}",
+        kind=rng.choice(_KINDS),
+        description=f"opis {advice_id}",
+        categories=tuple(rng.sample(_CATEGORIES, rng.randint(0, 3))),
+        id=advice_id,
+    )
+
+
+def _state(index: AdviceCatalogIndex) -> dict:
+    return {
+        "advices": sorted(advice.id for advice in index.advices),
+        "kinds": {kind: [a.id for a in index.by_kind(kind)] for kind in _KINDS},
+        "categories": {
+            name: sorted(a.id for a in index.with_any_category([name], casefold=True))
+            for name in _CATEGORIES
+        },
+        "frequencies": dict(index.category_frequencies),
+    }
+
+
+def test_patched_index_matches_a_rebuilt_one():
+    rng = random.Random(3)
+    catalog = {advice_id: _advice(rng, advice_id) for advice_id in range(300)}
+    index = AdviceCatalogIndex(catalog.values())
+    next_id = 300
+    for _ in range(200):
+        removed = rng.sample(sorted(catalog), rng.randint(0, 3))
+        replaced = rng.sample(sorted(set(catalog) - set(removed)), rng.randint(0, 3))
+        previous = [catalog.pop(advice_id) for advice_id in removed]
+        previous += [catalog[advice_id] for advice_id in replaced]
+        current = [_advice(rng, advice_id) for advice_id in replaced]
+        for _ in range(rng.randint(0, 3)):
+            current.append(_advice(rng, next_id))
+            next_id += 1
+        catalog.update((advice.id, advice) for advice in current)
+
+        index = index.with_changes(
+            AdviceCatalogUpdate(previous=tuple(previous), current=tuple(current)))
+
+        assert len(index) == len(catalog)
+    assert _state(index) == _state(AdviceCatalogIndex(catalog.values()))
+    assert len(index._advices._layers) <= 2 * math.log2(len(catalog)) + 1
+
+
+def test_patch_leaves_the_previous_index_untouched():
+    rng = random.Random(5)
+    advices = [_advice(rng, advice_id) for advice_id in range(50)]
+    index = AdviceCatalogIndex(advices)
+    before = _state(index)
+    replacement = _advice(rng, 7)
+    patched = index.with_changes(AdviceCatalogUpdate(
+        previous=(advices[3], advices[7]), current=(replacement,)))
+
+    assert _state(index) == before
+    assert patched.get(3) is None and patched.get(7) is replacement
+    assert index.get(7) is advices[7]
+
+
+def test_aclose_cancels_the_background_refresh():
+    async def scenario() -> None:
+        now = [0.0]
+        started = asyncio.Event()
+        loads = 0
+
+        async def load() -> list[Advice]:
+            nonlocal loads
+            loads += 1
+            if loads > 1:
+                started.set()
+                await asyncio.sleep(3600)
+            return [_advice(random.Random(loads), 1)]
+
+        snapshot = AdviceCatalogSnapshot(load, ttl_seconds=10.0, clock=lambda: now[0])
+        await snapshot.get()
+        now[0] = 20.0
+        await snapshot.get()  # stale: served while a refresh starts
+        await started.wait()
+        refresh = snapshot._refresh_task
+
+        await snapshot.aclose()
+
+        assert refresh is not None and refresh.cancelled()
+        await snapshot.get()
+        assert snapshot._refresh_task is refresh
+        assert loads == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.models.advice import Advice, AdviceKind
+from app.services import advice_index
+from app.services.advice_index import AdviceIndexSettings, AdviceVectorIndex
+
+
+def _advice(advice_id: int, kind: AdviceKind = AdviceKind.BOOK) -> Advice:
+    return Advice(name=f"Porada {advice_id}", kind=kind,
+                  description=f"opis {advice_id}", id=advice_id)
+
+
+def _catalog(size: int, dimensions: int = 8) -> tuple[list[Advice], np.ndarray]:
+    rng = np.random.default_rng(7)
+    return [_advice(advice_id) for advice_id in range(size)], rng.normal(
+        size=(size, dimensions))
+
+
+def test_int8_delta_writes_rows_into_the_rescore_file(tmp_path, monkeypatch):
+    path = tmp_path / "rescore.npy"
+    settings = AdviceIndexSettings(quantization="int8", rescore_path=path)
+    advices, vectors = _catalog(100)
+    index = AdviceVectorIndex(advices, vectors, settings=settings)
+    inode = path.stat().st_ino
+
+    def rewrite(matrix: np.ndarray, target: Path) -> np.ndarray:
+        raise AssertionError(f"{target} rewritten for a delta")
+
+    monkeypatch.setattr(advice_index, "_memory_map", rewrite)
+    changed = np.linspace(-1.0, 1.0, 8)
+    index.apply_changes(
+        [(_advice(3, AdviceKind.MOVIE), changed), (_advice(500), vectors[0])],
+        removed_ids=[3, 10],
+    )
+
+    assert path.stat().st_ino == inode
+    on_disk = np.load(path)
+    position = index._positions[3]
+    np.testing.assert_allclose(
+        on_disk[position], changed / np.linalg.norm(changed), rtol=1e-6)
+    assert len(index) == 100
+    assert 10 not in index and 500 in index
+    best, score = index.top_k(changed, 1, kind=AdviceKind.MOVIE)[0]
+    assert best.id == 3 and score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_delta_reuses_freed_rows_and_grows_when_full():
+    settings = AdviceIndexSettings()
+    advices, vectors = _catalog(10)
+    index = AdviceVectorIndex(advices, vectors, settings=settings)
+    capacity = len(index._kinds)
+
+    index.apply_changes([], removed_ids=[4])
+    index.apply_changes([(_advice(40), vectors[4])])
+    assert index._positions[40] == 4
+    assert len(index._kinds) == capacity
+
+    extra = capacity - len(index) + 5
+    rng = np.random.default_rng(1)
+    index.apply_changes([
+        (_advice(1000 + offset), rng.normal(size=8)) for offset in range(extra)
+    ])
+    assert len(index) == 10 + extra
+    assert len(index._kinds) > capacity
+    assert [advice.id for advice, _ in index.top_k(vectors[7], 1)] == [7]
+
+
+def test_delta_keeps_ivf_in_step():
+    settings = AdviceIndexSettings(ann="ivf", ann_min_size=50, ivf_nlist=4,
+                                   ivf_nprobe=4, ann_snapshot_path=None)
+    advices, vectors = _catalog(200)
+    index = AdviceVectorIndex(advices, vectors, settings=settings)
+    assert index.ann is not None
+
+    index.apply_changes([(_advice(900), -vectors[5])], removed_ids=[5, 6])
+
+    assert index.ann.keys() == set(index._positions)
+    assert [advice.id for advice, _ in index.top_k(-vectors[5], 1)] == [900]
+    assert all(advice.id != 6 for advice, _ in index.top_k(vectors[6], 200))
+
+
+def test_delta_on_an_empty_index():
+    index = AdviceVectorIndex([], [], settings=AdviceIndexSettings())
+    index.apply_changes([(_advice(1), [1.0, 0.0, 0.0])])
+    assert index.dimensions == 3
+    assert [advice.id for advice, _ in index.top_k([1.0, 0.0, 0.0], 3)] == [1]
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.models.advice import Advice, AdviceKind
+from app.repositories.advice_repository import InMemoryAdviceRepository
+
+
+def _advice(advice_id: int, kind: AdviceKind, embedding: list[float] | None) -> Advice:
+    return Advice(name=f"Porada {advice_id}", kind=kind,
+                  description=f"opis {advice_id}", embedding=embedding, id=advice_id)
+
+
+@pytest.fixture
+def repository() -> InMemoryAdviceRepository:
+    return InMemoryAdviceRepository([
+        _advice(1, AdviceKind.BOOK, [1.0, 0.0, 0.0]),
+        _advice(2, AdviceKind.BOOK, [0.8, 0.6, 0.0]),
+        _advice(3, AdviceKind.MOVIE, [0.9, 0.1, 0.0]),
+        _advice(4, AdviceKind.BOOK, [0.0, 1.0, 0.0]),
+        _advice(5, AdviceKind.BOOK, [0.6, 0.0, 0.8]),
+        _advice(6, AdviceKind.BOOK, None),
+        _advice(7, AdviceKind.BOOK, [1.0, 0.0]),
+    ])
+
+
+def _match(repository: InMemoryAdviceRepository, k: int, **kwargs) -> list[tuple[int, float]]:
+    matches = asyncio.run(repository.match_advices([2.0, 0.0, 0.0], k, **kwargs))
+    return [(advice.id, round(score, 6)) for advice, score in matches]  # type: ignore[misc]
+
+
+def test_match_advices_returns_top_k_best_first(repository):
+    assert _match(repository, 3) == [(1, 1.0), (3, 0.993884), (2, 0.8)]
+
+
+def test_match_advices_filters_by_kind(repository):
+    assert [advice_id for advice_id, _ in _match(repository, 10, kind=AdviceKind.BOOK)] == [
+        1, 2, 5, 4]
+    assert [advice_id for advice_id, _ in _match(repository, 10, kind=AdviceKind.MOVIE)] == [3]
+    assert _match(repository, 10, kind=AdviceKind.PODCAST) == []
+
+
+def test_match_advices_applies_the_threshold(repository):
+    assert _match(repository, 10, min_score=0.8) == [(1, 1.0), (3, 0.993884), (2, 0.8)]
+    assert _match(repository, 10, kind=AdviceKind.BOOK, min_score=0.7) == [(1, 1.0), (2, 0.8)]
+    assert _match(repository, 10, min_score=1.01) == []
+
+
+def test_count_matchable_skips_advices_without_embedding(repository):
+    assert asyncio.run(repository.count_matchable()) == 6
+    assert asyncio.run(repository.count_matchable(AdviceKind.BOOK)) == 5
+    assert asyncio.run(repository.count_matchable(AdviceKind.PODCAST)) == 0